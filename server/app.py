@@ -1,21 +1,31 @@
 import os
-import faiss
 import json
+import time
 from google import genai    
 
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify 
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 import uuid
+import threading
 from datetime import datetime
 from routes import create_app
+from routes.file_service import on_file_deleted
 from db_utils.db_helper import user_exists
 from db_utils.db_helper import save_tokens
 from db_utils.db_helper import get_tokens
 from db_utils.db_helper import init_db
 from routes.email_service import handle_part
+from rag_utils.context_packer import pack_context, DEFAULT_TOKEN_BUDGET
+from rag_utils.reranker import rerank_hits, parse_rerank_options
+from rag_utils import lexical_index
+from rag_utils import vector_store
+from rag_utils.chunk_store import ChunkTable
+from rag_utils import models
+from rag_utils.embedding_batcher import encode_queries
+from rag_utils import file_lock
+from rag_utils import tracing
+from rag_utils import metrics
 
 
 
@@ -30,34 +40,133 @@ class DocSearch:
         self.DATA_DIR = os.getenv("DATA_DIR")
         self.INDEX_PATH = os.getenv("INDEX_PATH")
         self.METADATA_PATH = os.getenv("METADATA_PATH")
+        # Compact binary chunk table that replaces the JSON list at METADATA_PATH
+        self.CHUNK_TABLE_PATH = os.path.splitext(self.METADATA_PATH)[0] + ".chunks"
         self.EMBED_MODEL_NAME = os.getenv("EMBED_MODEL_NAME")
         self.EMBED_DIM = 384
         self.CHUNK_SIZE = 1500
         self.CHUNK_OVERLAP = 300
+        self.CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+        # Compact the chunk table's text blob once removed chunks make up this share of it
+        self.COMPACTION_GARBAGE_RATIO = 0.3
+        # Guards self.index / self.metadata: rows must stay aligned while documents are removed
+        self.index_lock = threading.RLock()
+        # Serializes index writers across worker processes; always taken before index_lock
+        self.index_file_lock = file_lock.get_lock(self.INDEX_PATH + ".lock")
+        # (inode, mtime, size) of the index files when they were last read or written here
+        self._index_stamp = None
+        self.compaction_running = False
         self.GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME")
-        self.embedder = SentenceTransformer(self.EMBED_MODEL_NAME)
-        self.client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-        # Use langchain's RecursiveCharacterTextSplitter for chunking
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.CHUNK_SIZE,
-            chunk_overlap=self.CHUNK_OVERLAP
-        )
-        if os.path.exists(self.INDEX_PATH) and os.path.exists(self.METADATA_PATH):
-            self.index = faiss.read_index(self.INDEX_PATH)
-            with open(self.METADATA_PATH, "r") as f:
-                self.metadata = json.load(f)
-            print(f"Loaded existing metadata from {self.METADATA_PATH}")
-            print(f"Loaded existing FAISS index from {self.INDEX_PATH}")
+        # The embedder, Gemini client, splitter and FAISS index are all loaded on first use
+        self._text_splitter = None
+        self._index = None
+        self._metadata = None
+
+    @property
+    def embedder(self):
+        return models.get_embedder(self.EMBED_MODEL_NAME)
+
+    @property
+    def client(self):
+        return models.get_gemini_client()
+
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            # Use langchain's RecursiveCharacterTextSplitter for chunking
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.CHUNK_SIZE,
+                chunk_overlap=self.CHUNK_OVERLAP
+            )
+        return self._text_splitter
+
+    @property
+    def index(self):
+        if self._index is None:
+            self.load_index()
+        return self._index
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self.load_index()
+        return self._metadata
+
+    def load_index(self):
+        """Load (or create) the general FAISS index and chunk table"""
+        import faiss
+        with self.index_file_lock, self.index_lock:
+            if self._index is not None:
+                return
+            if os.path.exists(self.INDEX_PATH) and (os.path.exists(self.CHUNK_TABLE_PATH) or os.path.exists(self.METADATA_PATH)):
+                self._metadata = self.load_metadata()
+                self._index = faiss.read_index(self.INDEX_PATH)
+                self._index_stamp = self.index_files_stamp()
+                print(f"Loaded existing FAISS index from {self.INDEX_PATH}")
+            else:
+                print(f"No existing FAISS index found at {self.INDEX_PATH}, building new one")
+                self._metadata = ChunkTable()
+                self._index = faiss.IndexFlatL2(self.EMBED_DIM)
+                # Persist the newly created empty index and metadata for future use
+                self.save_index()
+                print(f"Initialized and saved new FAISS index to {self.INDEX_PATH}")
+                print(f"Initialized and saved new chunk table to {self.CHUNK_TABLE_PATH}")
+
+    def index_files_stamp(self):
+        stamp = []
+        for path in (self.INDEX_PATH, self.CHUNK_TABLE_PATH):
+            stat = os.stat(path) if os.path.exists(path) else None
+            stamp.append((stat.st_ino, stat.st_mtime_ns, stat.st_size) if stat else None)
+        return tuple(stamp)
+
+    def reload_if_changed(self):
+        """Load the index on first use, or re-read it if another worker process has written it.
+
+        Call before taking index_lock, so the lock order (file lock first) is kept.
+        """
+        if self._index is None:
+            self.load_index()
+            return
+        if self.index_files_stamp() == self._index_stamp:
+            return
+        import faiss
+        with self.index_file_lock.shared(), self.index_lock:
+            stamp = self.index_files_stamp()
+            if stamp != self._index_stamp:
+                self._metadata = ChunkTable.load(self.CHUNK_TABLE_PATH)
+                self._index = faiss.read_index(self.INDEX_PATH)
+                self._index_stamp = stamp
+                print(f"Reloaded FAISS index written by another worker ({self._index.ntotal} vectors)")
+
+    def save_index(self):
+        """Atomically write the index and chunk table; callers hold index_file_lock"""
+        import faiss
+        temp_path = self.INDEX_PATH + ".tmp"
+        faiss.write_index(self._index, temp_path)
+        os.replace(temp_path, self.INDEX_PATH)
+        self._metadata.save(self.CHUNK_TABLE_PATH)
+        self._index_stamp = self.index_files_stamp()
+
+    def warm_up(self, include_reranker=False):
+        """Load models, clients and the general index ahead of traffic; returns seconds per step"""
+        timings = models.warm_up(self.EMBED_MODEL_NAME, include_reranker)
+        start = time.perf_counter()
+        self.load_index()
+        timings["general_index"] = round(time.perf_counter() - start, 3)
+        return timings
+    
+    def load_metadata(self):
+        """Load the chunk table, converting the legacy JSON metadata list on first run"""
+        if os.path.exists(self.CHUNK_TABLE_PATH):
+            metadata = ChunkTable.load(self.CHUNK_TABLE_PATH)
+            print(f"Loaded existing chunk table from {self.CHUNK_TABLE_PATH}")
         else:
-            print(f"No existing FAISS index found at {self.INDEX_PATH}, building new one")
-            self.index = faiss.IndexFlatL2(self.EMBED_DIM)
-            self.metadata = []
-            # Persist the newly created empty index and metadata for future use
-            faiss.write_index(self.index, self.INDEX_PATH)
-            with open(self.METADATA_PATH, "w") as f:
-                json.dump(self.metadata, f)
-            print(f"Initialized and saved new FAISS index to {self.INDEX_PATH}")
-            print(f"Initialized and saved new metadata to {self.METADATA_PATH}")
+            with open(self.METADATA_PATH, "r") as f:
+                metadata = ChunkTable.from_legacy_metadata(json.load(f))
+            metadata.save(self.CHUNK_TABLE_PATH)
+            print(f"Converted metadata from {self.METADATA_PATH} to chunk table {self.CHUNK_TABLE_PATH}")
+        return metadata
         
     def get_chunks(self, doc):
         chunks = self.text_splitter.split_text(doc)
@@ -67,127 +176,190 @@ class DocSearch:
         embeddings = self.embedder.encode(chunks)
         return embeddings
 
-    def ingest_docs(self, docs):
-        for doc in docs:
-            chunks = self.get_chunks(doc)
-            embeddings = self.embed_chunks(chunks)
-            self.add_to_index(embeddings,doc,chunks)
+    def ingest_docs(self, docs, doc_ids=None):
+        """Index docs; doc_ids (e.g. upload file ids) let them be removed later with remove_document"""
+        metrics.INGESTIONS_IN_PROGRESS.inc()
+        try:
+            for i, doc in enumerate(docs):
+                chunks = self.get_chunks(doc)
+                embeddings = self.embed_chunks(chunks)
+                self.add_to_index(embeddings, doc, chunks, doc_ids[i] if doc_ids else None)
+        finally:
+            metrics.INGESTIONS_IN_PROGRESS.dec()
     
-    def add_to_index(self, embeddings, doc, chunks):
-        self.index.add(embeddings)
-        # Store metadata for each chunk
-        doc_id=str(uuid.uuid4())
-        for i, embedding in enumerate(embeddings):
-            self.metadata.append({
-                "doc_id": doc_id,
-                "chunk_id": doc_id + "_" + str(i),
-                "chunk_text": chunks[i]
-            })
-        # Save updated metadata
-        with open(self.METADATA_PATH, "w") as f:
-            json.dump(self.metadata, f)
-        # Save updated index
-        faiss.write_index(self.index, self.INDEX_PATH)
+    def add_to_index(self, embeddings, doc, chunks, doc_id=None):
+        with self.index_file_lock:
+            # Apply the change on top of whatever other workers have written
+            self.reload_if_changed()
+            with self.index_lock:
+                self.index.add(embeddings)
+                # Store metadata for each chunk
+                doc_id = doc_id or str(uuid.uuid4())
+                self.metadata.append(doc_id, chunks)
+                # Save updated index and metadata
+                self.save_index()
+    
+    def remove_document(self, doc_id):
+        """Remove a document's chunks from the general index by id; returns the number removed"""
+        with self.index_file_lock:
+            self.reload_if_changed()
+            with self.index_lock:
+                rows = self.metadata.rows_for_doc(doc_id)
+                if not len(rows):
+                    return 0
+                # remove_ids shifts later vectors up, exactly like remove_rows does for the chunk table
+                self.index.remove_ids(rows.astype("int64"))
+                self.metadata.remove_rows(rows)
+                self.save_index()
+            print(f"Removed {len(rows)} chunks of document {doc_id} from the general index")
+            if self.metadata.garbage_bytes > self.COMPACTION_GARBAGE_RATIO * len(self.metadata.text) and not self.compaction_running:
+                self.compaction_running = True
+                threading.Thread(target=self.compact_metadata, daemon=True).start()
+            return len(rows)
+    
+    def compact_metadata(self):
+        """Drop removed chunks' text from the chunk table (runs in a background thread)"""
+        try:
+            with self.index_file_lock:
+                self.reload_if_changed()
+                with self.index_lock:
+                    reclaimed = self.metadata.compact()
+                    self.metadata.save(self.CHUNK_TABLE_PATH)
+                    self._index_stamp = self.index_files_stamp()
+            print(f"Compacted chunk table, reclaimed {reclaimed} bytes")
+        except Exception as e:
+            print(f"Error compacting chunk table: {str(e)}")
+        finally:
+            self.compaction_running = False
     
     def search(self, query, k=5):
-        query_embedding = self.embedder.encode([query])
-        distances, indices = self.index.search(query_embedding, k)
+        with tracing.span("embed"):
+            query_embedding = encode_queries([query], self.EMBED_MODEL_NAME)
+        self.reload_if_changed()
+        with self.index_lock, tracing.span("faiss_search", index="general", rows=self.index.ntotal, k=k):
+            distances, indices = self.index.search(query_embedding, k)
         return distances, indices
     
-    def get_context(self, query, k=5, selected_folders=None, user_id=None):
-        print(f"DEBUG: get_context called with query='{query}', selected_folders={selected_folders}, user_id={user_id}")
+    def get_context(self, query, k=5, selected_folders=None, user_id=None, max_context_tokens=None, rerank_options=None):
+        token_budget = max_context_tokens or self.CONTEXT_TOKEN_BUDGET
+        # With reranking, retrieval only proposes candidates and the cross-encoder picks the top k
+        search_k = max(k, rerank_options["candidates"]) if rerank_options else k
         if selected_folders and user_id:
             # Ensure user_id is a string
             user_id = str(user_id)
             # Search through selected folders
-            context = []
+            hits = []
             for folder_id in selected_folders:
-                print(f"DEBUG: Getting context from folder {folder_id}")
-                folder_context = self.get_folder_context(query, str(folder_id), user_id, k)
-                print(f"DEBUG: Folder {folder_id} returned {len(folder_context)} context items")
-                context.extend(folder_context)
-            print(f"DEBUG: Total context from selected folders: {len(context)} items")
-            return context[:k]  # Limit to k results
+                hits.extend(self.get_folder_hits(query, str(folder_id), user_id, search_k))
+            # Fused scores are comparable across folders
+            hits.sort(key=lambda h: h["score"], reverse=True)
+            if rerank_options:
+                hits = self.rerank(query, hits, k, rerank_options)
+            with tracing.span("context_pack", hits=len(hits)):
+                return pack_context(hits, token_budget, preserve_order=True)
         else:
             # Original behavior - search through general index
-            distances, indices = self.search(query, k)
-            context = []
-            for i in range(len(indices[0])):  # indices is a 2D array
-                if indices[0][i] < len(self.metadata):  # Check bounds
-                    context.append(self.metadata[indices[0][i]]['chunk_text'])
-            return context
-    
+            hits = []
+            with tracing.span("embed"):
+                query_embedding = encode_queries([self.enhance_query(query)], self.EMBED_MODEL_NAME)
+            self.reload_if_changed()
+            # Hold the lock so a concurrent remove_document cannot shift rows between search and lookup
+            with self.index_lock:
+                with tracing.span("faiss_search", index="general", rows=self.index.ntotal, k=search_k):
+                    distances, indices = self.index.search(query_embedding, search_k)
+                with tracing.span("metadata_load", index="general"):
+                    for distance, idx in zip(distances[0], indices[0]):
+                        if 0 <= idx < len(self.metadata):  # Check bounds
+                            entry = self.metadata.chunk(idx)
+                            hits.append({
+                                "doc_id": entry["doc_id"],
+                                "chunk_index": entry["chunk_index"],
+                                "text": entry["chunk_text"],
+                                "distance": float(distance)
+                            })
+            if rerank_options:
+                hits = self.rerank(query, hits, k, rerank_options)
+            with tracing.span("context_pack", hits=len(hits)):
+                return pack_context(hits, token_budget, max_overlap=self.CHUNK_OVERLAP, preserve_order=True)
+
+    def rerank(self, query, hits, k, rerank_options):
+        """Rerank best-first candidates with the cross-encoder, keeping retrieval order on failure"""
+        try:
+            with tracing.span("rerank", candidates=len(hits), k=k):
+                return rerank_hits(query, hits, k,
+                                   batch_size=rerank_options["batch_size"],
+                                   latency_budget_ms=rerank_options["latency_budget_ms"])
+        except Exception as e:
+            print(f"Error reranking context: {str(e)}")
+            return hits[:k]
+
     def get_folder_context(self, query, folder_id, user_id, k=5):
         """Get context from a specific folder's vector database"""
+        return [hit["text"] for hit in self.get_folder_hits(query, folder_id, user_id, k)]
+
+    def get_folder_hits(self, query, folder_id, user_id, k=5):
+        """Hybrid search of a folder: FAISS and BM25 results fused with reciprocal rank fusion.
+
+        Returns hits best first; "score" is the fused score and "distance"
+        the L2 distance (inf for chunks only found lexically).
+        """
         try:
-            from sentence_transformers import SentenceTransformer
-            import faiss
-            import json
-            import os
-            
             # Validate inputs
-            print(f"DEBUG: get_folder_context inputs - query: {type(query)}='{query}', folder_id: {type(folder_id)}='{folder_id}', user_id: {type(user_id)}='{user_id}'")
             if not query or not folder_id or not user_id:
-                print("Invalid inputs for get_folder_context")
+                print("Invalid inputs for get_folder_hits")
                 return []
             
             # Ensure user_id is a string
             user_id = str(user_id)
             folder_id = str(folder_id)
             
-            # Get folder vector database path
-            vector_db_path = os.path.join(self.DATA_DIR, "vector_dbs", f"{user_id}_{folder_id}.bin")
+            # Get folder vector store paths
+            store_prefix = os.path.join(self.DATA_DIR, "vector_dbs", f"{user_id}_{folder_id}")
+            legacy_index_path = store_prefix + ".bin"
+            lexical_index_path = store_prefix + ".lex.jsonl"
             metadata_path = os.path.join(self.DATA_DIR, "users", user_id, "folders", folder_id, "metadata.jsonl")
             
-            if not os.path.exists(vector_db_path):
-                print(f"Vector database not found: {vector_db_path}")
+            if not vector_store.store_exists(store_prefix) and not os.path.exists(legacy_index_path):
+                print(f"Vector database not found: {store_prefix}")
                 return []
-                
-            if not os.path.exists(metadata_path):
-                print(f"Metadata file not found: {metadata_path}")
-                return []
-            
-            print(f"DEBUG: Found vector DB: {vector_db_path}")
-            print(f"DEBUG: Found metadata: {metadata_path}")
-            
-            # Load folder's vector database
-            folder_index = faiss.read_index(vector_db_path)
             
-            # Load folder's metadata
-            folder_metadata = []
-            with open(metadata_path, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        try:
-                            folder_metadata.append(json.loads(line))
-                        except json.JSONDecodeError as e:
-                            print(f"Error parsing metadata line: {e}")
-                            continue
-            
-            if not folder_metadata:
-                print("No valid metadata found")
+            # Memory-mapped: opening is cheap and pages are shared between workers
+            folder_store = vector_store.ensure_store(store_prefix, legacy_index_path, metadata_path)
+            if not folder_store.ntotal:
+                print("Folder vector store is empty")
                 return []
             
-            print(f"DEBUG: Loaded {len(folder_metadata)} metadata entries")
-            
-            # Search in folder's vector database
-            query_embedding = self.embedder.encode([query])
-            distances, indices = folder_index.search(query_embedding, k)
+            # Vector search uses the synonym-enhanced query, lexical search the raw one
+            with tracing.span("embed"):
+                query_embedding = encode_queries([self.enhance_query(query)], self.EMBED_MODEL_NAME)
+            with tracing.span("faiss_search", index="folder", folder_id=folder_id, rows=folder_store.ntotal, k=k):
+                distances, indices = folder_store.search(query_embedding, k)
+            vector_distances = {int(idx): float(distance) for distance, idx in zip(distances[0], indices[0]) if idx >= 0}
+            vector_ranking = [int(idx) for idx in indices[0] if idx >= 0]
             
-            print(f"DEBUG: Search returned {len(indices[0])} results")
-            print(f"DEBUG: Indices: {indices[0]}")
-            print(f"DEBUG: Distances: {distances[0]}")
+            with tracing.span("lexical_search", folder_id=folder_id, k=k):
+                folder_lexical_index = lexical_index.load_index(
+                    lexical_index_path, backfill_chunks=folder_store.chunk_texts,
+                    lock=file_lock.get_lock(store_prefix + ".lock"))
+                lexical_ranking = []
+                if folder_lexical_index:
+                    # Rows of deleted files stay in the lexical index until the folder is compacted
+                    lexical_hits = folder_lexical_index.search(query, k + folder_store.deleted_count)
+                    lexical_ranking = [pos for pos, _ in lexical_hits if not folder_store.is_deleted(pos)][:k]
             
-            context = []
-            for i in range(len(indices[0])):
-                if indices[0][i] < len(folder_metadata):
-                    chunk_text = folder_metadata[indices[0][i]].get('chunk_text', '')
-                    print(f"DEBUG: Result {i}: index={indices[0][i]}, chunk_text length={len(chunk_text)}")
-                    if chunk_text:
-                        context.append(chunk_text)
-            
-            print(f"DEBUG: Final context length: {len(context)}")
-            return context
+            hits = []
+            with tracing.span("metadata_load", index="folder", folder_id=folder_id):
+                for idx, score in lexical_index.reciprocal_rank_fusion([vector_ranking, lexical_ranking])[:k]:
+                    entry = folder_store.chunk(idx)
+                    if entry["chunk_text"]:
+                        hits.append({
+                            "doc_id": entry["file_id"],
+                            "chunk_index": entry["chunk_index"],
+                            "text": entry["chunk_text"],
+                            "distance": vector_distances.get(idx, float("inf")),
+                            "score": score
+                        })
+            return hits
             
         except Exception as e:
             print(f"Error getting folder context for folder {folder_id}: {str(e)}")
@@ -195,13 +367,10 @@ class DocSearch:
     
     def format_prompt(self, query, context, user_id=None):
         """Format the prompt for Gemini with proper context"""
-        print(f"DEBUG: format_prompt called with context={len(context) if context else 0} items")
         if context and len(context) > 0:
             formatted_context = "\n\n".join([f"Context {i+1}: {text}" for i, text in enumerate(context)])
-            print(f"DEBUG: Formatted context length: {len(formatted_context)} characters")
         else:
             formatted_context = ""
-            print("DEBUG: No context provided to format_prompt")
         
         # Add function calling information
         function_info = ""
@@ -229,6 +398,8 @@ You have access to the following functions to help answer questions:
 16. **question_bank_generator(course_code, course_name, module_number, sections, include_images, dep)** - Generate a question bank for a course and upload it to Google Drive. IMPORTANT: You must generate the actual questions yourself based on the course topic. Each section must have part_label, marks, and questions array with actual question text that you create. For images, only include image_ref if you have a real, working image URL - do not use example.com or placeholder URLs.
 17. **answer_key_generator(course_code, course_name, module_number, sections, include_images, dep)** - Generate a answer key for a course and upload it to Google Drive. IMPORTANT: You must generate the actual answers yourself based on the course topic. Each section must have part_label, marks, and answers array with actual answer text that you create. For images, only include image_ref if you have a real, working image URL - do not use example.com or placeholder URLs.
 18. **create_coursework(course_id, coursework_body)** - Create a coursework for a course
+19. **assessment_pack_generator(course_code, course_name, modules, include_images, dep)** - Generate question banks and/or answer keys for several modules of a course in one call and upload them all to Google Drive. Use this instead of repeated question_bank_generator / answer_key_generator calls when the user asks for more than one module or document. Each module has module_number, kind ("question_bank" or "answer_key") and sections in the same format as the single generators.
+20. **send_bulk_email(recipients, subject, message)** - Send the same email, personalised per recipient, to many people at once (for example a whole class). Use this instead of repeated send_email calls. Each recipient is an object with "email" plus optional fields such as "name"; use {{{{name}}}}-style placeholders in subject and message to personalise them.
 When the user asks about their courses, enrollment, or classroom-related information, use the appropriate function to get the most current data.
 
 CRITICAL: You MUST make sequential function calls automatically. Do NOT ask the user for course IDs or other parameters.
@@ -342,10 +513,10 @@ EXPERT RESPONSE:"""
                 
         return enhanced_query
 
-    def get_response(self, query, k=12,user_id=None,selected_folders=None,chat_id=None):
-        # Enhance query for better context matching
-        enhanced_query = self.enhance_query(query)
-        history=self.get_chat(chat_id)
+    def get_response(self, query, k=12,user_id=None,selected_folders=None,chat_id=None,max_context_tokens=None,rerank_options=None,context=None):
+        """Generate a response; context is folder context the caller already retrieved, fetched here when None"""
+        with tracing.span("chat_load"):
+            history = self.get_chat(chat_id)
         contents=[]
         for message in history["messages"]:
             if message["role"] == "user":
@@ -359,24 +530,23 @@ EXPERT RESPONSE:"""
                     parts=[genai.types.Part(text=message["content"])]
                 ))
         # Only get context if selected folders are provided and user_id exists
-        context = None
-        print(f"DEBUG: get_response called with selected_folders={selected_folders}, user_id={user_id}")
-        if selected_folders and user_id:
+        if context is None and selected_folders and user_id:
             # Ensure selected_folders is a list
             if isinstance(selected_folders, str):
                 selected_folders = [selected_folders]
             if len(selected_folders) > 0:
                 try:
-                    context = self.get_context(enhanced_query, k, selected_folders, user_id)
-                    if not context or len(context) == 0:
-                        context = None
+                    context = self.get_context(query, k, selected_folders, user_id, max_context_tokens, rerank_options)
                 except Exception as e:
                     print(f"Error getting context from selected folders: {str(e)}")
                     context = None
+        if not context:
+            context = None
        
         
         # Format the prompt properly
-        prompt = self.format_prompt(query, context, user_id)
+        with tracing.span("prompt_build", context_blocks=len(context or [])):
+            prompt = self.format_prompt(query, context, user_id)
         contents.append(
     genai.types.Content(
         role="user", parts=[genai.types.Part(text=prompt)]
@@ -390,13 +560,13 @@ EXPERT RESPONSE:"""
             
             while iteration < max_iterations:
                 iteration += 1
-                print(f"Iteration {iteration}")
-                
-                response = self.client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=contents,
-                    config=config
-                )
+                with tracing.span("gemini.generate_content", model="gemini-2.5-flash", iteration=iteration) as gemini_span:
+                    response = self.client.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=contents,
+                        config=config
+                    )
+                    gemini_span.set_attribute("candidates", len(response.candidates or []))
                 
                 if not response.candidates:
                     print("No candidates in response")
@@ -409,13 +579,14 @@ EXPERT RESPONSE:"""
                     if candidate.content and candidate.content.parts:
                         for part in candidate.content.parts:
                             if part.function_call:
-                                print(f"Function call detected: {part.function_call.name}")
-                                print(f"Function args: {part.function_call.args}")
                                 function_called = True
                                 
                                 try:
-                                    function_response = handle_part(part, user_id)
-                                    print(f"Function response: {function_response}")
+                                    with tracing.span("tool_call", function=part.function_call.name) as tool_span:
+                                        function_response = handle_part(part, user_id)
+                                        # Tools report failures as an {"error": ...} result rather than raising
+                                        failed = isinstance(function_response, dict) and "error" in function_response
+                                        tool_span.set_attribute("status", "error" if failed else "ok")
                                     
                                     if function_response:
                                         # Add function response to conversation
@@ -431,20 +602,15 @@ EXPERT RESPONSE:"""
                                     
                             elif part.text:
                                 text_response += part.text + "\n"
-                                print(f"Text response: {text_response}")
                     
                     # Check if we should stop the loop
                     if hasattr(candidate, 'finish_reason'):
-                        print(f"Finish reason: {candidate.finish_reason}")
                         if candidate.finish_reason == "stop" and text_response:
-                            print("Stopping loop - got text response with stop reason")
                             final_response = text_response
                             break
                         elif candidate.finish_reason == "stop" and not function_called:
-                            print("Stopping loop - stop reason but no function called and no text")
                             break
                         elif candidate.finish_reason == "malformed_function_call":
-                            print("Malformed function call detected - stopping loop")
                             if text_response:
                                 final_response = text_response
                             break
@@ -456,12 +622,10 @@ EXPERT RESPONSE:"""
                 
                 # If no function was called and no text response, we're done
                 if not function_called and not text_response:
-                    print("No function called and no text response - stopping")
                     break
                 
                 # If a function was called, continue the loop to allow for sequential calls
                 if function_called:
-                    print("Function was called, continuing loop for potential sequential calls...")
                     # Add a prompt to encourage response generation after function calls
                     if iteration >= 2:  # After at least one function call
                         contents.append(genai.types.Content(
@@ -470,32 +634,7 @@ EXPERT RESPONSE:"""
                         ))
                     continue
                             
-                # print(f"Final response: {final_response}")
                 # Validate and enhance response
-            # Debug: Write response info to file
-            debug_info = {
-                "final_response": final_response,
-                "contents_count": len(contents),
-                "contents_summary": []
-            }
-            for i, content in enumerate(contents):
-                if hasattr(content, 'role') and hasattr(content, 'parts'):
-                    parts_summary = []
-                    for part in content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            parts_summary.append({"type": "text", "preview": part.text[:100] + "..." if len(part.text) > 100 else part.text})
-                        elif hasattr(part, 'function_call') and part.function_call:
-                            parts_summary.append({"type": "function_call", "name": part.function_call.name})
-                        elif hasattr(part, 'function_response') and part.function_response:
-                            parts_summary.append({"type": "function_response", "name": getattr(part.function_response, 'name', 'unknown')})
-                    debug_info["contents_summary"].append({
-                        "index": i,
-                        "role": content.role,
-                        "parts": parts_summary
-                    })
-            
-            with open("debug.json", "w") as f:
-                json.dump(debug_info, f, indent=2)
             if final_response:
                 response_text = final_response.strip()
             else:
@@ -512,11 +651,10 @@ EXPERT RESPONSE:"""
             print(e)
             return "An error occurred while generating the response."
 
-    def get_response_with_files(self, query, k=12, user_id=None, uploaded_files=None,selected_folders=None,chat_id=None):
-        """Generate response with uploaded files using Files API"""
-        # Enhance query for better context matching
-        enhanced_query = self.enhance_query(query)
-        history=self.get_chat(chat_id)
+    def get_response_with_files(self, query, k=12, user_id=None, uploaded_files=None,selected_folders=None,chat_id=None,max_context_tokens=None,rerank_options=None,context=None):
+        """Generate response with uploaded files using Files API; context is as for get_response"""
+        with tracing.span("chat_load"):
+            history = self.get_chat(chat_id)
         # Only get context if selected folders are provided and user_id exists
         contents=[]
         for message in history["messages"]:
@@ -531,23 +669,23 @@ EXPERT RESPONSE:"""
                     parts=[genai.types.Part(text=message["content"])]
                 ))
         
-        context = None
-        if selected_folders and user_id:
+        if context is None and selected_folders and user_id:
             # Ensure selected_folders is a list
             if isinstance(selected_folders, str):
                 selected_folders = [selected_folders]
             if len(selected_folders) > 0:
                 try:
-                    context = self.get_context(enhanced_query, k, selected_folders, user_id)
-                    if not context or len(context) == 0:
-                        context = None
+                    context = self.get_context(query, k, selected_folders, user_id, max_context_tokens, rerank_options)
                 except Exception as e:
                     print(f"Error getting context from selected folders: {str(e)}")
                     context = None
+        if not context:
+            context = None
         
         
         # Format the prompt properly
-        prompt=self.format_prompt(query, context, user_id)
+        with tracing.span("prompt_build", context_blocks=len(context or [])):
+            prompt = self.format_prompt(query, context, user_id)
         
         # Build contents with files and text
         
@@ -558,7 +696,8 @@ EXPERT RESPONSE:"""
             for file in uploaded_files:
                 try:
                     # Upload file to Gemini Files API
-                    upload_result = upload_to_gemini(file)
+                    with tracing.span("gemini.upload_file"):
+                        upload_result = upload_to_gemini(file)
 
                     if upload_result["success"]:
                         # Add the file as a separate content item
@@ -586,13 +725,13 @@ EXPERT RESPONSE:"""
             
             while iteration < max_iterations:
                 iteration += 1
-                print(f"Iteration {iteration}")
-                
-                response = self.client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=contents,
-                    config=config
-                )
+                with tracing.span("gemini.generate_content", model="gemini-2.5-flash", iteration=iteration) as gemini_span:
+                    response = self.client.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=contents,
+                        config=config
+                    )
+                    gemini_span.set_attribute("candidates", len(response.candidates or []))
                 
                 if not response.candidates:
                     print("No candidates in response")
@@ -605,13 +744,14 @@ EXPERT RESPONSE:"""
                     if candidate.content and candidate.content.parts:
                         for part in candidate.content.parts:
                             if part.function_call:
-                                print(f"Function call detected: {part.function_call.name}")
-                                print(f"Function args: {part.function_call.args}")
                                 function_called = True
                                 
                                 try:
-                                    function_response = handle_part(part, user_id)
-                                    print(f"Function response: {function_response}")
+                                    with tracing.span("tool_call", function=part.function_call.name) as tool_span:
+                                        function_response = handle_part(part, user_id)
+                                        # Tools report failures as an {"error": ...} result rather than raising
+                                        failed = isinstance(function_response, dict) and "error" in function_response
+                                        tool_span.set_attribute("status", "error" if failed else "ok")
                                     
                                     if function_response:
                                         # Add function response to conversation
@@ -627,20 +767,15 @@ EXPERT RESPONSE:"""
                                     
                             elif part.text:
                                 text_response += part.text + "\n"
-                                print(f"Text response: {text_response}")
                     
                     # Check if we should stop the loop
                     if hasattr(candidate, 'finish_reason'):
-                        print(f"Finish reason: {candidate.finish_reason}")
                         if candidate.finish_reason == "stop" and text_response:
-                            print("Stopping loop - got text response with stop reason")
                             final_response = text_response
                             break
                         elif candidate.finish_reason == "stop" and not function_called:
-                            print("Stopping loop - stop reason but no function called and no text")
                             break
                         elif candidate.finish_reason == "malformed_function_call":
-                            print("Malformed function call detected - stopping loop")
                             if text_response:
                                 final_response = text_response
                             break
@@ -652,12 +787,10 @@ EXPERT RESPONSE:"""
                 
                 # If no function was called and no text response, we're done
                 if not function_called and not text_response:
-                    print("No function called and no text response - stopping")
                     break
                 
                 # If a function was called, continue the loop to allow for sequential calls
                 if function_called:
-                    print("Function was called, continuing loop for potential sequential calls...")
                     # Add a prompt to encourage response generation after function calls
                     if iteration >= 2:  # After at least one function call
                         contents.append(genai.types.Content(
@@ -666,30 +799,6 @@ EXPERT RESPONSE:"""
                         ))
                     continue
                             
-            # Debug: Write response info to file
-            debug_info = {
-                "final_response": final_response,
-                "contents_count": len(contents),
-                "contents_summary": []
-            }
-            for i, content in enumerate(contents):
-                if hasattr(content, 'role') and hasattr(content, 'parts'):
-                    parts_summary = []
-                    for part in content.parts:
-                        if hasattr(part, 'text') and part.text:
-                            parts_summary.append({"type": "text", "preview": part.text[:100] + "..." if len(part.text) > 100 else part.text})
-                        elif hasattr(part, 'function_call') and part.function_call:
-                            parts_summary.append({"type": "function_call", "name": part.function_call.name})
-                        elif hasattr(part, 'function_response') and part.function_response:
-                            parts_summary.append({"type": "function_response", "name": getattr(part.function_response, 'name', 'unknown')})
-                    debug_info["contents_summary"].append({
-                        "index": i,
-                        "role": content.role,
-                        "parts": parts_summary
-                    })
-            
-            with open("debug.json", "w") as f:
-                json.dump(debug_info, f, indent=2)
             
             # Validate and enhance response
             if final_response:
@@ -736,18 +845,19 @@ EXPERT RESPONSE:"""
             data=json.load(file)
         return json.dumps(data)
     
-    def ingest_file(self, file_path):
+    def ingest_file(self, file_path, file_id=None):
         text=self.extract_text_from_file(file_path)
-        self.ingest_docs([text])
+        self.ingest_docs([text], [file_id] if file_id else None)
         return jsonify({"message": "File ingested successfully", "count": 1})
 
 
     def reset_index(self):
-        self.index.reset()
-        self.metadata = []
-        faiss.write_index(self.index, self.INDEX_PATH)
-        with open(self.METADATA_PATH, "w") as f:
-            json.dump(self.metadata, f)
+        with self.index_file_lock:
+            self.reload_if_changed()
+            with self.index_lock:
+                self.index.reset()
+                self.metadata.reset()
+                self.save_index()
         return jsonify({"message": "Index reset successfully"})
 
     def add_to_chat(self, chat_id, message):
@@ -759,33 +869,34 @@ EXPERT RESPONSE:"""
             
         filepath = os.path.join(CHAT_STORAGE_DIR, f"{chat_id}.json")
         
-        # Create chat file if it doesn't exist
-        if not os.path.exists(filepath):
-            chat_data = {
-                "id": chat_id,
-                "title": "New Chat",
-                "messages": [],
-                "created_at": datetime.now().isoformat(),
-                "updated_at": datetime.now().isoformat()
-            }
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(chat_data, f, indent=2)
+        with tracing.span("chat_persist", role=message.get("role")):
+            # Create chat file if it doesn't exist
+            if not os.path.exists(filepath):
+                chat_data = {
+                    "id": chat_id,
+                    "title": "New Chat",
+                    "messages": [],
+                    "created_at": datetime.now().isoformat(),
+                    "updated_at": datetime.now().isoformat()
+                }
+                with open(filepath, 'w', encoding='utf-8') as f:
+                    json.dump(chat_data, f, indent=2)
         
-        # Read existing chat data
-        with open(filepath, 'r', encoding='utf-8') as f:
-            chat_data = json.load(f)
+            # Read existing chat data
+            with open(filepath, 'r', encoding='utf-8') as f:
+                chat_data = json.load(f)
         
-        # Add message
-        chat_data["messages"].append(message)
-        chat_data["updated_at"] = datetime.now().isoformat()
+            # Add message
+            chat_data["messages"].append(message)
+            chat_data["updated_at"] = datetime.now().isoformat()
         
-        # Update title if it's the first user message
-        if message.get("role") == "user" and chat_data["title"] == "New Chat":
-            chat_data["title"] = message["content"][:50] + "..." if len(message["content"]) > 50 else message["content"]
+            # Update title if it's the first user message
+            if message.get("role") == "user" and chat_data["title"] == "New Chat":
+                chat_data["title"] = message["content"][:50] + "..." if len(message["content"]) > 50 else message["content"]
         
-        # Save updated chat data
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(chat_data, f, indent=2)
+            # Save updated chat data
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(chat_data, f, indent=2)
         
         return chat_id
         
@@ -840,6 +951,29 @@ send_email_declaration={
         "required": ["to", "subject", "message"]
     }
 }
+send_bulk_email_declaration={
+    "name": "send_bulk_email",
+    "description": "Send a personalised email to many recipients at once, for example all students of a course. Use {{field}} placeholders (e.g. {{name}}) in subject and message; they are filled from each recipient object. {{email}} is always available. Returns a per-recipient result summary.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "recipients": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "email": {"type": "string"},
+                        "name": {"type": "string"}
+                    },
+                    "required": ["email"]
+                }
+            },
+            "subject": {"type": "string"},
+            "message": {"type": "string"}
+        },
+        "required": ["recipients", "subject", "message"]
+    }
+}
 list_courses_declaration={
     "name": "list_courses",
     "description": "List all courses for the user. You can use this function to get the course_id",
@@ -1162,6 +1296,63 @@ answer_key_generator_declaration={
         "required": ["sections"]
     }
 }
+assessment_pack_generator_declaration={
+    "name": "assessment_pack_generator",
+    "description": "Generate question banks and/or answer keys for several modules of a course at once and upload them to Google Drive. Use this when the user asks for more than one module or document. Each module has module_number, kind ('question_bank' or 'answer_key') and sections. Question bank sections contain 'questions' (each with 'q' and optionally 'image_ref'); answer key sections contain 'answers' (each with 'question', 'answer' and optionally 'image_ref'). You must create the actual questions and answers yourself. For images, only use real URLs that point to actual images, not example.com or fake URLs.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "course_code": {"type": "string"},
+            "course_name": {"type": "string"},
+            "modules": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "module_number": {"type": "number"},
+                        "kind": {"type": "string", "enum": ["question_bank", "answer_key"]},
+                        "sections": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "part_label": {"type": "string"},
+                                    "marks": {"type": "number"},
+                                    "questions": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "q": {"type": "string"},
+                                                "image_ref": {"type": "string"}
+                                            }
+                                        }
+                                    },
+                                    "answers": {
+                                        "type": "array",
+                                        "items": {
+                                            "type": "object",
+                                            "properties": {
+                                                "question": {"type": "string"},
+                                                "answer": {"type": "string"},
+                                                "image_ref": {"type": "string"}
+                                            }
+                                        }
+                                    }
+                                },
+                                "required": ["part_label", "marks"]
+                            }
+                        }
+                    },
+                    "required": ["module_number", "kind", "sections"]
+                }
+            },
+            "include_images": {"type": "boolean"},
+            "dep": {"type": "string"}
+        },
+        "required": ["modules"]
+    }
+}
 create_coursework_declaration={
     "name": "create_coursework",
     "description": "Create a coursework for a course. coursework_body is a dictionary with the following properties: course_id, coursework_body. if assigneeMode is INDIVIDUAL_STUDENTS, individualStudentsOptions is required and must be an array of student ids. if assigneeMode is ALL_STUDENTS, individualStudentsOptions is not required",
@@ -1239,11 +1430,14 @@ create_coursework_declaration={
         "required": ["course_id", "coursework_body"]
     }
 }
-tools=genai.types.Tool(function_declarations=[send_email_declaration,list_courses_declaration,list_course_students_declaration,get_student_declaration,list_student_submissions_declaration,get_coursework_declaration,get_coursework_materials_declaration,list_courseworks_declaration,download_file_from_drive_and_upload_to_gemini_declaration,summarize_file_from_gemini_declaration,create_quiz_declaration,create_announcement_declaration,list_forms_declaration,get_form_declaration,list_form_responses_declaration,get_form_response_declaration,question_bank_generator_declaration,create_coursework_declaration,answer_key_generator_declaration])
+tools=genai.types.Tool(function_declarations=[send_email_declaration,send_bulk_email_declaration,list_courses_declaration,list_course_students_declaration,get_student_declaration,list_student_submissions_declaration,get_coursework_declaration,get_coursework_materials_declaration,list_courseworks_declaration,download_file_from_drive_and_upload_to_gemini_declaration,summarize_file_from_gemini_declaration,create_quiz_declaration,create_announcement_declaration,list_forms_declaration,get_form_declaration,list_form_responses_declaration,get_form_response_declaration,question_bank_generator_declaration,create_coursework_declaration,answer_key_generator_declaration,assessment_pack_generator_declaration])
 config = genai.types.GenerateContentConfig(tools=[tools])
 
 app = create_app()
 doc_search = DocSearch()
+
+# Deleting an uploaded file also drops its chunks from the general index
+on_file_deleted(lambda user_id, file_id: doc_search.remove_document(file_id))
 @app.route("/chat/threads", methods=["GET"])
 def get_threads():
     try:
@@ -1286,19 +1480,34 @@ def search():
             user_id = str(request.form.get("user_id")) if request.form.get("user_id") else None
             k = int(request.form.get("k", 50))
             selected_folders = request.form.getlist("selected_folders")  # Get list of selected folders
+            max_context_tokens = request.form.get("max_context_tokens")
+            try:
+                rerank_options = parse_rerank_options(request.form)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             
             if not query or not query.strip():
                 return jsonify({"error": "Missing or empty 'query' field"}), 400
             
+            if max_context_tokens:
+                if not max_context_tokens.isdecimal() or int(max_context_tokens) <= 0:
+                    return jsonify({"error": "'max_context_tokens' must be a positive integer"}), 400
+                max_context_tokens = int(max_context_tokens)
+            else:
+                max_context_tokens = None
+            
             # Get uploaded files
             uploaded_files = []
             for key, file in request.files.items():
                 if key.startswith("file_"):
                     uploaded_files.append(file)
             
-            # Process with files - use selected folders if provided
-            context = doc_search.get_context(query, k, selected_folders, user_id)
-            response = doc_search.get_response_with_files(query, k, user_id, uploaded_files,selected_folders,chat_id)
+            # Process with files - retrieve folder context once and hand it to the response
+            context = None
+            if selected_folders and user_id:
+                context = doc_search.get_context(query, k, selected_folders, user_id, max_context_tokens, rerank_options)
+            response = doc_search.get_response_with_files(query, k, user_id, uploaded_files,selected_folders,chat_id,max_context_tokens,rerank_options,
+                                                          context=context)
             
         else:
             # Handle regular JSON request
@@ -1311,6 +1520,11 @@ def search():
             query = data.get("query")
             k = data.get("k", 50)
             selected_folders = data.get("selected_folders", [])  # New parameter for selected libraries
+            max_context_tokens = data.get("max_context_tokens")  # Optional prompt context budget
+            try:
+                rerank_options = parse_rerank_options(data)  # Optional cross-encoder rerank stage
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
             
             if not chat_id:
                 chat_id = str(uuid.uuid4())
@@ -1321,13 +1535,19 @@ def search():
             if not isinstance(k, int) or k <= 0:
                 return jsonify({"error": "'k' must be a positive integer"}), 400
             
-            # Use selected folders if provided, otherwise use general search
+            if max_context_tokens is not None and (not isinstance(max_context_tokens, int) or max_context_tokens <= 0):
+                return jsonify({"error": "'max_context_tokens' must be a positive integer"}), 400
+            
+            if isinstance(selected_folders, str):
+                selected_folders = [selected_folders]
+            
+            # Retrieve folder context once and hand it to the response
             context = None
-            if selected_folders and len(selected_folders) > 0:
-                context = doc_search.get_context(query, k, selected_folders, user_id)
-                print(f"Context: {context}")
+            if selected_folders and user_id:
+                context = doc_search.get_context(query, k, selected_folders, user_id, max_context_tokens, rerank_options)
             
-            response = doc_search.get_response(query, k, user_id, selected_folders,chat_id)
+            response = doc_search.get_response(query, k, user_id, selected_folders,chat_id,max_context_tokens,rerank_options,
+                                               context=context)
         
         chat_id = doc_search.add_to_chat(chat_id, {"role": "user", "content": query})
         doc_search.add_to_chat(chat_id, {"role": "assistant", "content": response})
@@ -1343,16 +1563,33 @@ def test():
         "endpoints": [
             "/ingest (POST)", 
             "/query (POST)",
+            "/warmup (GET, POST)",
             "/files/upload (POST)",
             "/files/delete (DELETE)"
         ],
         "usage": {
             "ingest": {"docs": ["document1", "document2"]},
-            "query": {"query": "your search query", "k": 5},
+            "query": {"query": "your search query", "k": 5, "max_context_tokens": 6000, "rerank": True, "rerank_candidates": 50, "rerank_batch_size": 16, "rerank_budget_ms": 250},
             "query_with_files": {"query": "your search query", "files": "multipart/form-data"}
         }
     })
 
+@app.route("/warmup", methods=["GET", "POST"])
+def warmup():
+    """Load models, clients and the general index now instead of on the first real request"""
+    try:
+        include_reranker = request.args.get("rerank", "").lower() in ("1", "true", "yes")
+        timings = doc_search.warm_up(include_reranker)
+        print(f"Warm-up finished: {timings}")
+        return jsonify({"message": "Warm-up complete", "timings": timings})
+    except Exception as e:
+        return jsonify({"error": f"Warm-up failed: {str(e)}"}), 500
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request, Gemini, tool-call, embedding, search, cache and ingestion metrics for Prometheus"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/files/upload", methods=["POST"])
 def upload_file():
     """Upload a single file to Gemini Files API"""
@@ -1407,7 +1644,9 @@ def ingest_file():
         return jsonify({"error": "Content-Type must be application/json"}), 400
     data = request.get_json()
     file_path = data.get("file_path")
-    return doc_search.ingest_file(file_path)
+    # Optional: the upload's file_id, so deleting the upload also removes its chunks
+    file_id = data.get("file_id")
+    return doc_search.ingest_file(file_path, file_id)
 
 @app.route("/ingest_json",methods=["POST"])
 def ingest_json():
@@ -0,0 +1,122 @@
+"""
+Parity and throughput of the embedding backends on a chunk corpus.
+
+Embeds the same chunks with sentence-transformers (PyTorch fp32), the ONNX
+Runtime fp32 export and its int8-quantized copy, then reports:
+
+  * parity: cosine similarity of each ONNX vector to the PyTorch one, and
+    how many of each query's top-k neighbours agree with PyTorch's
+  * throughput: chunks per second for each backend (best of --repeat)
+
+The corpus is a chunk table (.chunks), a folder store prefix (the path
+without .vec/.rec) or a text file with chunks separated by blank lines.
+Without --corpus, the general index's chunk table (METADATA_PATH) is used.
+
+Run from the server directory:
+    python benchmarks/embedding_backend_benchmark.py [--corpus PATH] [--limit 2000] [--min-cosine 0.98]
+
+Exits with status 1 when the int8 backend falls below --min-cosine, so it
+can gate switching EMBED_BACKEND to onnx.
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rag_utils.chunk_store import ChunkTable
+from rag_utils import vector_store
+
+
+def load_corpus(path, limit):
+    if path is None:
+        metadata_path = os.getenv("METADATA_PATH")
+        if not metadata_path:
+            raise SystemExit("Pass --corpus or set METADATA_PATH to use the general chunk table")
+        path = os.path.splitext(metadata_path)[0] + ".chunks"
+    if path.endswith(".chunks"):
+        table = ChunkTable.load(path)
+        chunks = [table.chunk(i)["chunk_text"] for i in range(min(len(table), limit))]
+    elif vector_store.store_exists(path):
+        store = vector_store.FolderVectorStore(path)
+        chunks = [store.chunk(i)["chunk_text"] for i in range(min(store.ntotal, limit))]
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            chunks = [chunk.strip() for chunk in f.read().split("\n\n") if chunk.strip()][:limit]
+    if not chunks:
+        raise SystemExit(f"No chunks found in {path}")
+    return chunks
+
+
+def time_encode(embedder, chunks, batch_size, repeat):
+    embeddings, best = None, float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = np.asarray(embedder.encode(chunks, batch_size=batch_size), dtype="float32")
+        best = min(best, time.perf_counter() - start)
+    return embeddings, best
+
+
+def neighbour_agreement(reference, candidate, queries, k):
+    """Mean share of each query's top-k neighbours (by cosine) that both embeddings agree on"""
+    def top_k(embeddings):
+        normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        scores = normalized[:queries] @ normalized.T
+        return np.argsort(-scores, axis=1)[:, 1:k + 1]  # skip the query itself
+    expected, found = top_k(reference), top_k(candidate)
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(expected, found)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="chunk table, folder store prefix or text file")
+    parser.add_argument("--model", default=os.getenv("EMBED_MODEL_NAME") or "all-MiniLM-L6-v2")
+    parser.add_argument("--limit", type=int, default=2000, help="chunks to embed")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3, help="timing repetitions (best is reported)")
+    parser.add_argument("--k", type=int, default=10, help="neighbours compared per query")
+    parser.add_argument("--queries", type=int, default=100, help="chunks used as neighbour queries")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="fail if int8 mean cosine is below this")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    from rag_utils.onnx_embedder import OnnxEmbedder, export_model
+
+    chunks = load_corpus(args.corpus, args.limit)
+    print(f"Corpus: {len(chunks)} chunks, {sum(len(c) for c in chunks)} characters, model {args.model}")
+
+    # The benchmark has torch anyway, so it creates a missing export (fp32 and int8)
+    export_model(args.model, quantize=True)
+    backends = [
+        ("torch fp32", SentenceTransformer(args.model)),
+        ("onnx fp32", OnnxEmbedder(args.model, quantized=False)),
+        ("onnx int8", OnnxEmbedder(args.model, quantized=True)),
+    ]
+    reference, reference_time = None, None
+    failed = False
+    queries = min(args.queries, len(chunks))
+    k = min(args.k, len(chunks) - 1)
+    print(f"\n{'backend':<12} {'chunks/s':>10} {'speedup':>8} {'cos mean':>9} {'cos min':>8} {'top-k agree':>12}")
+    for name, embedder in backends:
+        embeddings, seconds = time_encode(embedder, chunks, args.batch_size, args.repeat)
+        if reference is None:
+            reference, reference_time = embeddings, seconds
+            print(f"{name:<12} {len(chunks) / seconds:10.1f} {1.0:7.2f}x {'-':>9} {'-':>8} {'-':>12}")
+            continue
+        cosine = np.sum(reference * embeddings, axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(embeddings, axis=1))
+        agreement = neighbour_agreement(reference, embeddings, queries, k) if k > 0 else 1.0
+        print(f"{name:<12} {len(chunks) / seconds:10.1f} {reference_time / seconds:7.2f}x "
+              f"{cosine.mean():9.4f} {cosine.min():8.4f} {agreement:12.3f}")
+        if name == "onnx int8" and cosine.mean() < args.min_cosine:
+            failed = True
+
+    if failed:
+        print(f"\nint8 embeddings fall below the {args.min_cosine} mean cosine parity threshold")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Import-time profile of the server modules.
+
+Imports a module in a fresh interpreter with `python -X importtime`, then
+reports the total import time, the slowest modules it imports directly
+and the slowest packages overall, so heavy imports that sneak back into
+the startup path show up.
+
+Run from the server directory:
+    python benchmarks/import_profile.py [--module app] [--top 20] [--budget 3.0] [--output report.json]
+
+With --budget (seconds), the script exits with status 1 when the import
+takes longer, so it can guard startup time in CI.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_import(module):
+    """Return [(module_name, self_us, cumulative_us, depth)] in import order"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nesting is shown by two spaces of indentation per level
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def build_report(module, rows, top):
+    top_level = [row for row in rows if row[3] == 0]
+    target = [row for row in top_level if row[0] == module]
+    # importtime lists a module's imports (one level deeper) right before the module itself
+    direct_imports, pending = [], []
+    for row in rows:
+        if row[3] == 1:
+            pending.append(row)
+        elif row[3] == 0:
+            if row[0] == module:
+                direct_imports = pending
+            pending = []
+    packages = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return {
+        "module": module,
+        "python": sys.version.split()[0],
+        "total_seconds": round((target[0][2] if target else sum(row[2] for row in top_level)) / 1e6, 3),
+        "modules_imported": len(rows),
+        "slowest_direct_imports": [
+            {"module": name, "cumulative_seconds": round(cumulative_us / 1e6, 3)}
+            for name, _, cumulative_us, _ in sorted(direct_imports, key=lambda row: row[2], reverse=True)[:top]
+        ],
+        "slowest_packages": [
+            {"package": package, "self_seconds": round(self_us / 1e6, 3)}
+            for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=20, help="entries per table")
+    parser.add_argument("--budget", type=float, help="fail if the import takes longer than this many seconds")
+    parser.add_argument("--output", help="also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    report = build_report(args.module, profile_import(args.module), args.top)
+    print(f"import {report['module']}: {report['total_seconds']:.3f}s, {report['modules_imported']} modules")
+    print(f"\nSlowest imports made by {report['module']} (cumulative):")
+    for entry in report["slowest_direct_imports"]:
+        print(f"  {entry['cumulative_seconds']:8.3f}s  {entry['module']}")
+    print("\nSlowest packages (own import time, all submodules):")
+    for entry in report["slowest_packages"]:
+        print(f"  {entry['self_seconds']:8.3f}s  {entry['package']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.budget is not None and report["total_seconds"] > args.budget:
+        print(f"\nImport time {report['total_seconds']:.3f}s exceeds the {args.budget:.3f}s budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+"""
+Reproducible end-to-end benchmark of the RAG server.
+
+Builds seeded synthetic course documents, then for each corpus size:
+
+  * ingestion      uploads every document to a fresh folder through
+                   POST /api/file/upload (text extraction, chunking,
+                   embedding, vector store, lexical index, folders.db)
+  * retrieval      DocSearch.get_folder_hits for one query per target
+                   document; a hit is correct when it comes from the
+                   document the query was written for
+  * end-to-end     POST /query with the folder selected
+  * chat           DocSearch.add_to_chat / get_chats
+
+Gemini is replaced by a local stand-in (optionally with a fixed latency),
+so runs need no network or API key and are repeatable. Results are written
+in the schemas of the checked-in reports:
+
+    benchmark_results/comprehensive_benchmark_report_<timestamp>_<n>docs.json
+    simple_benchmark_results/simple_benchmark_<timestamp>_<n>docs.json
+
+Fields this harness cannot measure (pages of plain-text documents, cost
+savings, ROI) are written as null. Comparisons are only filled in against
+a --baseline report, and --max-regression turns them into a check.
+
+Run from the server directory:
+    python benchmarks/rag_benchmark.py [--sizes 20,100,500] [--queries 50] [--gemini-latency-ms 0]
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+from types import SimpleNamespace
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+REPORT_VERSION = "1.0"
+SYSTEM_NAME = "RAG Enterprise System"
+
+_TOPICS = [
+    "binary search trees", "dynamic programming", "process scheduling", "virtual memory",
+    "relational algebra", "transaction isolation", "TCP congestion control", "public key cryptography",
+    "compiler parsing", "graph traversal", "hash tables", "sorting algorithms", "cache coherence",
+    "neural network training", "software testing", "requirements engineering", "signal processing",
+    "control systems", "thermodynamics", "engineering mathematics",
+]
+_FILLER = [
+    "Students are assessed through internal tests, assignments and a final examination.",
+    "Each unit ends with tutorial problems that are discussed in the following lab session.",
+    "The reference books listed in the syllabus should be consulted for detailed derivations.",
+    "Laboratory exercises are evaluated continuously and contribute to the internal marks.",
+    "Attendance of at least seventy five percent is required to appear for the examination.",
+    "Course outcomes are mapped to programme outcomes as shown in the articulation matrix.",
+    "Case studies from industry are used to illustrate the practical use of each concept.",
+    "Previous year question papers are available in the department library.",
+]
+
+
+def build_corpus(documents, seed, paragraphs=8):
+    """Return [(file_name, text)] and [(query, file_name, fact)]: one query per document, answered by its fact sentence"""
+    rng = random.Random(seed)
+    corpus, queries = [], []
+    for i in range(documents):
+        code = f"CS{3000 + i}"
+        topic, other = rng.sample(_TOPICS, 2)
+        fact = f"Course {code} covers {topic} in depth, with a mini project on {other}."
+        body = [" ".join(rng.choice(_FILLER) for _ in range(rng.randint(4, 7))) for _ in range(paragraphs)]
+        body.insert(rng.randrange(len(body) + 1), fact)
+        file_name = f"syllabus_{code}.txt"
+        corpus.append((file_name, f"Syllabus for {code}\n\n" + "\n\n".join(body)))
+        queries.append((f"What does {code} cover and what is its mini project about?", file_name, fact))
+    return corpus, queries
+
+
+class StandInGemini:
+    """Local replacement for the Gemini client: answers every request with plain text"""
+
+    def __init__(self, latency_ms=0):
+        self.models = self
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self.total_time = 0.0
+
+    def generate_content(self, model=None, contents=None, config=None):
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = getattr(contents[-1].parts[0], "text", None) or "" if contents else ""
+        text = f"Stand-in answer to a {len(prompt)} character prompt."
+        part = SimpleNamespace(text=text, function_call=None)
+        candidate = SimpleNamespace(content=SimpleNamespace(parts=[part]), finish_reason="STOP")
+        self.calls += 1
+        self.total_time += time.perf_counter() - start
+        return SimpleNamespace(candidates=[candidate], text=text)
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def describe(values):
+    average = statistics.mean(values)
+    std_deviation = statistics.pstdev(values)
+    return {
+        "average": average,
+        "std_deviation": std_deviation,
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "coefficient_of_variation": std_deviation / average * 100 if average else 0.0,
+    }
+
+
+class Phase:
+    """Wall time, CPU share and resident memory samples of one benchmark phase"""
+
+    def __init__(self):
+        self.memory_samples = []
+
+    def __enter__(self):
+        self.wall_start, self.cpu_start = time.perf_counter(), time.process_time()
+        return self
+
+    def sample(self):
+        self.memory_samples.append(current_rss_mb())
+
+    def __exit__(self, *exc_info):
+        self.wall = time.perf_counter() - self.wall_start
+        self.cpu_percent = (time.process_time() - self.cpu_start) / self.wall * 100 if self.wall else 0.0
+        self.avg_memory_mb = statistics.mean(self.memory_samples) if self.memory_samples else current_rss_mb()
+
+
+def run_size(app_module, metadata_db, client, stand_in, corpus, queries, k, user_id, chat_messages):
+    folder = client.post(f"/api/folders/{user_id}", json={"folder_name": f"benchmark-{len(corpus)}-{time.time_ns()}"}).get_json()
+    folder_id = folder["folder"]["folder_id"]
+
+    file_times, file_ids = [], {}
+    with Phase() as ingestion:
+        for file_name, text in corpus:
+            start = time.perf_counter()
+            response = client.post(f"/api/file/upload/{user_id}", data={
+                "folder_id": folder_id,
+                "file_0": (io.BytesIO(text.encode("utf-8")), file_name),
+            }, content_type="multipart/form-data")
+            file_times.append(time.perf_counter() - start)
+            uploaded = response.get_json()
+            if response.status_code != 200 or not uploaded.get("files"):
+                raise SystemExit(f"Upload of {file_name} failed: {uploaded}")
+            file_ids[file_name] = uploaded["files"][0]["file_id"]
+            ingestion.sample()
+
+    doc_search = app_module.doc_search
+    context_times, precisions, recalls, correct = [], [], [], 0
+    chunk_counts = {record["file_id"]: record["chunk_count"] for record in
+                    metadata_db.list_files(user_id, folder_id)}
+    for query, file_name, _ in queries:
+        start = time.perf_counter()
+        hits = doc_search.get_folder_hits(query, folder_id, user_id, k)
+        context_times.append(time.perf_counter() - start)
+        target = file_ids[file_name]
+        relevant = sum(1 for hit in hits if hit["doc_id"] == target)
+        precisions.append(relevant / len(hits) if hits else 0.0)
+        recalls.append(relevant / min(k, chunk_counts.get(target) or 1))
+        correct += bool(hits) and hits[0]["doc_id"] == target
+
+    response_times, generation_times = [], []
+    with Phase() as querying:
+        for query, _, _ in queries:
+            generation_before = stand_in.total_time
+            start = time.perf_counter()
+            response = client.post("/query", json={
+                "query": query, "user_id": user_id, "selected_folders": [folder_id], "k": k
+            })
+            response_times.append(time.perf_counter() - start)
+            generation_times.append(stand_in.total_time - generation_before)
+            if response.status_code != 200:
+                raise SystemExit(f"/query failed: {response.get_json()}")
+            querying.sample()
+
+    write_times = []
+    chat_id = None
+    for i in range(chat_messages):
+        start = time.perf_counter()
+        chat_id = doc_search.add_to_chat(chat_id, {"role": "user" if i % 2 == 0 else "assistant",
+                                                   "content": queries[i % len(queries)][0]})
+        write_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    chats = doc_search.get_chats()
+    list_time = time.perf_counter() - start
+
+    return {
+        "documents": len(corpus),
+        "total_size_mb": sum(len(text.encode("utf-8")) for _, text in corpus) / 2 ** 20,
+        "file_times": file_times,
+        "ingestion": ingestion,
+        "context_times": context_times,
+        "response_times": response_times,
+        "generation_times": generation_times,
+        "querying": querying,
+        "precisions": precisions,
+        "recalls": recalls,
+        "correct": correct,
+        "chat": {
+            "messages_written": len(write_times),
+            "write_time": describe(write_times) if write_times else None,
+            "chats_listed": len(chats),
+            "list_time": list_time,
+        },
+    }
+
+
+def grade(accuracy):
+    if accuracy >= 0.95:
+        return "A+ (Excellent)"
+    if accuracy >= 0.85:
+        return "A (Very Good)"
+    if accuracy >= 0.7:
+        return "B (Good)"
+    return "C (Needs Improvement)"
+
+
+def improvement(baseline, value, lower_is_better=True):
+    """Percent improvement over a baseline value, or None without a baseline"""
+    if baseline in (None, 0) or value is None:
+        return None
+    change = (baseline - value) / baseline * 100
+    return change if lower_is_better else -change
+
+
+def build_reports(result, args, generated_at, baseline):
+    processing = describe(result["file_times"])
+    response = describe(result["response_times"])
+    total_processing = sum(result["file_times"])
+    files = result["documents"]
+    queries = len(result["response_times"])
+    context_time = statistics.mean(result["context_times"])
+    generation_time = statistics.mean(result["generation_times"])
+    precision = statistics.mean(result["precisions"])
+    recall = statistics.mean(result["recalls"])
+    f1_score = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    accuracy = result["correct"] / queries
+    ingestion, querying = result["ingestion"], result["querying"]
+
+    baseline_processing = baseline_response = baseline_accuracy = None
+    if baseline:
+        baseline_processing = baseline["processing_efficiency"]["processing_time"]["average"]
+        baseline_response = baseline["query_efficiency"]["response_time"]["average"]
+        baseline_accuracy = baseline["accuracy_metrics"]["accuracy"]["overall_accuracy"]
+    processing_improvement = improvement(baseline_processing, processing["average"])
+    response_improvement = improvement(baseline_response, response["average"])
+    accuracy_improvement = improvement(baseline_accuracy, accuracy, lower_is_better=False)
+    gains = [value for value in (processing_improvement, response_improvement, accuracy_improvement) if value is not None]
+    overall_gain = statistics.mean(gains) if gains else None
+
+    recommendations = []
+    if response["coefficient_of_variation"] > 15:
+        recommendations.append("Query latency varies widely; check for lock contention or index reloads")
+    if accuracy < 0.85:
+        recommendations.append("Top-1 retrieval accuracy is below 85%; review chunking and hybrid search weights")
+    if processing_improvement is not None and processing_improvement < -args.max_regression:
+        recommendations.append(f"Ingestion is {-processing_improvement:.1f}% slower than the baseline")
+    if response_improvement is not None and response_improvement < -args.max_regression:
+        recommendations.append(f"Query response is {-response_improvement:.1f}% slower than the baseline")
+
+    metadata = {
+        "version": REPORT_VERSION,
+        "system": SYSTEM_NAME,
+        "corpus_documents": files,
+        "queries": queries,
+        "k": args.k,
+        "seed": args.seed,
+        "gemini": f"local stand-in ({args.gemini_latency_ms} ms)",
+        "embed_model": os.getenv("EMBED_MODEL_NAME"),
+        "baseline": args.baseline,
+    }
+    comprehensive = {
+        "report_metadata": dict({"generated_at": generated_at}, **metadata),
+        "processing_efficiency": {
+            "processing_time": {name: processing[name] for name in
+                                ("average", "std_deviation", "median", "min", "max", "coefficient_of_variation")},
+            "throughput": {
+                "files_per_second": files / total_processing,
+                "files_per_minute": files / total_processing * 60,
+                "mb_per_second": result["total_size_mb"] / total_processing,
+                "pages_per_second": None,
+            },
+            "resource_usage": {
+                "avg_memory_mb": ingestion.avg_memory_mb,
+                "avg_cpu_percent": ingestion.cpu_percent,
+                "memory_efficiency_ratio": result["total_size_mb"] / ingestion.avg_memory_mb,
+            },
+            "scalability": {
+                "total_files_processed": files,
+                "total_size_mb": result["total_size_mb"],
+                "processing_consistency": 100 - processing["coefficient_of_variation"],
+            },
+        },
+        "query_efficiency": {
+            "response_time": {name: response[name] for name in
+                              ("average", "std_deviation", "p95", "p99", "coefficient_of_variation")},
+            "component_analysis": {
+                "context_retrieval_time": context_time,
+                "generation_time": generation_time,
+                "context_ratio": context_time / response["average"],
+                "generation_ratio": generation_time / response["average"],
+            },
+            "throughput": {
+                "queries_per_second": 1 / response["average"],
+                "queries_per_minute": 60 / response["average"],
+            },
+            "resource_usage": {
+                "avg_memory_mb": querying.avg_memory_mb,
+                "avg_cpu_percent": querying.cpu_percent,
+            },
+            "consistency": {
+                "response_consistency": 100 - response["coefficient_of_variation"],
+                "performance_stability": "high" if response["coefficient_of_variation"] < 5
+                else "medium" if response["coefficient_of_variation"] < 15 else "low",
+            },
+        },
+        "accuracy_metrics": {
+            "accuracy": {
+                "overall_accuracy": accuracy,
+                "correct_answers": result["correct"],
+                "incorrect_answers": queries - result["correct"],
+                "error_rate": 1 - accuracy,
+            },
+            "quality_metrics": {
+                "precision": {"average": precision, "std_deviation": statistics.pstdev(result["precisions"])},
+                "recall": {"average": recall, "std_deviation": statistics.pstdev(result["recalls"])},
+                "f1_score": {"average": f1_score},
+            },
+            "performance_grade": grade(accuracy),
+        },
+        "comparative_analysis": {
+            "improvements": {
+                "processing_time_improvement": processing_improvement,
+                "response_time_improvement": response_improvement,
+                "accuracy_improvement": accuracy_improvement,
+            },
+            "overall_efficiency_gain": overall_gain,
+            "performance_rating": None,
+        },
+        "cost_benefit_analysis": {
+            "time_savings": {
+                "file_processing_improvement": None,
+                "query_processing_improvement": None,
+                "hours_saved_per_day": None,
+            },
+            "cost_savings": {"daily_savings": None, "monthly_savings": None, "annual_savings": None},
+            "roi": {"roi_percentage": None, "payback_period_months": None, "system_cost": None},
+            "efficiency_rating": None,
+        },
+        "chat_persistence": result["chat"],
+        "summary": {
+            "key_metrics": {
+                "files_processed_per_second": files / total_processing,
+                "queries_processed_per_second": 1 / response["average"],
+                "overall_accuracy": accuracy,
+                "average_response_time": response["average"],
+            },
+            "performance_highlights": [
+                f"Processes {files / total_processing:.2f} files per second",
+                f"Handles {1 / response['average']:.2f} queries per second",
+                f"Achieves {accuracy * 100:.1f}% accuracy",
+                f"Responds in {response['average']:.2f} seconds on average",
+            ],
+            "recommendations": recommendations,
+        },
+    }
+    simple = {
+        "benchmark_metadata": dict({"timestamp": generated_at}, **metadata),
+        "document_processing": {
+            "total_documents": files,
+            "total_size_kb": result["total_size_mb"] * 1024,
+            "total_time": total_processing,
+            "average_time": processing["average"],
+            "std_deviation": processing["std_deviation"],
+            "files_per_second": files / total_processing,
+            "kb_per_second": result["total_size_mb"] * 1024 / total_processing,
+            "pages_per_second": None,
+        },
+        "query_response": {
+            "total_queries": queries,
+            "total_time": sum(result["response_times"]),
+            "average_response_time": response["average"],
+            "average_context_time": context_time,
+            "average_generation_time": generation_time,
+            "queries_per_second": queries / sum(result["response_times"]),
+            "response_consistency": 100 - response["coefficient_of_variation"],
+        },
+        "accuracy_metrics": {
+            "total_queries": queries,
+            "correct_answers": result["correct"],
+            "overall_accuracy": accuracy,
+            "precision": precision,
+            "recall": recall,
+            "f1_score": f1_score,
+            "error_rate": 1 - accuracy,
+        },
+        "efficiency_improvements": {
+            "document_processing_improvement": processing_improvement,
+            "query_response_improvement": response_improvement,
+            "accuracy_improvement": accuracy_improvement,
+            "overall_efficiency_gain": overall_gain,
+        },
+        "cost_benefit_analysis": {
+            "hours_saved_per_day": None,
+            "daily_cost_savings": None,
+            "annual_cost_savings": None,
+            "roi_percentage": None,
+            "payback_period_months": None,
+        },
+        "performance_summary": {
+            "files_per_second": files / total_processing,
+            "queries_per_second": queries / sum(result["response_times"]),
+            "average_response_time": response["average"],
+            "overall_accuracy": accuracy,
+            "performance_grade": grade(accuracy),
+        },
+    }
+    regressed = any(value is not None and value < -args.max_regression
+                    for value in (processing_improvement, response_improvement))
+    return comprehensive, simple, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="20,100,500", help="comma-separated corpus sizes (documents)")
+    parser.add_argument("--queries", type=int, default=50, help="queries per corpus size (at most one per document)")
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--gemini-latency-ms", type=float, default=0, help="fixed latency of the Gemini stand-in")
+    parser.add_argument("--chat-messages", type=int, default=200, help="messages written in the chat persistence phase")
+    parser.add_argument("--workdir", help="data directory for the run (default: a temporary directory)")
+    parser.add_argument("--output-dir", default=os.path.join(SERVER_DIR, "benchmark_results"))
+    parser.add_argument("--simple-output-dir", default=os.path.join(SERVER_DIR, "simple_benchmark_results"))
+    parser.add_argument("--baseline", help="comprehensive report to compare against (same corpus size)")
+    parser.add_argument("--max-regression", type=float, default=10.0,
+                        help="with --baseline, exit 1 if ingestion or query time is this many percent worse")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    output_dir, simple_output_dir = os.path.abspath(args.output_dir), os.path.abspath(args.simple_output_dir)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # The server reads its paths from the environment at import time, and keeps
+    # chats and tokens.db relative to the working directory
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="rag_benchmark_"))
+    os.makedirs(workdir, exist_ok=True)
+    os.environ.update({
+        "DATA_DIR": workdir,
+        "INDEX_PATH": os.path.join(workdir, "faiss_index.bin"),
+        "METADATA_PATH": os.path.join(workdir, "metadata.json"),
+        "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "benchmark"),
+    })
+    os.environ.setdefault("EMBED_MODEL_NAME", "all-MiniLM-L6-v2")
+    os.chdir(workdir)
+    print(f"Benchmark data directory: {workdir}")
+
+    import app as app_module
+    from rag_utils import models
+    from db_utils import db_helper, metadata_db
+    stand_in = StandInGemini(args.gemini_latency_ms)
+    models._gemini_client = stand_in
+
+    if not db_helper.user_exists("benchmark@example.com"):
+        db_helper.create_user("benchmark@example.com", "benchmark", "teacher")
+    user_id = str(db_helper.get_user_id("benchmark@example.com"))
+    client = app_module.app.test_client()
+    # Load models and indexes first so the first measured request does not pay for them
+    app_module.doc_search.warm_up()
+
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(simple_output_dir, exist_ok=True)
+    regressed = False
+    print(f"\n{'docs':>6} {'ingest s/file':>14} {'query s':>9} {'p95 s':>8} {'context s':>10} {'accuracy':>9} {'recall':>7}")
+    for size in sizes:
+        corpus, queries = build_corpus(size, args.seed)
+        queries = queries[:: max(1, size // args.queries)][:args.queries]
+        result = run_size(app_module, metadata_db, client, stand_in, corpus, queries, args.k, user_id, args.chat_messages)
+        generated_at = datetime.now()
+        comprehensive, simple, size_regressed = build_reports(result, args, generated_at.isoformat(), baseline)
+        regressed = regressed or size_regressed
+        stamp = generated_at.strftime("%Y%m%d_%H%M%S")
+        with open(os.path.join(output_dir, f"comprehensive_benchmark_report_{stamp}_{size}docs.json"), "w") as f:
+            json.dump(comprehensive, f, indent=2)
+        with open(os.path.join(simple_output_dir, f"simple_benchmark_{stamp}_{size}docs.json"), "w") as f:
+            json.dump(simple, f, indent=2)
+        response = comprehensive["query_efficiency"]["response_time"]
+        print(f"{size:>6} {comprehensive['processing_efficiency']['processing_time']['average']:14.4f} "
+              f"{response['average']:9.4f} {response['p95']:8.4f} "
+              f"{comprehensive['query_efficiency']['component_analysis']['context_retrieval_time']:10.4f} "
+              f"{comprehensive['accuracy_metrics']['accuracy']['overall_accuracy']:9.3f} "
+              f"{comprehensive['accuracy_metrics']['quality_metrics']['recall']['average']:7.3f}")
+
+    print(f"\nReports written to {output_dir} and {simple_output_dir}")
+    if regressed:
+        print(f"Regression of more than {args.max_regression}% against {args.baseline}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Offline retrieval quality and latency evaluation for folder search.
+
+Re-indexes a set of documents at each --chunk-sizes value in a scratch data
+directory, then runs every labelled query against each retrieval method at
+each --k and reports recall@k, MRR and p50/p95/p99 latency:
+
+  hybrid   DocSearch.get_folder_hits, the production path behind
+           get_folder_context (exact FAISS + BM25, reciprocal rank fusion);
+           its latency includes embedding the query
+  flat     exact FAISS search alone (faiss.IndexFlatL2)
+  hnsw     approximate FAISS search (faiss.IndexHNSWFlat, --hnsw-m, --hnsw-ef)
+  ivf      approximate FAISS search (faiss.IndexIVFFlat, sqrt(n) lists, --ivf-nprobe)
+  lexical  BM25 alone
+
+flat, hnsw and ivf time the index search only; the "embed" line gives the
+query embedding latency to add to them.
+
+Documents come from an existing folder (--folder USER_ID/FOLDER_ID, read
+from --source-data-dir, default DATA_DIR) with a --labels file, or from the
+seeded synthetic corpus of rag_benchmark.py (--synthetic N), which labels
+itself. Labels are JSON lines:
+
+    {"query": "...", "relevant_text": ["snippet", ...], "relevant_files": ["file id", ...]}
+
+A retrieved chunk is relevant if it contains one of the snippets (case and
+whitespace are ignored) or belongs to one of the files, so the labels stay
+valid across chunk sizes. recall@k is the share of a query's snippets and
+files found in its top k.
+
+Run from the server directory:
+    python benchmarks/retrieval_eval.py --synthetic 200 [--chunk-sizes 500,1000,2000] [--k 5,10,20]
+    python benchmarks/retrieval_eval.py --folder 1/<folder id> --labels labels.jsonl [--output eval.json]
+"""
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import tempfile
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+from rag_benchmark import build_corpus, percentile
+from rag_utils import vector_store
+from rag_utils.models import get_embedder
+
+METHODS = ("hybrid", "flat", "hnsw", "ivf", "lexical")
+EVAL_USER_ID = "eval"
+
+
+def normalize(text):
+    return " ".join(text.lower().split())
+
+
+def load_folder_documents(data_dir, folder):
+    """Rebuild each live file's text from a folder store; folder chunks do not overlap, so joining them is lossless"""
+    user_id, folder_id = folder.split("/", 1)
+    prefix = os.path.join(data_dir, "vector_dbs", f"{user_id}_{folder_id}")
+    if not vector_store.store_exists(prefix):
+        raise SystemExit(f"No folder vector store at {prefix}")
+    store = vector_store.FolderVectorStore(prefix)
+    chunks = {}
+    for pos in range(store.ntotal):
+        if not store.is_deleted(pos):
+            entry = store.chunk(pos)
+            chunks.setdefault(entry["file_id"], []).append((entry["chunk_index"], entry["chunk_text"]))
+    return [(file_id, "".join(text for _, text in sorted(file_chunks))) for file_id, file_chunks in chunks.items()]
+
+
+def load_labels(path):
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                label = json.loads(line)
+                if not label.get("relevant_text") and not label.get("relevant_files"):
+                    raise SystemExit(f"Label without relevant_text or relevant_files: {line.strip()}")
+                labels.append(label)
+    return labels
+
+
+def score(label, hits):
+    """Return (recall, reciprocal rank) of hits, a ranked list of (file_id, chunk_text)"""
+    snippets = [normalize(snippet) for snippet in label.get("relevant_text", [])]
+    files = set(label.get("relevant_files", []))
+    found = set()
+    first_rank = None
+    for rank, (file_id, text) in enumerate(hits, 1):
+        text = normalize(text)
+        matched = {("text", snippet) for snippet in snippets if snippet in text}
+        if file_id in files:
+            matched.add(("file", file_id))
+        if matched and first_rank is None:
+            first_rank = rank
+        found |= matched
+    return len(found) / (len(snippets) + len(files)), 1 / first_rank if first_rank else 0.0
+
+
+def build_faiss_index(method, vectors, args):
+    import faiss
+    dim = vectors.shape[1]
+    if method == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif method == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, args.hnsw_m)
+        index.hnsw.efSearch = args.hnsw_ef
+    else:
+        nlist = max(1, int(math.sqrt(len(vectors))))
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        index.train(vectors)
+        index.nprobe = min(args.ivf_nprobe, nlist)
+    index.add(vectors)
+    return index
+
+
+def summarize(latencies, recalls, reciprocal_ranks):
+    return {
+        "recall": float(np.mean(recalls)) if recalls else None,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def evaluate_chunk_size(doc_search, file_service, lexical_index, documents, labels, chunk_size, args):
+    folder_id = f"eval_chunks{chunk_size}"
+    prefix = file_service.get_folder_vector_store_prefix(EVAL_USER_ID, folder_id)
+    vector_store.delete_store(prefix)
+    lexical_index.drop_index(file_service.get_folder_lexical_index_path(EVAL_USER_ID, folder_id))
+
+    start = time.perf_counter()
+    for file_id, text in documents:
+        start_pos, _ = file_service.add_to_vector_db(EVAL_USER_ID, folder_id, file_id, text, chunk_size)
+        if start_pos is None:
+            raise SystemExit(f"Indexing {file_id} failed")
+    index_time = time.perf_counter() - start
+    store = vector_store.open_store(prefix)
+    vectors = np.ascontiguousarray(store.vectors())
+    print(f"\nchunk size {chunk_size}: {store.ntotal} chunks, indexed in {index_time:.1f}s")
+
+    embedder = get_embedder(file_service.FOLDER_EMBED_MODEL_NAME)
+    query_embeddings, embed_latencies = [], []
+    for label in labels:
+        start = time.perf_counter()
+        query_embeddings.append(np.asarray(embedder.encode([doc_search.enhance_query(label["query"])]), dtype="float32"))
+        embed_latencies.append(time.perf_counter() - start)
+    lexical = lexical_index.load_index(file_service.get_folder_lexical_index_path(EVAL_USER_ID, folder_id))
+
+    results = [dict({"chunk_size": chunk_size, "method": "embed", "k": None, "chunks": store.ntotal},
+                    **summarize(embed_latencies, [], []))]
+    for method in args.methods:
+        index = build_faiss_index(method, vectors, args) if method in ("flat", "hnsw", "ivf") else None
+        for k in args.k:
+            latencies, recalls, reciprocal_ranks = [], [], []
+            for label, query_embedding in zip(labels, query_embeddings):
+                if method == "hybrid":
+                    start = time.perf_counter()
+                    hits = doc_search.get_folder_hits(label["query"], folder_id, EVAL_USER_ID, k)
+                    latencies.append(time.perf_counter() - start)
+                    hits = [(hit["doc_id"], hit["text"]) for hit in hits]
+                else:
+                    start = time.perf_counter()
+                    if method == "lexical":
+                        positions = [pos for pos, _ in lexical.search(label["query"], k)]
+                    else:
+                        positions = [int(pos) for pos in index.search(query_embedding, k)[1][0] if pos >= 0]
+                    latencies.append(time.perf_counter() - start)
+                    hits = [(entry["file_id"], entry["chunk_text"]) for entry in map(store.chunk, positions)]
+                recall, reciprocal_rank = score(label, hits)
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+            results.append(dict({"chunk_size": chunk_size, "method": method, "k": k, "chunks": store.ntotal},
+                                **summarize(latencies, recalls, reciprocal_ranks)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--folder", help="USER_ID/FOLDER_ID of an existing folder (needs --labels)")
+    source.add_argument("--synthetic", type=int, help="use N seeded synthetic documents with generated labels")
+    parser.add_argument("--labels", help="JSON lines of labelled queries")
+    parser.add_argument("--source-data-dir", default=os.getenv("DATA_DIR", "."), help="data directory of --folder")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-sizes", default="500,1000,2000", help="comma-separated chunk sizes in characters")
+    parser.add_argument("--k", default="5,10,20", help="comma-separated k values")
+    parser.add_argument("--methods", default=",".join(METHODS), help=f"comma-separated subset of {','.join(METHODS)}")
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--hnsw-ef", type=int, default=64)
+    parser.add_argument("--ivf-nprobe", type=int, default=8)
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+    args.k = [int(k) for k in args.k.split(",") if k.strip()]
+    args.methods = [method.strip() for method in args.methods.split(",") if method.strip()]
+    unknown = set(args.methods) - set(METHODS)
+    if unknown:
+        parser.error(f"unknown methods: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output) if args.output else None
+    chunk_sizes = [int(size) for size in args.chunk_sizes.split(",") if size.strip()]
+
+    if args.folder:
+        if not args.labels:
+            parser.error("--folder needs --labels")
+        documents = load_folder_documents(os.path.abspath(args.source_data_dir), args.folder)
+        labels = load_labels(args.labels)
+    else:
+        documents, queries = build_corpus(args.synthetic, args.seed)
+        labels = [{"query": query, "relevant_text": [fact]} for query, _, fact in queries]
+        if args.labels:
+            labels = load_labels(args.labels)
+    print(f"{len(documents)} documents, {len(labels)} labelled queries")
+
+    # Scratch indexes go to their own data directory; the server reads DATA_DIR at import time
+    workdir = tempfile.mkdtemp(prefix="retrieval_eval_")
+    os.environ["DATA_DIR"] = workdir
+    os.chdir(workdir)
+    import app as app_module
+    from routes import file_service
+    from rag_utils import lexical_index
+
+    results = []
+    for chunk_size in chunk_sizes:
+        results.extend(evaluate_chunk_size(app_module.doc_search, file_service, lexical_index,
+                                           documents, labels, chunk_size, args))
+
+    print(f"\n{'chunk':>6} {'method':<8} {'k':>4} {'recall@k':>9} {'MRR':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for row in results:
+        recall = f"{row['recall']:9.3f}" if row["recall"] is not None else f"{'-':>9}"
+        mrr = f"{row['mrr']:6.3f}" if row["mrr"] is not None else f"{'-':>6}"
+        k = row["k"] if row["k"] is not None else "-"
+        print(f"{row['chunk_size']:>6} {row['method']:<8} {k:>4} {recall} {mrr} "
+              f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f}")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"documents": len(documents), "queries": len(labels), "results": results}, f, indent=2)
+        print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
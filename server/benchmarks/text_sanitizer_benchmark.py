@@ -0,0 +1,129 @@
+"""
+Micro-benchmark for routes.text_utils against the previous per-call implementations.
+
+Builds a long synthetic answer key (Unicode punctuation, markdown, LaTeX),
+checks that both implementations produce identical output, and reports the
+time per call and the speedup.
+
+Run from the server directory:
+    python benchmarks/text_sanitizer_benchmark.py [--answers 400] [--repeat 20]
+"""
+import os
+import re
+import sys
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.text_utils import clean_text_for_pdf, preprocess_latex, is_markdown_content, strip_markdown
+
+
+# Implementations as they were before routes.text_utils, kept for comparison
+def legacy_clean_text_for_pdf(text):
+    if not text:
+        return ""
+    replacements = {
+        '\u2013': '-', '\u2014': '--', '\u2018': "'", '\u2019': "'",
+        '\u201c': '"', '\u201d': '"', '\u2026': '...', '\u00a0': ' ',
+    }
+    for unicode_char, ascii_char in replacements.items():
+        text = text.replace(unicode_char, ascii_char)
+    return re.sub(r'[^\x00-\x7F]+', '?', text)
+
+
+def legacy_preprocess_latex(text):
+    def replace_matrix(match):
+        rows = [row.strip() for row in match.group(1).split('\\\\') if row.strip()]
+        html_rows = []
+        for row in rows:
+            cells = [cell.strip() for cell in row.split('&')]
+            html_rows.append(f'<tr>{"".join([f"<td>{cell}</td>" for cell in cells])}</tr>')
+        return f'<table class="matrix-table"><tbody>{"".join(html_rows)}</tbody></table>'
+    text = re.sub(r'\\begin\{pmatrix\}(.*?)\\end\{pmatrix\}', replace_matrix, text, flags=re.DOTALL)
+    text = re.sub(r'\$\$(.*?)\$\$', r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'\$(.*?)\$', r'\1', text, flags=re.DOTALL)
+    latex_commands = {
+        r'\\begin\{.*?\}': '', r'\\end\{.*?\}': '', r'\\\\': '<br>', r'\\&': '&',
+        r'\\%': '%', r'\\#': '#', r'\\_': '_', r'\\{': '{', r'\\}': '}',
+    }
+    for pattern, replacement in latex_commands.items():
+        text = re.sub(pattern, replacement, text)
+    return text
+
+
+def legacy_is_markdown_content(text):
+    patterns = [
+        r'^#{1,6}\s+', r'\*\*.*?\*\*', r'\*.*?\*', r'`.*?`', r'```.*?```', r'^\s*[-*+]\s+',
+        r'^\s*\d+\.\s+', r'^\s*>\s+', r'\[.*?\]\(.*?\)', r'^\|.*\|$', r'\$\$.*?\$\$', r'\$.*?\$',
+        r'\\begin\{.*?\}', r'\\end\{.*?\}', r'\\[a-zA-Z]+\{.*?\}',
+    ]
+    for pattern in patterns:
+        if re.search(pattern, text, re.MULTILINE | re.DOTALL):
+            return True
+    return False
+
+
+def legacy_strip_markdown(message):
+    plain_text = re.sub(r'#{1,6}\s+', '', message)
+    plain_text = re.sub(r'\*\*(.*?)\*\*', r'\1', plain_text)
+    plain_text = re.sub(r'\*(.*?)\*', r'\1', plain_text)
+    plain_text = re.sub(r'`(.*?)`', r'\1', plain_text)
+    plain_text = re.sub(r'```.*?```', '', plain_text, flags=re.DOTALL)
+    plain_text = re.sub(r'^\s*[-*+]\s+', '- ', plain_text, flags=re.MULTILINE)
+    plain_text = re.sub(r'^\s*\d+\.\s+', '1. ', plain_text, flags=re.MULTILINE)
+    plain_text = re.sub(r'^\s*>\s+', '', plain_text, flags=re.MULTILINE)
+    plain_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', plain_text)
+    return plain_text
+
+
+def build_answer_key(answers):
+    """Cells of a long answer key, roughly what one PDF cleans cell by cell"""
+    cells = []
+    for i in range(answers):
+        cells.append(f"Explain the working of a red\u2013black tree insertion (case {i}).")
+        if i % 3 == 0:
+            cells.append(f"The \u201cuncle\u201d node is recoloured \u2014 see Figure {i}\u2026 then rotate about the grandparent.")
+        else:
+            cells.append("Insertion is O(log n) because the tree height is bounded by 2 log2(n + 1). " * 3)
+    return cells
+
+
+def build_email(answers):
+    lines = ["# Answer key summary", ""]
+    for i in range(answers):
+        lines.append(f"{i + 1}. **Question {i}**: the result is $x_{i} = \\frac{{a}}{{b}}$ and `O(log n)`")
+        if i % 10 == 0:
+            lines.append("$$\n\\begin{pmatrix}\n1 & 0 \\\\\n0 & 1\n\\end{pmatrix}\n$$")
+    plain = "Thanks for attending today's class. " * answers
+    return "\n".join(lines), plain
+
+
+def compare(name, legacy, new, inputs, repeat):
+    for value in inputs:
+        if legacy(value) != new(value):
+            raise SystemExit(f"{name}: outputs differ for input {value[:80]!r}")
+    legacy_time = min(timeit.repeat(lambda: [legacy(v) for v in inputs], number=1, repeat=repeat))
+    new_time = min(timeit.repeat(lambda: [new(v) for v in inputs], number=1, repeat=repeat))
+    print(f"{name:<22} legacy {legacy_time * 1000:9.3f} ms   new {new_time * 1000:9.3f} ms   speedup {legacy_time / new_time:6.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answers", type=int, default=400, help="answers in the synthetic answer key")
+    parser.add_argument("--repeat", type=int, default=20, help="timing repetitions (best is reported)")
+    args = parser.parse_args()
+
+    cells = build_answer_key(args.answers)
+    markdown_email, plain_email = build_email(args.answers)
+    print(f"Answer key: {len(cells)} cells, {sum(len(c) for c in cells)} characters; "
+          f"markdown email: {len(markdown_email)} characters")
+
+    compare("clean_text_for_pdf", legacy_clean_text_for_pdf, clean_text_for_pdf, cells, args.repeat)
+    compare("preprocess_latex", legacy_preprocess_latex, preprocess_latex, [markdown_email], args.repeat)
+    compare("is_markdown_content", legacy_is_markdown_content, is_markdown_content, [markdown_email, plain_email], args.repeat)
+    compare("strip_markdown", legacy_strip_markdown, strip_markdown, [markdown_email], args.repeat)
+
+
+if __name__ == "__main__":
+    main()
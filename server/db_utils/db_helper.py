@@ -1,103 +1,141 @@
 import sqlite3
 import json
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import os
 DB_FILE = "tokens.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+
+# A small process-wide pool of connections. The server starts a thread per request,
+# so per-thread connections would still mean a connect (and its PRAGMAs) per request.
+# Pooled connections also keep sqlite3's prepared-statement cache between requests.
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _connect():
+    conn = sqlite3.connect(DB_FILE, timeout=10, cached_statements=64, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                # A forked worker starts with an empty pool instead of sharing the parent's connections
+                _pool = queue.Queue(maxsize=DB_POOL_SIZE)
+                _pool_pid = os.getpid()
+    return _pool
+
+@contextmanager
+def get_connection():
+    """Check a connection out of the pool for the duration of the with block"""
+    pool = _get_pool()
+    try:
+        conn = pool.get_nowait()
+    except queue.Empty:
+        conn = _connect()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS gmail_tokens (
-        user_id TEXT PRIMARY KEY,
-        access_token TEXT,
-        refresh_token TEXT,
-        token_expiry TEXT,
-        scopes TEXT,
-        email TEXT
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-        email TEXT,
-        password TEXT,
-        role TEXT
-    )
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS gmail_tokens (
+            user_id TEXT PRIMARY KEY,
+            access_token TEXT,
+            refresh_token TEXT,
+            token_expiry TEXT,
+            scopes TEXT,
+            email TEXT
+        )
+        """)
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT,
+            password TEXT,
+            role TEXT
+        )
 
-    """)
-    conn.commit()
-    conn.close()
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_gmail_tokens_email ON gmail_tokens(email)")
+        conn.commit()
 
 def save_tokens(user_id, creds, email):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("""
-    INSERT OR REPLACE INTO gmail_tokens (user_id, access_token, refresh_token, token_expiry, scopes, email)
-    VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        user_id,
-        creds.token,
-        creds.refresh_token,
-        creds.expiry.isoformat() if creds.expiry else None,
-        json.dumps(creds.scopes),
-        email
-    ))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        # "with conn" commits, or rolls back so a failed write never leaves the pooled connection mid-transaction
+        with conn:
+            conn.execute("""
+            INSERT OR REPLACE INTO gmail_tokens (user_id, access_token, refresh_token, token_expiry, scopes, email)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                user_id,
+                creds.token,
+                creds.refresh_token,
+                creds.expiry.isoformat() if creds.expiry else None,
+                json.dumps(creds.scopes),
+                email
+            ))
 
 def get_tokens(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM gmail_tokens WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    if not row:
-        return None
-    return {
-        "user_id": row[0],
-        "access_token": row[1],
-        "refresh_token": row[2],
-        "token_expiry": row[3],
-        "scopes": json.loads(row[4]),
-        "email": row[5],
-    }
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM gmail_tokens WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "user_id": row[0],
+            "access_token": row[1],
+            "refresh_token": row[2],
+            "token_expiry": row[3],
+            "scopes": json.loads(row[4]),
+            "email": row[5],
+        }
 
 def user_exists(email):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
-    row = cursor.fetchone()
-    conn.close()
-    return row is not None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1 FROM users WHERE email = ? LIMIT 1", (email,))
+        row = cursor.fetchone()
+        return row is not None
 
 def create_user(email, password, role):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO users (email, password, role) VALUES (?, ?, ?)", (email, password, role))
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        with conn:
+            conn.execute("INSERT INTO users (email, password, role) VALUES (?, ?, ?)", (email, password, role))
 
 def get_user_id(email):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM users WHERE email = ?", (email,))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0]
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM users WHERE email = ?", (email,))
+        row = cursor.fetchone()
+        return row[0]
 
 def get_user(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return row
 
 def get_user_email(user_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("SELECT email FROM users WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    conn.close()
-    return row[0]
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email FROM users WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
+        return row[0]
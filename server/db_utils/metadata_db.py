@@ -0,0 +1,300 @@
+"""
+Folder, file and chunk-span metadata in one SQLite database (folders.db).
+
+    folders      one row per folder, with a maintained file_count and last_updated
+    files        one row per uploaded file; folder_id is NULL for general uploads
+    chunk_spans  which rows of a folder's vector store belong to which file
+
+Writes that touch several tables run in one transaction, so counts never
+drift from the file list. The per-user / per-folder metadata.jsonl files
+used before are imported once on startup.
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+DATA_DIR = os.getenv("DATA_DIR", ".")
+METADATA_DB_PATH = os.path.join(DATA_DIR, "folders.db")
+USER_DIR = os.path.join(DATA_DIR, "users")
+VECTOR_DB_DIR = os.path.join(DATA_DIR, "vector_dbs")
+
+FILE_COLUMNS = ("file_id", "user_id", "folder_id", "file_name", "original_name", "created_at", "file_size", "chunk_count")
+
+_local = threading.local()
+
+
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(METADATA_DB_PATH, timeout=10, cached_statements=64)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def init_metadata_db():
+    """Create the schema and import any legacy JSONL metadata"""
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS folders (
+                folder_id TEXT PRIMARY KEY,
+                folder_name TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                vector_db_name TEXT NOT NULL,
+                file_count INTEGER DEFAULT 0
+            )
+        ''')
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(folders)")}
+        if "last_updated" not in columns:
+            conn.execute("ALTER TABLE folders ADD COLUMN last_updated TEXT")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                file_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                folder_id TEXT REFERENCES folders(folder_id) ON DELETE CASCADE,
+                file_name TEXT NOT NULL,
+                original_name TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                file_size INTEGER DEFAULT 0,
+                chunk_count INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunk_spans (
+                folder_id TEXT NOT NULL REFERENCES folders(folder_id) ON DELETE CASCADE,
+                start_pos INTEGER NOT NULL,
+                chunk_count INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                PRIMARY KEY (folder_id, start_pos)
+            )
+        ''')
+        conn.execute("CREATE TABLE IF NOT EXISTS imported_sources (path TEXT PRIMARY KEY)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_folders_user ON folders(user_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_folders_user_name ON folders(user_id, folder_name)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_user_folder ON files(user_id, folder_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_folder ON files(folder_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_spans_file ON chunk_spans(file_id)")
+    import_legacy_metadata()
+
+
+def _folder_dict(row):
+    return {
+        "folder_id": row["folder_id"],
+        "folder_name": row["folder_name"],
+        "created_at": row["created_at"],
+        "vector_db_name": row["vector_db_name"],
+        "file_count": row["file_count"],
+        "last_updated": row["last_updated"]
+    }
+
+
+def list_folders(user_id):
+    rows = get_connection().execute('''
+        SELECT * FROM folders WHERE user_id = ? ORDER BY created_at DESC
+    ''', (user_id,)).fetchall()
+    return [_folder_dict(row) for row in rows]
+
+
+def get_folder(user_id, folder_id):
+    row = get_connection().execute('''
+        SELECT * FROM folders WHERE folder_id = ? AND user_id = ?
+    ''', (folder_id, user_id)).fetchone()
+    return _folder_dict(row) if row else None
+
+
+def folder_name_exists(user_id, folder_name):
+    return get_connection().execute('''
+        SELECT 1 FROM folders WHERE user_id = ? AND folder_name = ? LIMIT 1
+    ''', (user_id, folder_name)).fetchone() is not None
+
+
+def create_folder(user_id, folder_id, folder_name, created_at, vector_db_name):
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            INSERT INTO folders (folder_id, folder_name, user_id, created_at, vector_db_name, file_count, last_updated)
+            VALUES (?, ?, ?, ?, ?, 0, NULL)
+        ''', (folder_id, folder_name, user_id, created_at, vector_db_name))
+
+
+def delete_folder(user_id, folder_id):
+    """Delete a folder with its file and chunk-span rows; returns the deleted folder or None"""
+    conn = get_connection()
+    with conn:
+        folder = get_folder(user_id, folder_id)
+        if folder:
+            conn.execute("DELETE FROM chunk_spans WHERE folder_id = ?", (folder_id,))
+            conn.execute("DELETE FROM files WHERE folder_id = ? AND user_id = ?", (folder_id, user_id))
+            conn.execute("DELETE FROM folders WHERE folder_id = ? AND user_id = ?", (folder_id, user_id))
+    return folder
+
+
+def add_file(file_record, start_pos=None):
+    """Insert a file row; for folder files also record its chunk span and bump the folder's counters.
+
+    start_pos is the position of the file's first row in the folder's vector store.
+    """
+    record = {column: file_record.get(column) for column in FILE_COLUMNS}
+    record["file_size"] = record["file_size"] or 0
+    record["chunk_count"] = record["chunk_count"] or 0
+    conn = get_connection()
+    with conn:
+        existing = conn.execute('SELECT folder_id FROM files WHERE file_id = ?', (record["file_id"],)).fetchone()
+        conn.execute(f'''
+            INSERT OR REPLACE INTO files ({", ".join(FILE_COLUMNS)})
+            VALUES ({", ".join("?" for _ in FILE_COLUMNS)})
+        ''', tuple(record[column] for column in FILE_COLUMNS))
+        # Re-adding a file_id replaces its row, so it only counts once per folder
+        moved = existing is not None and existing["folder_id"] != record["folder_id"]
+        if moved and existing["folder_id"]:
+            conn.execute('UPDATE folders SET file_count = MAX(file_count - 1, 0) WHERE folder_id = ?',
+                         (existing["folder_id"],))
+        if record["folder_id"]:
+            if start_pos is not None and record["chunk_count"]:
+                conn.execute('''
+                    INSERT OR REPLACE INTO chunk_spans (folder_id, start_pos, chunk_count, file_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (record["folder_id"], start_pos, record["chunk_count"], record["file_id"]))
+            conn.execute('''
+                UPDATE folders SET file_count = file_count + ?,
+                    last_updated = MAX(COALESCE(last_updated, ''), ?)
+                WHERE folder_id = ?
+            ''', (1 if existing is None or moved else 0, record["created_at"], record["folder_id"]))
+
+
+def list_files(user_id, folder_id=None):
+    """Files of a folder, or the user's general (non-folder) files when folder_id is None"""
+    if folder_id is None:
+        rows = get_connection().execute('''
+            SELECT * FROM files WHERE user_id = ? AND folder_id IS NULL ORDER BY created_at
+        ''', (user_id,)).fetchall()
+    else:
+        rows = get_connection().execute('''
+            SELECT * FROM files WHERE user_id = ? AND folder_id = ? ORDER BY created_at
+        ''', (user_id, folder_id)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def get_file(user_id, file_id):
+    row = get_connection().execute('''
+        SELECT * FROM files WHERE file_id = ? AND user_id = ?
+    ''', (file_id, user_id)).fetchone()
+    return dict(row) if row else None
+
+
+def delete_file(user_id, file_id):
+    """Delete a file row (and its chunk spans); returns the deleted row or None"""
+    conn = get_connection()
+    with conn:
+        file_record = get_file(user_id, file_id)
+        if not file_record:
+            return None
+        conn.execute("DELETE FROM chunk_spans WHERE file_id = ?", (file_id,))
+        conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+        if file_record["folder_id"]:
+            conn.execute('''
+                UPDATE folders SET file_count = MAX(file_count - 1, 0),
+                    last_updated = (SELECT MAX(created_at) FROM files WHERE folder_id = ?)
+                WHERE folder_id = ?
+            ''', (file_record["folder_id"], file_record["folder_id"]))
+    return file_record
+
+
+def get_chunk_spans(folder_id, file_id=None):
+    """[(file_id, start_pos, chunk_count)] for a folder, optionally for one file"""
+    if file_id is None:
+        rows = get_connection().execute('''
+            SELECT file_id, start_pos, chunk_count FROM chunk_spans WHERE folder_id = ? ORDER BY start_pos
+        ''', (folder_id,)).fetchall()
+    else:
+        rows = get_connection().execute('''
+            SELECT file_id, start_pos, chunk_count FROM chunk_spans WHERE folder_id = ? AND file_id = ? ORDER BY start_pos
+        ''', (folder_id, file_id)).fetchall()
+    return [tuple(row) for row in rows]
+
+
+def replace_chunk_spans(folder_id, spans):
+    """Replace a folder's chunk spans, e.g. after its vector store was compacted"""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM chunk_spans WHERE folder_id = ?", (folder_id,))
+        conn.executemany('''
+            INSERT INTO chunk_spans (folder_id, start_pos, chunk_count, file_id)
+            VALUES (?, ?, ?, ?)
+        ''', [(folder_id, start_pos, count, file_id) for file_id, start_pos, count in spans])
+
+
+def _read_file_rows(metadata_path):
+    rows = []
+    with open(metadata_path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                # Only file-level metadata (has file_name field); old folders also held chunk rows
+                if "file_name" in entry:
+                    rows.append(entry)
+    return rows
+
+
+def _import_source(conn, metadata_path, user_id, folder_id=None):
+    rows = _read_file_rows(metadata_path)
+    for entry in rows:
+        entry = dict(entry, user_id=user_id, folder_id=folder_id)
+        entry["original_name"] = entry.get("original_name") or entry["file_name"]
+        entry["created_at"] = entry.get("created_at") or datetime.now().isoformat()
+        entry["file_size"] = entry.get("file_size") or 0
+        entry["chunk_count"] = entry.get("chunk_count") or 0
+        conn.execute(f'''
+            INSERT OR IGNORE INTO files ({", ".join(FILE_COLUMNS)})
+            VALUES ({", ".join("?" for _ in FILE_COLUMNS)})
+        ''', tuple(entry.get(column) for column in FILE_COLUMNS))
+    if folder_id:
+        prefix = os.path.join(VECTOR_DB_DIR, f"{user_id}_{folder_id}")
+        from rag_utils import vector_store
+        if vector_store.store_exists(prefix):
+            for file_id, start_pos, count in vector_store.open_store(prefix).file_spans():
+                conn.execute('''
+                    INSERT OR IGNORE INTO chunk_spans (folder_id, start_pos, chunk_count, file_id)
+                    VALUES (?, ?, ?, ?)
+                ''', (folder_id, start_pos, count, file_id))
+        conn.execute('''
+            UPDATE folders SET
+                file_count = (SELECT COUNT(*) FROM files WHERE folder_id = ?),
+                last_updated = (SELECT MAX(created_at) FROM files WHERE folder_id = ?)
+            WHERE folder_id = ?
+        ''', (folder_id, folder_id, folder_id))
+    conn.execute("INSERT INTO imported_sources (path) VALUES (?)", (metadata_path,))
+    return len(rows)
+
+
+def import_legacy_metadata():
+    """Import users/<id>/metadata.jsonl and users/<id>/folders/<fid>/metadata.jsonl once each"""
+    if not os.path.isdir(USER_DIR):
+        return
+    conn = get_connection()
+    imported = {row["path"] for row in conn.execute("SELECT path FROM imported_sources")}
+    known_folders = {row["folder_id"] for row in conn.execute("SELECT folder_id FROM folders")}
+    for user_id in os.listdir(USER_DIR):
+        sources = [(os.path.join(USER_DIR, user_id, "metadata.jsonl"), None)]
+        folders_dir = os.path.join(USER_DIR, user_id, "folders")
+        if os.path.isdir(folders_dir):
+            # Folders deleted from folders.db keep no file rows
+            sources += [(os.path.join(folders_dir, folder_id, "metadata.jsonl"), folder_id)
+                        for folder_id in os.listdir(folders_dir) if folder_id in known_folders]
+        for metadata_path, folder_id in sources:
+            if metadata_path in imported or not os.path.exists(metadata_path):
+                continue
+            try:
+                with conn:
+                    count = _import_source(conn, metadata_path, user_id, folder_id)
+                print(f"Imported {count} file records from {metadata_path}")
+            except Exception as e:
+                print(f"Error importing {metadata_path}: {str(e)}")
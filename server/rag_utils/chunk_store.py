@@ -0,0 +1,165 @@
+"""
+Compact columnar chunk table.
+
+Instead of one dict per chunk (repeated keys, repeated UUID strings), chunks
+are stored as four int32 columns plus a separate UTF-8 text blob:
+
+    offset, length   -> slice of the text blob
+    chunk_index      -> position of the chunk inside its document
+    doc_ref          -> index into the interned document id table
+
+On disk a table is a single file (header, id table, columns, text blob)
+that is loaded with one buffer read.
+"""
+import os
+import sys
+import struct
+import numpy as np
+
+CHUNK_RECORD_DTYPE = np.dtype([
+    ("offset", "<i4"),
+    ("length", "<i4"),
+    ("chunk_index", "<i4"),
+    ("doc_ref", "<i4"),
+])
+MAX_TEXT_BYTES = 2 ** 31 - 1  # offsets are int32
+
+_MAGIC = b"CHUNKTB1"
+_HEADER = struct.Struct("<8sqqq")  # magic, row count, id table bytes, text bytes
+
+
+def build_records(encoded_chunks, text_offset, doc_ref):
+    """Column records for one document's chunks appended at text_offset"""
+    lengths = np.array([len(e) for e in encoded_chunks], dtype="int64")
+    end = text_offset + int(lengths.sum())
+    if end > MAX_TEXT_BYTES:
+        raise ValueError(f"Chunk text blob would grow to {end} bytes, above the int32 offset limit")
+    records = np.zeros(len(encoded_chunks), dtype=CHUNK_RECORD_DTYPE)
+    records["offset"] = text_offset + np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    records["length"] = lengths
+    records["chunk_index"] = np.arange(len(encoded_chunks))
+    records["doc_ref"] = doc_ref
+    return records
+
+
+class ChunkTable:
+    __slots__ = ("doc_ids", "_doc_refs", "records", "text")
+
+    def __init__(self):
+        self.doc_ids = []
+        self._doc_refs = {}
+        self.records = np.empty(0, dtype=CHUNK_RECORD_DTYPE)
+        self.text = bytearray()
+
+    def __len__(self):
+        return len(self.records)
+
+    def intern_doc_id(self, doc_id):
+        ref = self._doc_refs.get(doc_id)
+        if ref is None:
+            ref = len(self.doc_ids)
+            self.doc_ids.append(sys.intern(doc_id))
+            self._doc_refs[doc_id] = ref
+        return ref
+
+    def append(self, doc_id, chunks):
+        """Append a document's chunks; returns the row of the first new chunk"""
+        start = len(self.records)
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        if encoded:
+            new_records = build_records(encoded, len(self.text), self.intern_doc_id(doc_id))
+            self.records = np.concatenate((self.records, new_records))
+            self.text += b"".join(encoded)
+        return start
+
+    def chunk(self, pos):
+        """Return {"doc_id", "chunk_index", "chunk_text"} for row pos"""
+        record = self.records[pos]
+        offset, length = int(record["offset"]), int(record["length"])
+        return {
+            "doc_id": self.doc_ids[record["doc_ref"]],
+            "chunk_index": int(record["chunk_index"]),
+            "chunk_text": self.text[offset:offset + length].decode("utf-8"),
+        }
+
+    def rows_for_doc(self, doc_id):
+        """Row positions holding doc_id's chunks"""
+        ref = self._doc_refs.get(doc_id)
+        if ref is None:
+            return np.empty(0, dtype="int64")
+        return np.flatnonzero(self.records["doc_ref"] == ref)
+
+    def remove_rows(self, rows):
+        """Drop rows; later rows move up so positions keep matching a FAISS index after remove_ids.
+
+        The removed chunks' text stays in the blob as garbage until compact().
+        """
+        self.records = np.delete(self.records, rows)
+
+    @property
+    def garbage_bytes(self):
+        return len(self.text) - int(self.records["length"].sum())
+
+    def compact(self):
+        """Rewrite the text blob and id table without removed chunks; returns bytes reclaimed"""
+        before = len(self.text)
+        live_refs = np.unique(self.records["doc_ref"])
+        ref_map = np.full(len(self.doc_ids), -1, dtype="int32")
+        ref_map[live_refs] = np.arange(len(live_refs), dtype="int32")
+        text = bytearray()
+        records = self.records.copy()
+        for i, (offset, length) in enumerate(zip(records["offset"].tolist(), records["length"].tolist())):
+            records["offset"][i] = len(text)
+            text += self.text[offset:offset + length]
+        records["doc_ref"] = ref_map[records["doc_ref"]]
+        doc_ids = [self.doc_ids[ref] for ref in live_refs]
+        self.doc_ids = doc_ids
+        self._doc_refs = {doc_id: ref for ref, doc_id in enumerate(doc_ids)}
+        self.records = records
+        self.text = text
+        return before - len(text)
+
+    def reset(self):
+        self.__init__()
+
+    def save(self, path):
+        ids_blob = "\n".join(self.doc_ids).encode("utf-8")
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(self.records), len(ids_blob), len(self.text)))
+            f.write(ids_blob)
+            f.write(self.records.tobytes())
+            f.write(self.text)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, rows, ids_size, text_size = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a chunk table")
+        table = cls()
+        pos = _HEADER.size
+        if ids_size:
+            for doc_id in data[pos:pos + ids_size].decode("utf-8").split("\n"):
+                table.intern_doc_id(doc_id)
+        pos += ids_size
+        table.records = np.frombuffer(data, dtype=CHUNK_RECORD_DTYPE, count=rows, offset=pos)
+        pos += rows * CHUNK_RECORD_DTYPE.itemsize
+        table.text = bytearray(data[pos:pos + text_size])
+        return table
+
+    @classmethod
+    def from_legacy_metadata(cls, metadata):
+        """Build a table from the old list-of-dicts metadata ({"doc_id", "chunk_id", "chunk_text"})"""
+        table = cls()
+        start = 0
+        while start < len(metadata):
+            doc_id = metadata[start]["doc_id"]
+            end = start
+            while end < len(metadata) and metadata[end]["doc_id"] == doc_id:
+                end += 1
+            table.append(doc_id, [entry["chunk_text"] for entry in metadata[start:end]])
+            start = end
+        return table
@@ -0,0 +1,133 @@
+"""
+Token-aware context packing for retrieved chunks.
+
+Retrieval hits are dicts with at least:
+    {"doc_id": str, "chunk_index": int, "text": str, "distance": float}
+
+pack_context() removes near-duplicate chunks (MinHash over word shingles),
+merges chunks that are adjacent in the same document into one block and
+then fills a token budget in score order (lowest distance first, or the
+order the hits were given in when they have already been reranked).
+"""
+import re
+import zlib
+import numpy as np
+
+CHARS_PER_TOKEN = 4
+DEFAULT_TOKEN_BUDGET = 6000
+DEFAULT_DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1234)
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=(NUM_PERMUTATIONS, 1)).astype(np.int64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=(NUM_PERMUTATIONS, 1)).astype(np.int64)
+_WORD_RE = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)"""
+    if not text:
+        return 0
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def minhash_signature(text):
+    """MinHash signature of the text's word shingles"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.int64, count=len(shingles))
+    return ((_PERM_A * hashes + _PERM_B) % _MERSENNE_PRIME).min(axis=1)
+
+
+def deduplicate_hits(hits, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Drop hits whose estimated Jaccard similarity to a better hit is >= threshold.
+
+    hits must already be sorted best-first.
+    """
+    kept = []
+    signatures = []
+    for hit in hits:
+        signature = minhash_signature(hit["text"])
+        if any(np.mean(signature == other) >= threshold for other in signatures):
+            continue
+        kept.append(hit)
+        signatures.append(signature)
+    return kept
+
+
+def join_overlapping(left, right, max_overlap):
+    """Concatenate two neighbouring chunks without repeating their shared overlap"""
+    for size in range(min(len(left), len(right), max_overlap), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+
+def merge_adjacent_hits(hits, max_overlap=0):
+    """Merge runs of consecutive chunks from the same document into single blocks.
+
+    Each merged block keeps the best (lowest) distance and rank of its members.
+    """
+    by_doc = {}
+    for hit in hits:
+        by_doc.setdefault(hit["doc_id"], []).append(hit)
+
+    blocks = []
+    for doc_hits in by_doc.values():
+        doc_hits.sort(key=lambda h: h["chunk_index"])
+        current = None
+        for hit in doc_hits:
+            if current and hit["chunk_index"] == current["last_index"] + 1:
+                current["text"] = join_overlapping(current["text"], hit["text"], max_overlap)
+                current["last_index"] = hit["chunk_index"]
+                current["distance"] = min(current["distance"], hit["distance"])
+                current["rank"] = min(current["rank"], hit.get("rank", 0))
+            else:
+                current = {
+                    "doc_id": hit["doc_id"],
+                    "chunk_index": hit["chunk_index"],
+                    "last_index": hit["chunk_index"],
+                    "text": hit["text"],
+                    "distance": hit["distance"],
+                    "rank": hit.get("rank", 0),
+                }
+                blocks.append(current)
+    return blocks
+
+
+def pack_context(hits, token_budget=DEFAULT_TOKEN_BUDGET, max_overlap=0,
+                 duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD, preserve_order=False):
+    """Select, merge and order retrieved chunks so they fit in token_budget.
+
+    Hits are ranked by distance unless preserve_order is set, in which case
+    the given order is taken as the ranking (e.g. after reranking).
+    Returns a list of context strings, best first.
+    """
+    if not hits:
+        return []
+    hits = [h for h in hits if h.get("text")]
+    if not preserve_order:
+        hits.sort(key=lambda h: h["distance"])
+    hits = [dict(h, rank=rank) for rank, h in enumerate(hits)]
+    hits = deduplicate_hits(hits, duplicate_threshold)
+    blocks = sorted(merge_adjacent_hits(hits, max_overlap), key=lambda b: b["rank"])
+
+    packed = []
+    used_tokens = 0
+    for block in blocks:
+        tokens = estimate_tokens(block["text"])
+        if used_tokens + tokens <= token_budget:
+            packed.append(block["text"])
+            used_tokens += tokens
+        elif not packed:
+            # Never return an empty context because the best block is too large
+            packed.append(block["text"][:token_budget * CHARS_PER_TOKEN])
+            used_tokens = token_budget
+        if used_tokens >= token_budget:
+            break
+    return packed
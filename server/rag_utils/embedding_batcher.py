@@ -0,0 +1,120 @@
+"""
+Micro-batching for query embeddings.
+
+Request threads submit their texts and wait on a Future; one encoder thread
+per process collects whatever arrives within EMBED_BATCH_MAX_WAIT_MS (or
+until EMBED_BATCH_MAX_ITEMS texts are queued) and encodes them in a single
+forward pass. Under concurrent load this replaces many one-query passes
+competing for the CPU with a few batched ones; an idle server only pays the
+short wait.
+"""
+import os
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+
+from rag_utils.models import get_embedder
+from rag_utils import metrics
+
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "true").lower() == "true"
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", 32))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", 5))
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+class EmbeddingBatcher:
+    def __init__(self, model_name=None, max_items=EMBED_BATCH_MAX_ITEMS, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS):
+        self.model_name = model_name
+        self.max_items = max_items
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.batched_texts = 0
+        self.thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, texts):
+        """Queue texts for encoding; the Future resolves to a (len(texts), dim) array"""
+        future = Future()
+        self.requests.put((list(texts), future))
+        return future
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes"""
+        batch = [self.requests.get()]
+        count = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while count < self.max_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            count += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # Skip requests whose caller gave up (e.g. a cancelled future)
+            batch = [(texts, future) for texts, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                texts = [text for request_texts, _ in batch for text in request_texts]
+                embeddings = get_embedder(self.model_name).encode(texts, batch_size=max(len(texts), 1))
+                embeddings = np.asarray(embeddings, dtype="float32")
+                self.batches += 1
+                self.batched_texts += len(texts)
+                metrics.EMBEDDING_BATCH_SIZE.observe(len(texts))
+                start = 0
+                for request_texts, future in batch:
+                    future.set_result(embeddings[start:start + len(request_texts)])
+                    start += len(request_texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+
+def queue_depth():
+    """Embedding requests waiting in this process's batchers"""
+    pid = os.getpid()
+    return sum(batcher.requests.qsize() for (_, batcher_pid), batcher in list(_batchers.items()) if batcher_pid == pid)
+
+
+metrics.EMBEDDING_QUEUE_DEPTH.set_function(queue_depth)
+
+
+def get_batcher(model_name=None):
+    """Return this process's batcher for model_name, starting its thread on first use.
+
+    Keyed by pid as well, so preforked workers each start their own thread
+    instead of waiting on one that only exists in the parent.
+    """
+    key = (model_name, os.getpid())
+    batcher = _batchers.get(key)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(key)
+            if batcher is None:
+                batcher = _batchers[key] = EmbeddingBatcher(model_name)
+    return batcher
+
+
+def encode_queries(texts, model_name=None):
+    """Embed a few short texts (search queries), micro-batched with concurrent callers.
+
+    Large inputs such as documents being ingested are already a batch and go
+    straight to the model.
+    """
+    if not EMBED_BATCHING or len(texts) >= EMBED_BATCH_MAX_ITEMS:
+        return get_embedder(model_name).encode(texts)
+    return get_batcher(model_name).submit(texts).result()
@@ -0,0 +1,83 @@
+"""
+Locks shared by threads and by processes (e.g. preforked workers).
+
+A FileLock is a reentrant thread lock plus an flock() on a lock file next
+to the data it protects. Writers hold it exclusively; readers that reload
+data written by another process take it shared, so they never see a
+half-replaced set of files.
+
+flock() locks belong to an open file, so two FileLock objects on the same
+path in one process would block each other: always go through get_lock().
+"""
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._owner = None
+        self._depth = 0
+        self._fd = None
+
+    def _open(self):
+        # The directory may not exist yet, e.g. for a folder that was never written to
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if not self._depth:
+                fd = self._open()
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+                self._owner = threading.get_ident()
+            self._depth += 1
+        except BaseException:
+            self._lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._depth -= 1
+        if not self._depth:
+            self._owner = None
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    @contextmanager
+    def shared(self):
+        """Hold the lock shared: excludes writers in any process, not other readers"""
+        if self._owner == threading.get_ident():
+            # This thread is the writer, which already excludes everyone else
+            yield self
+            return
+        fd = self._open()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            yield self
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def get_lock(path):
+    """Return the process-wide FileLock for path"""
+    with _locks_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
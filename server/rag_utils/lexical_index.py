@@ -0,0 +1,163 @@
+"""
+Per-folder BM25 inverted index kept next to the folder's FAISS index.
+
+The index is stored as an append-only JSONL file with one line per chunk:
+    {"pos": <position in the FAISS index>, "len": <token count>, "tf": {term: count}}
+
+Loaded indexes are cached per path and only the bytes appended since the
+last load are parsed, so ingestion and search both stay incremental.
+"""
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Keeps course codes, regulation numbers and section numbers together
+# (e.g. "CS3401", "R-2021", "19IT501", "3.2.1") as well as their parts.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class LexicalIndex:
+    def __init__(self):
+        self.postings = {}
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.loaded_bytes = 0
+        self.inode = None
+
+    def add(self, pos, length, term_counts):
+        self.doc_lengths[pos] = length
+        self.total_length += length
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, []).append((pos, count))
+
+    def search(self, query, k=5):
+        """Return [(pos, bm25_score)] for the k best matching chunks"""
+        n_docs = len(self.doc_lengths)
+        if not n_docs:
+            return []
+        avg_length = self.total_length / n_docs
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for pos, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[pos] / avg_length)
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def _chunk_record(pos, text):
+    tokens = tokenize(text)
+    return {"pos": pos, "len": len(tokens), "tf": dict(Counter(tokens))}
+
+
+def append_chunks(index_path, start_pos, chunks):
+    """Append chunks (in FAISS order, starting at start_pos) to a folder's lexical index"""
+    with open(index_path, "a") as f:
+        for i, chunk_text in enumerate(chunks):
+            f.write(json.dumps(_chunk_record(start_pos + i, chunk_text)) + "\n")
+
+
+def _backfill(index_path, backfill_chunks, lock):
+    """Build a missing index into a temp file and move it into place under lock"""
+    with lock:
+        # Another worker, or an upload, may have written the index while we waited
+        if os.path.exists(index_path):
+            return
+        chunks = backfill_chunks()
+        if not chunks:
+            return
+        temp_path = index_path + ".tmp"
+        open(temp_path, "w").close()
+        append_chunks(temp_path, 0, chunks)
+        os.replace(temp_path, index_path)
+        print(f"Backfilled lexical index {index_path} with {len(chunks)} chunks")
+
+
+def load_index(index_path, backfill_chunks=None, lock=None):
+    """Return the cached LexicalIndex for index_path, reading any newly appended lines.
+
+    backfill_chunks is an optional callable returning the folder's chunk
+    texts in FAISS order; it is used to build the index for folders that
+    were created before lexical indexing existed. lock is the folder's
+    write lock (rag_utils.file_lock), held by every writer of the index;
+    it is required with backfill_chunks.
+    """
+    if backfill_chunks is not None and not os.path.exists(index_path):
+        _backfill(index_path, backfill_chunks, lock)
+
+    with _cache_lock:
+        if not os.path.exists(index_path):
+            return None
+
+        index = _cache.get(index_path)
+        stat = os.stat(index_path)
+        size = stat.st_size
+        # A smaller or replaced file means the index was rebuilt: start over
+        if index is None or size < index.loaded_bytes or stat.st_ino != index.inode:
+            index = LexicalIndex()
+            index.inode = stat.st_ino
+            _cache[index_path] = index
+        if size > index.loaded_bytes:
+            with open(index_path, "rb") as f:
+                f.seek(index.loaded_bytes)
+                data = f.read(size - index.loaded_bytes)
+            # Only consume complete lines; a concurrent writer may be mid-line
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    index.add(record["pos"], record["len"], record["tf"])
+            index.loaded_bytes += len(complete)
+        return index
+
+
+def rebuild_index(index_path, chunks):
+    """Replace a folder's lexical index with one built from chunks (positions 0..n-1)"""
+    with _cache_lock:
+        temp_path = index_path + ".tmp"
+        open(temp_path, "w").close()
+        append_chunks(temp_path, 0, chunks)
+        os.replace(temp_path, index_path)
+        _cache.pop(index_path, None)
+
+
+def drop_index(index_path):
+    """Remove a folder's lexical index from disk and from the cache"""
+    with _cache_lock:
+        _cache.pop(index_path, None)
+        if os.path.exists(index_path):
+            os.remove(index_path)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse several best-first lists of ids into [(id, score)] sorted best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
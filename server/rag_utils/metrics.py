@@ -0,0 +1,299 @@
+"""
+Prometheus metrics, exposed as text by GET /metrics.
+
+A small hand-written registry (counters, gauges, histograms with labels)
+rendered in the Prometheus text exposition format. Request, Gemini, tool
+call and FAISS search metrics are filled from finished tracing spans (see
+rag_utils.tracing), so those code paths are instrumented once; the rest are
+updated where they happen.
+
+Preforked workers (serve.py) each keep their own registry. With METRICS_DIR
+set, every process writes a snapshot there every METRICS_FLUSH_SECONDS and
+/metrics sums the snapshots of all live workers, so a scrape sees the whole
+server whichever worker answers it.
+"""
+import os
+import json
+import time
+import threading
+from rag_utils import tracing
+
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SEARCH_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+# Upper row counts of the folder-size buckets FAISS latency is reported by
+SIZE_BUCKETS = ((1000, "0-1k"), (10000, "1k-10k"), (100000, "10k-100k"))
+LARGEST_SIZE_BUCKET = "100k+"
+
+_registry = []
+_lock = threading.Lock()
+_flusher_pid = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        _ensure_flusher()
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with _lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self, samples):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in samples]
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from a function at snapshot time (set_function)"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = None
+        if not self.labelnames:
+            self.values[()] = 0
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function):
+        self.function = function
+
+    def snapshot(self):
+        if self.function is not None:
+            try:
+                return [[[], self.function()]]
+            except Exception as e:
+                print(f"Error reading gauge {self.name}: {e}")
+                return []
+        return super().snapshot()
+
+    render = Counter.render
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                counts = self.values[key] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with _lock:
+            return [[list(key), list(counts)] for key, counts in self.values.items()]
+
+    def render(self, samples):
+        lines = []
+        for key, counts in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}")
+            total = counts[-1]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+def snapshot():
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def _snapshot_path(metrics_dir, pid):
+    return os.path.join(metrics_dir, f"{pid}.json")
+
+
+def _write_snapshot(metrics_dir):
+    path = _snapshot_path(metrics_dir, os.getpid())
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(snapshot(), f)
+    os.replace(temp_path, path)
+
+
+def _flush_forever(metrics_dir):
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            _write_snapshot(metrics_dir)
+        except OSError as e:
+            print(f"Error writing metrics snapshot to {metrics_dir}: {e}")
+
+
+def _ensure_flusher():
+    """Start this process's snapshot thread once metrics are shared through METRICS_DIR"""
+    global _flusher_pid
+    metrics_dir = os.getenv("METRICS_DIR")
+    if not metrics_dir or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    os.makedirs(metrics_dir, exist_ok=True)
+    threading.Thread(target=_flush_forever, args=(metrics_dir,), name="metrics-flusher", daemon=True).start()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    """This process's samples plus the latest snapshots of every other live process"""
+    snapshots = [snapshot()]
+    metrics_dir = os.getenv("METRICS_DIR")
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for file_name in os.listdir(metrics_dir):
+            pid_text, extension = os.path.splitext(file_name)
+            if extension != ".json" or not pid_text.isdigit() or int(pid_text) == os.getpid():
+                continue
+            path = os.path.join(metrics_dir, file_name)
+            if not _process_alive(int(pid_text)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+
+    merged = {}
+    for process_snapshot in snapshots:
+        for name, samples in process_snapshot.items():
+            merged_samples = merged.setdefault(name, {})
+            for key, value in samples:
+                key = tuple(key)
+                if key not in merged_samples:
+                    merged_samples[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    merged_samples[key] = [a + b for a, b in zip(merged_samples[key], value)]
+                else:
+                    merged_samples[key] += value
+    return merged
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+    merged = _collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render(sorted(merged.get(metric.name, {}).items())))
+    return "\n".join(lines) + "\n"
+
+
+def size_bucket(rows):
+    for bound, label in SIZE_BUCKETS:
+        if rows < bound:
+            return label
+    return LARGEST_SIZE_BUCKET
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    "rag_http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+GEMINI_CALLS = Counter("rag_gemini_calls_total", "Gemini generate_content calls", ("status",))
+GEMINI_CALL_DURATION = Histogram("rag_gemini_call_duration_seconds", "Gemini generate_content latency")
+TOOL_CALLS = Counter("rag_tool_calls_total", "Function calls requested by Gemini, by function", ("function", "status"))
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size", "Texts per micro-batched query embedding pass", buckets=BATCH_SIZE_BUCKETS)
+EMBEDDING_QUEUE_DEPTH = Gauge("rag_embedding_queue_depth", "Query embedding requests waiting for the batcher")
+FAISS_SEARCH_DURATION = Histogram(
+    "rag_faiss_search_duration_seconds", "FAISS search latency by index and index size (rows)",
+    ("index", "size_bucket"), buckets=SEARCH_BUCKETS)
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"))
+INGESTIONS_IN_PROGRESS = Gauge("rag_ingestions_in_progress", "File uploads currently being extracted, embedded and indexed")
+FOLDER_COMPACTIONS_PENDING = Gauge("rag_folder_compactions_pending", "Folder vector stores queued or running compaction")
+
+
+def observe_span(span):
+    status = "error" if span.error else "ok"
+    if span.parent is None and "http.route" in span.attributes:
+        HTTP_REQUEST_DURATION.observe(span.duration, method=span.attributes["http.method"],
+                                      route=span.attributes["http.route"],
+                                      status=span.attributes.get("http.status_code", 500))
+    elif span.name == "gemini.generate_content":
+        GEMINI_CALLS.inc(status=status)
+        GEMINI_CALL_DURATION.observe(span.duration)
+    elif span.name == "tool_call":
+        # The tool's own status wins: failed tools return an error result instead of raising
+        TOOL_CALLS.inc(function=span.attributes.get("function", "unknown"), status=span.attributes.get("status", status))
+    elif span.name == "faiss_search":
+        FAISS_SEARCH_DURATION.observe(span.duration, index=span.attributes.get("index", "unknown"),
+                                      size_bucket=size_bucket(span.attributes.get("rows", 0)))
+
+
+tracing.add_listener(observe_span)
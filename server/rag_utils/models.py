@@ -0,0 +1,81 @@
+"""
+Process-wide models and clients, created on first use.
+
+Importing this module is cheap: the embedding backend (sentence-transformers
+and torch, or ONNX Runtime), FAISS and the Gemini client are only loaded
+when something asks for them, so workers that never embed or call Gemini
+start quickly. warm_up() loads everything ahead of traffic.
+"""
+import os
+import time
+import threading
+
+DEFAULT_EMBED_MODEL = "all-MiniLM-L6-v2"
+# "torch" runs sentence-transformers; "onnx" runs an ONNX Runtime export (int8 by default)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+
+_embedders = {}
+_gemini_client = None
+_lock = threading.Lock()
+
+
+def load_embedder(model_name, backend):
+    if backend == "onnx":
+        from rag_utils.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(model_name)
+    if backend != "torch":
+        raise ValueError(f"Unknown EMBED_BACKEND {backend!r}; expected 'torch' or 'onnx'")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def get_embedder(model_name=None, backend=None):
+    """Return the shared embedder for model_name on the configured backend, loading it on first call"""
+    model_name = model_name or os.getenv("EMBED_MODEL_NAME") or DEFAULT_EMBED_MODEL
+    backend = backend or EMBED_BACKEND
+    key = (model_name, backend)
+    embedder = _embedders.get(key)
+    if embedder is None:
+        with _lock:
+            embedder = _embedders.get(key)
+            if embedder is None:
+                embedder = load_embedder(model_name, backend)
+                _embedders[key] = embedder
+                print(f"Loaded embedding model {model_name} ({backend})")
+    return embedder
+
+
+def get_gemini_client():
+    """Return the shared Gemini client, creating it on first call"""
+    global _gemini_client
+    if _gemini_client is None:
+        with _lock:
+            if _gemini_client is None:
+                from google import genai
+                _gemini_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    return _gemini_client
+
+
+def warm_up(model_name=None, include_reranker=False):
+    """Load the embedder (and optionally the reranker) and the Gemini client; returns seconds per step"""
+    timings = {}
+
+    start = time.perf_counter()
+    import faiss  # noqa: F401
+    timings["faiss"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # One encode also initializes the tokenizer and the inference kernels
+    get_embedder(model_name).encode(["warm up"])
+    timings["embedder"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    get_gemini_client()
+    timings["gemini_client"] = time.perf_counter() - start
+
+    if include_reranker:
+        from rag_utils.reranker import get_cross_encoder
+        start = time.perf_counter()
+        get_cross_encoder()
+        timings["reranker"] = time.perf_counter() - start
+    return {step: round(seconds, 3) for step, seconds in timings.items()}
@@ -0,0 +1,173 @@
+"""
+ONNX Runtime embedding backend, optionally with dynamic int8 quantization.
+
+Runs the transformer of a sentence-transformers model (e.g.
+all-MiniLM-L6-v2) exported to ONNX, followed by the same mean pooling and
+L2 normalization, so its vectors can be searched alongside the PyTorch
+ones. Serving needs only onnxruntime and a fast tokenizer; torch is needed
+once, to export the model before the server starts:
+
+    python -m rag_utils.onnx_embedder export [--model all-MiniLM-L6-v2] [--no-quantize]
+
+    <ONNX_MODEL_DIR>/<model name>/
+        tokenizer files      saved with the Hugging Face tokenizer
+        model.onnx           fp32 export
+        model.int8.onnx      dynamically quantized weights (QInt8)
+
+Select it with EMBED_BACKEND=onnx (see rag_utils.models). A missing export
+is an error rather than being created on first use, which would make every
+serve.py worker run its own export into the same directory.
+"""
+import os
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from rag_utils import file_lock
+
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.getenv("DATA_DIR", "."), "onnx_models"))
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "true").lower() == "true"
+# sentence-transformers truncates all-MiniLM-L6-v2 inputs at 256 tokens
+MAX_SEQ_LENGTH = int(os.getenv("ONNX_MAX_SEQ_LENGTH", 256))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+
+
+def hub_name(model_name):
+    """sentence-transformers accepts bare names for its own models; the Hugging Face hub does not"""
+    return model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+
+
+def model_dir(model_name):
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+
+def export_model(model_name, output_dir=None, quantize=True):
+    """Export model_name's transformer to ONNX (and an int8 copy); returns the output directory.
+
+    The export is written to a temporary directory and moved into place file
+    by file, model files last, under a lock shared by every process, so a
+    reader never opens a half-written model.
+    """
+    output_dir = output_dir or model_dir(model_name)
+    model_file = INT8_FILE if quantize else FP32_FILE
+    with file_lock.get_lock(output_dir.rstrip(os.sep) + ".lock"):
+        if os.path.exists(os.path.join(output_dir, model_file)):
+            print(f"{model_name} is already exported to {output_dir}")
+            return output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix=".export_", dir=output_dir)
+        try:
+            _export_to(model_name, temp_dir, quantize)
+            # Model files go last: their presence marks a complete export
+            names = sorted(os.listdir(temp_dir), key=lambda name: name in (FP32_FILE, INT8_FILE))
+            for name in names:
+                os.replace(os.path.join(temp_dir, name), os.path.join(output_dir, name))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return output_dir
+
+
+def _export_to(model_name, output_dir, quantize):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_name(model_name))
+    tokenizer.save_pretrained(output_dir)
+    model = AutoModel.from_pretrained(hub_name(model_name)).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(sample[name] for name in input_names), fp32_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+    print(f"Exported {model_name} to {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"Quantized {model_name} to {int8_path}")
+
+
+def require_export(model_name, quantized=ONNX_QUANTIZE, directory=None):
+    """Return the path of model_name's exported model, raising if it has not been exported"""
+    directory = directory or model_dir(model_name)
+    model_path = os.path.join(directory, INT8_FILE if quantized else FP32_FILE)
+    if not os.path.exists(model_path):
+        raise RuntimeError(
+            f"No ONNX export of {model_name} at {model_path}; create it with "
+            f"'python -m rag_utils.onnx_embedder export --model {model_name}'"
+            + ("" if quantized else " --no-quantize")
+        )
+    return model_path
+
+
+class OnnxEmbedder:
+    """Drop-in for the SentenceTransformer.encode() calls the server makes"""
+
+    def __init__(self, model_name, quantized=ONNX_QUANTIZE, directory=None, threads=None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        directory = directory or model_dir(model_name)
+        model_path = require_export(model_name, quantized, directory)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = threads or int(os.getenv("EMBED_THREADS", 0))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.model_name = model_name
+        self.quantized = quantized
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self.session.get_outputs()[0].shape[-1]
+
+    def _encode_batch(self, texts):
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np")
+        feed = {name: tokens[name].astype("int64") for name in self.input_names}
+        hidden = self.session.run(None, feed)[0]
+        # Mean pooling over real tokens, then L2 normalization, as in the sentence-transformers pipeline
+        mask = tokens["attention_mask"][..., None].astype("float32")
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Return a float32 array of shape (len(sentences), dim); a single string gives shape (dim,)"""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self.get_sentence_embedding_dimension()), dtype="float32")
+        # Batch texts of similar length together to keep padding low
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.get_sentence_embedding_dimension()), dtype="float32")
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            embeddings[batch] = self._encode_batch([texts[i] for i in batch])
+        return embeddings[0] if single else embeddings
+
+
+def main():
+    from rag_utils.models import DEFAULT_EMBED_MODEL
+    parser = argparse.ArgumentParser(description="Export a sentence-transformers model for EMBED_BACKEND=onnx")
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model", default=os.getenv("EMBED_MODEL_NAME") or DEFAULT_EMBED_MODEL)
+    parser.add_argument("--output-dir", help=f"default: {ONNX_MODEL_DIR}/<model name>")
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    args = parser.parse_args()
+    export_model(args.model, args.output_dir, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
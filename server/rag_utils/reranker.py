@@ -0,0 +1,92 @@
+"""
+Optional cross-encoder reranking of FAISS candidates.
+
+The cross-encoder is loaded lazily on first use so servers that never
+rerank do not pay for it.
+"""
+import os
+import time
+import threading
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+DEFAULT_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+DEFAULT_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def get_cross_encoder():
+    """Return the shared CrossEncoder, loading it on first call"""
+    global _cross_encoder
+    if _cross_encoder is None:
+        with _cross_encoder_lock:
+            if _cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+                model_name = os.getenv("RERANK_MODEL_NAME", DEFAULT_RERANK_MODEL)
+                _cross_encoder = CrossEncoder(model_name)
+                print(f"Loaded cross-encoder reranker {model_name}")
+    return _cross_encoder
+
+
+def _positive_param(params, name, cast, default):
+    """params[name] as a positive int or float, or default when it is missing or empty"""
+    value = params.get(name)
+    if value is None or value == "":
+        return default
+    kind = "integer" if cast is int else "number"
+    try:
+        if isinstance(value, bool) or (cast is int and isinstance(value, float)):
+            raise ValueError
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a positive {kind}")
+    if value <= 0:
+        raise ValueError(f"'{name}' must be a positive {kind}")
+    return value
+
+
+def parse_rerank_options(params):
+    """Build rerank options from request parameters (JSON body or form data).
+
+    Returns None when reranking was not requested. Raises ValueError, with a
+    message naming the field, for a parameter that is not a positive number.
+    """
+    enabled = params.get("rerank")
+    if isinstance(enabled, str):
+        enabled = enabled.lower() in ("1", "true", "yes")
+    if not enabled:
+        return None
+    return {
+        "candidates": _positive_param(params, "rerank_candidates", int, DEFAULT_CANDIDATES),
+        "batch_size": _positive_param(params, "rerank_batch_size", int, DEFAULT_BATCH_SIZE),
+        "latency_budget_ms": _positive_param(params, "rerank_budget_ms", float, None),
+    }
+
+
+def rerank_hits(query, hits, top_k, batch_size=DEFAULT_BATCH_SIZE, latency_budget_ms=None):
+    """Score (query, chunk) pairs with the cross-encoder and return the best top_k hits.
+
+    hits must be sorted best first by the retrieval stage. Candidates are
+    scored in batches in that order; once latency_budget_ms is used up, the
+    remaining candidates are not scored and keep their retrieval order
+    behind the scored ones.
+    """
+    if not hits:
+        return []
+    candidates = list(hits)
+    model = get_cross_encoder()
+    start = time.perf_counter()
+
+    scored = []
+    for i in range(0, len(candidates), batch_size):
+        if latency_budget_ms is not None and (time.perf_counter() - start) * 1000 >= latency_budget_ms:
+            print(f"Rerank budget of {latency_budget_ms}ms reached after {len(scored)} candidates")
+            break
+        batch = candidates[i:i + batch_size]
+        scores = model.predict([(query, hit["text"]) for hit in batch], batch_size=batch_size)
+        for hit, score in zip(batch, scores):
+            scored.append(dict(hit, rerank_score=float(score)))
+
+    scored.sort(key=lambda h: h["rerank_score"], reverse=True)
+    return (scored + candidates[len(scored):])[:top_k]
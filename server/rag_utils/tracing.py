@@ -0,0 +1,182 @@
+"""
+Request tracing: nested timing spans for the query path.
+
+    with tracing.span("faiss_search", rows=store.ntotal, k=k) as current:
+        ...
+        current.set_attribute("hits", len(hits))
+
+Spans nest through a context variable, so everything that runs inside a
+request's root span (embedding, FAISS search, metadata lookups, prompt
+building, Gemini and tool calls, chat persistence) becomes its child.
+TRACE_EXPORT selects where finished spans go:
+
+    off   (default) spans are timed and passed to listeners only
+    file  one JSON line per span in TRACE_FILE, using the OpenTelemetry span
+          fields (trace_id, span_id, parent_span_id, start/end_time_unix_nano,
+          attributes, status); a background thread does the writing, so
+          requests never wait on the disk
+    otel  spans are mirrored to the OpenTelemetry API (opentelemetry-api,
+          not in requirements.txt; without it tracing falls back to off);
+          the SDK and exporter are configured as usual, e.g. by running
+          under opentelemetry-instrument
+"""
+import os
+import json
+import time
+import queue
+import threading
+import contextlib
+import contextvars
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "off").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.getenv("DATA_DIR", "."), "traces.jsonl"))
+
+if TRACE_EXPORT == "otel":
+    try:
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.trace import Status, StatusCode
+    except ImportError:
+        print("Warning: TRACE_EXPORT=otel needs the opentelemetry-api package; tracing export is off")
+        TRACE_EXPORT = "off"
+
+_current = contextvars.ContextVar("current_span", default=None)
+_listeners = []
+_writers = {}
+_writers_lock = threading.Lock()
+_otel_tracer = None
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "start_ns", "end_ns", "error", "_otel")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._otel = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+        if self._otel is not None and value is not None:
+            self._otel.set_attribute(key, value)
+
+    @property
+    def duration(self):
+        """Seconds from start to end (or to now while the span is open)"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent.span_id if self.parent else None,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "UNSET"},
+            "pid": os.getpid(),
+        }
+
+
+class _FileWriter:
+    """Appends finished spans to TRACE_FILE from a daemon thread, a batch per write"""
+
+    def __init__(self, path):
+        self.path = path
+        self.spans = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self.spans.get()]
+            while True:
+                try:
+                    batch.append(self.spans.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(span, default=str) + "\n" for span in batch)
+            except OSError as e:
+                print(f"Error writing traces to {self.path}: {e}")
+
+
+def _file_writer():
+    # One writer thread per process, so preforked workers do not share the parent's
+    pid = os.getpid()
+    writer = _writers.get(pid)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(pid)
+            if writer is None:
+                writer = _writers[pid] = _FileWriter(TRACE_FILE)
+    return writer
+
+
+def _get_otel_tracer():
+    global _otel_tracer
+    if _otel_tracer is None:
+        _otel_tracer = otel_trace.get_tracer("rag-server")
+    return _otel_tracer
+
+
+def add_listener(listener):
+    """Register listener(span) to be called with every finished span, whatever TRACE_EXPORT is"""
+    _listeners.append(listener)
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, **attributes):
+    """Open a span as a child of the current one and make it current; pair with end_span"""
+    parent = _current.get()
+    span = Span(name, parent, attributes)
+    if TRACE_EXPORT == "otel":
+        otel_context = otel_trace.set_span_in_context(parent._otel) if parent is not None and parent._otel else None
+        # OpenTelemetry rejects None attribute values
+        otel_attributes = {key: value for key, value in attributes.items() if value is not None}
+        span._otel = _get_otel_tracer().start_span(name, context=otel_context, attributes=otel_attributes,
+                                                   start_time=span.start_ns)
+    _current.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    """Close span, restore its parent as the current span and export it"""
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    _current.set(span.parent)
+    for listener in _listeners:
+        try:
+            listener(span)
+        except Exception as e:
+            print(f"Error in span listener: {e}")
+    if TRACE_EXPORT == "file":
+        _file_writer().spans.put(span.to_dict())
+    elif span._otel is not None:
+        if span.error:
+            span._otel.set_status(Status(StatusCode.ERROR, span.error))
+        span._otel.end(end_time=span.end_ns)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    current = start_span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, e)
+        raise
+    else:
+        end_span(current)
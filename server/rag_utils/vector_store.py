@@ -0,0 +1,336 @@
+"""
+Memory-mapped on-disk vector storage for folder indexes.
+
+A folder store is four append-only files sharing one path prefix:
+    <prefix>.vec  raw float32 embeddings, one row per chunk
+    <prefix>.txt  UTF-8 chunk texts, concatenated
+    <prefix>.rec  int32 chunk records (see chunk_store.CHUNK_RECORD_DTYPE)
+    <prefix>.ids  interned file ids, one per line, referenced by doc_ref
+    <prefix>.del  int32 positions of deleted rows (tombstones)
+
+Deleting a file only appends its row positions to <prefix>.del; searches
+skip tombstoned rows, and compact() rewrites the files without them once
+enough have accumulated.
+
+Writers in any process serialize on <prefix>.lock (see rag_utils.file_lock),
+and readers re-map only under a shared lock, so worker processes can append,
+delete and compact the same store safely.
+
+Nothing is parsed or copied on open: the files are mapped read-only with
+np.memmap / mmap, searched with faiss.knn directly on the mapping, and
+several worker processes share the same pages through the OS page cache.
+"""
+import os
+import json
+import mmap
+import threading
+import numpy as np
+from rag_utils.chunk_store import CHUNK_RECORD_DTYPE, build_records
+from rag_utils import file_lock
+
+EMBED_DIM = 384  # all-MiniLM-L6-v2 output size
+STORE_SUFFIXES = (".vec", ".txt", ".rec", ".ids", ".del")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class FolderVectorStore:
+    def __init__(self, prefix, dim=EMBED_DIM):
+        self.prefix = prefix
+        self.dim = dim
+        self.vectors_path = prefix + ".vec"
+        self.text_path = prefix + ".txt"
+        self.records_path = prefix + ".rec"
+        self.ids_path = prefix + ".ids"
+        self.deleted_path = prefix + ".del"
+        self._lock = threading.RLock()
+        # Cross-process writer lock; always taken before self._lock
+        self._write_lock = file_lock.get_lock(prefix + ".lock")
+        self._sizes = None
+        self._vectors = np.empty((0, dim), dtype="float32")
+        self._records = np.empty(0, dtype=CHUNK_RECORD_DTYPE)
+        self._text = b""
+        self._file_ids = []
+        self._deleted = np.zeros(0, dtype=bool)
+        self._deleted_count = 0
+
+    def _file_sizes(self):
+        sizes = tuple(os.path.getsize(p) if os.path.exists(p) else 0
+                      for p in (self.vectors_path, self.text_path, self.records_path, self.ids_path, self.deleted_path))
+        # compact() replaces the files, so the inode tells a rewrite from an unchanged file
+        inode = os.stat(self.records_path).st_ino if os.path.exists(self.records_path) else 0
+        return sizes + (inode,)
+
+    def _rows(self, sizes):
+        return min(sizes[0] // (self.dim * 4), sizes[2] // CHUNK_RECORD_DTYPE.itemsize)
+
+    def _read_file_ids(self):
+        with open(self.ids_path, "r") as f:
+            return [line.rstrip("\n") for line in f]
+
+    def _refresh(self):
+        """Re-map the files if another writer has appended to them"""
+        sizes = self._file_sizes()
+        if sizes == self._sizes:
+            return
+        with self._write_lock.shared(), self._lock:
+            # Another process may have finished writing since the sizes were read
+            sizes = self._file_sizes()
+            rows = self._rows(sizes)
+            if rows:
+                self._vectors = np.memmap(self.vectors_path, dtype="float32", mode="r", shape=(rows, self.dim))
+                self._records = np.memmap(self.records_path, dtype=CHUNK_RECORD_DTYPE, mode="r", shape=(rows,))
+            else:
+                self._vectors = np.empty((0, self.dim), dtype="float32")
+                self._records = np.empty(0, dtype=CHUNK_RECORD_DTYPE)
+            if sizes[1]:
+                with open(self.text_path, "rb") as f:
+                    self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._text = b""
+            self._file_ids = self._read_file_ids() if sizes[3] else []
+            self._deleted = np.zeros(rows, dtype=bool)
+            if sizes[4]:
+                positions = np.fromfile(self.deleted_path, dtype="<i4")
+                self._deleted[positions[positions < rows]] = True
+            self._deleted_count = int(self._deleted.sum())
+            self._sizes = sizes
+
+    @property
+    def ntotal(self):
+        """Number of rows, including tombstoned ones (positions run from 0 to ntotal - 1)"""
+        self._refresh()
+        return len(self._records)
+
+    @property
+    def deleted_count(self):
+        self._refresh()
+        return self._deleted_count
+
+    @property
+    def live_count(self):
+        self._refresh()
+        return len(self._records) - self._deleted_count
+
+    def is_deleted(self, pos):
+        self._refresh()
+        return pos >= len(self._deleted) or bool(self._deleted[pos])
+
+    def delete_rows(self, positions):
+        """Tombstone rows; cost is proportional to len(positions), not the store size"""
+        positions = np.asarray(positions, dtype="<i4")
+        if not len(positions):
+            return
+        with self._write_lock:
+            with open(self.deleted_path, "ab") as f:
+                f.write(positions.tobytes())
+
+    def append(self, embeddings, chunks, file_id):
+        """Append one file's chunks and embeddings; returns the position of the first new row"""
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32").reshape(-1, self.dim)
+        if len(embeddings) != len(chunks):
+            raise ValueError(f"Got {len(embeddings)} embeddings for {len(chunks)} chunks")
+        if not chunks:
+            return self.ntotal
+        with self._write_lock, self._lock:
+            sizes = self._file_sizes()
+            start = self._rows(sizes)
+            # Drop any partially written tail so rows stay aligned across files
+            if sizes[0] > start * self.dim * 4:
+                os.truncate(self.vectors_path, start * self.dim * 4)
+            if sizes[2] > start * CHUNK_RECORD_DTYPE.itemsize:
+                os.truncate(self.records_path, start * CHUNK_RECORD_DTYPE.itemsize)
+
+            file_ids = self._read_file_ids() if sizes[3] else []
+            if sizes[4] and sizes[4] % 4:
+                os.truncate(self.deleted_path, sizes[4] - sizes[4] % 4)
+            if file_id in file_ids:
+                doc_ref = file_ids.index(file_id)
+            else:
+                doc_ref = len(file_ids)
+                with open(self.ids_path, "a") as f:
+                    f.write(file_id + "\n")
+
+            encoded = [chunk.encode("utf-8") for chunk in chunks]
+            records = build_records(encoded, sizes[1], doc_ref)
+
+            # Records go last: a row only becomes visible once every file has it
+            with open(self.vectors_path, "ab") as f:
+                f.write(embeddings.tobytes())
+            with open(self.text_path, "ab") as f:
+                f.write(b"".join(encoded))
+            with open(self.records_path, "ab") as f:
+                f.write(records.tobytes())
+        return start
+
+    def search(self, query_embeddings, k=5):
+        """Exact L2 search over the mapped vectors, skipping tombstoned rows.
+
+        Returns (distances, indices) like faiss; rows with fewer than k live
+        results are padded with -1 / inf.
+        """
+        self._refresh()
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype="float32")
+        vectors, deleted, deleted_count = self._vectors, self._deleted, self._deleted_count
+        if not len(vectors):
+            empty = np.empty((len(query_embeddings), 0))
+            return empty.astype("float32"), empty.astype("int64")
+        import faiss
+        distances, indices = faiss.knn(query_embeddings, vectors, min(k + deleted_count, len(vectors)))
+        if not deleted_count:
+            return distances, indices
+        k = min(k, len(vectors))
+        live_distances = np.full((len(indices), k), np.inf, dtype="float32")
+        live_indices = np.full((len(indices), k), -1, dtype="int64")
+        for row in range(len(indices)):
+            keep = (indices[row] >= 0) & ~deleted[np.maximum(indices[row], 0)]
+            found = indices[row][keep][:k]
+            live_indices[row, :len(found)] = found
+            live_distances[row, :len(found)] = distances[row][keep][:k]
+        return live_distances, live_indices
+
+    def vectors(self):
+        """The mapped (ntotal, dim) embedding matrix, tombstoned rows included"""
+        self._refresh()
+        return self._vectors
+
+    def chunk(self, pos):
+        """Return {"file_id", "chunk_index", "chunk_text"} for the row at pos"""
+        self._refresh()
+        record = self._records[pos]
+        offset, length = int(record["offset"]), int(record["length"])
+        return {
+            "file_id": self._file_ids[record["doc_ref"]],
+            "chunk_index": int(record["chunk_index"]),
+            "chunk_text": self._text[offset:offset + length].decode("utf-8"),
+        }
+
+    def chunk_texts(self):
+        """Texts of every row in position order (tombstoned rows included, so positions line up)"""
+        return [self.chunk(pos)["chunk_text"] for pos in range(self.ntotal)]
+
+    def file_spans(self):
+        """Return [(file_id, start_pos, row_count)] for each contiguous run of one file's rows"""
+        self._refresh()
+        doc_refs = np.asarray(self._records["doc_ref"])
+        if not len(doc_refs):
+            return []
+        starts = np.flatnonzero(np.diff(doc_refs)) + 1
+        starts = np.concatenate(([0], starts))
+        ends = np.concatenate((starts[1:], [len(doc_refs)]))
+        return [(self._file_ids[doc_refs[start]], int(start), int(end - start)) for start, end in zip(starts, ends)]
+
+    def compact(self):
+        """Rewrite the store without tombstoned rows; returns the number of rows dropped.
+
+        Positions of the remaining rows change, so anything keyed by position
+        (lexical index, chunk spans) has to be rebuilt afterwards.
+        """
+        with self._write_lock, self._lock:
+            self._refresh()
+            if not self._deleted_count:
+                return 0
+            live = np.flatnonzero(~self._deleted)
+            records = np.array(self._records[live])
+            live_refs = np.unique(records["doc_ref"])
+            ref_map = np.full(len(self._file_ids), -1, dtype="int32")
+            ref_map[live_refs] = np.arange(len(live_refs), dtype="int32")
+
+            text_temp = self.text_path + ".tmp"
+            with open(text_temp, "wb") as f:
+                offset = 0
+                for i, (start, length) in enumerate(zip(records["offset"].tolist(), records["length"].tolist())):
+                    f.write(self._text[start:start + length])
+                    records["offset"][i] = offset
+                    offset += length
+            records["doc_ref"] = ref_map[records["doc_ref"]]
+            np.ascontiguousarray(self._vectors[live]).tofile(self.vectors_path + ".tmp")
+            records.tofile(self.records_path + ".tmp")
+            with open(self.ids_path + ".tmp", "w") as f:
+                f.writelines(self._file_ids[ref] + "\n" for ref in live_refs)
+
+            dropped = self._deleted_count
+            for path in (self.ids_path, self.text_path, self.vectors_path, self.records_path):
+                os.replace(path + ".tmp", path)
+            open(self.deleted_path, "wb").close()
+            self._sizes = None
+            self._refresh()
+        print(f"Compacted vector store {self.prefix}: dropped {dropped} deleted rows, {len(live)} remain")
+        return dropped
+
+
+def store_exists(prefix):
+    return os.path.exists(prefix + ".rec")
+
+
+def open_store(prefix, dim=EMBED_DIM):
+    """Return the process-wide store for prefix, creating empty files if needed"""
+    with _stores_lock:
+        store = _stores.get(prefix)
+        if store is None:
+            for suffix in STORE_SUFFIXES:
+                open(prefix + suffix, "ab").close()
+            store = FolderVectorStore(prefix, dim)
+            _stores[prefix] = store
+        return store
+
+
+def delete_store(prefix):
+    """Remove a store's files. <prefix>.lock is kept: callers may hold it, and
+    unlinking a held flock file would let a new opener lock a fresh inode."""
+    with _stores_lock:
+        _stores.pop(prefix, None)
+        for suffix in STORE_SUFFIXES:
+            if os.path.exists(prefix + suffix):
+                os.remove(prefix + suffix)
+
+
+def migrate_legacy_index(prefix, legacy_index_path, metadata_path):
+    """Convert a folder's FAISS .bin index and JSONL chunk rows into a mapped store.
+
+    Chunk rows are removed from metadata_path; file-level records stay.
+    """
+    import faiss
+    index = faiss.read_index(legacy_index_path)
+    vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype="float32")
+
+    file_lines, chunk_rows = [], []
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "chunk_text" in entry:
+                    chunk_rows.append(entry)
+                else:
+                    file_lines.append(line if line.endswith("\n") else line + "\n")
+    if len(chunk_rows) != len(vectors):
+        print(f"Warning: {legacy_index_path} has {len(vectors)} vectors but {len(chunk_rows)} chunk rows")
+    rows = min(len(chunk_rows), len(vectors))
+
+    store = open_store(prefix, index.d)
+    start = 0
+    while start < rows:
+        file_id = chunk_rows[start]["file_id"]
+        end = start
+        while end < rows and chunk_rows[end]["file_id"] == file_id:
+            end += 1
+        store.append(vectors[start:end], [row["chunk_text"] for row in chunk_rows[start:end]], file_id)
+        start = end
+
+    temp_path = metadata_path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.writelines(file_lines)
+    os.replace(temp_path, metadata_path)
+    os.remove(legacy_index_path)
+    print(f"Migrated {rows} chunks from {legacy_index_path} to memory-mapped store {prefix}")
+    return store
+
+
+def ensure_store(prefix, legacy_index_path=None, metadata_path=None):
+    """Open a folder store, migrating the legacy FAISS index first if one exists"""
+    if not store_exists(prefix) and legacy_index_path and os.path.exists(legacy_index_path):
+        return migrate_legacy_index(prefix, legacy_index_path, metadata_path)
+    return open_store(prefix)
@@ -2,14 +2,15 @@
 Flask Application Factory with Blueprint Registration
 """
 
-from flask import Flask
+from flask import Flask, request, g
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from .authorization import auth_bp
 from db_utils.db_helper import init_db
 from .file_service import file_service
-from .folder_service import folder_service
+from .folder_service import folder_service, init_folder_db
+from rag_utils import tracing
 # Load environment variables
 load_dotenv()
 
@@ -17,6 +18,7 @@ def create_app():
     """Application factory function"""
     app = Flask(__name__)
     init_db()
+    init_folder_db()
     # Configure CORS for external access
     CORS(app, origins=[
         "http://localhost:5173",  # Local development
@@ -31,4 +33,29 @@ def create_app():
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(file_service, url_prefix='/api/file')
     app.register_blueprint(folder_service, url_prefix='/api')
+    register_tracing(app)
     return app
+
+def register_tracing(app):
+    """Open a root span per request; spans opened while handling it become its children"""
+    @app.before_request
+    def start_request_span():
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        g.request_span = tracing.start_span(f"{request.method} {route}", **{
+            "http.method": request.method,
+            "http.route": route,
+        })
+
+    @app.after_request
+    def tag_request_span(response):
+        request_span = g.get("request_span")
+        if request_span is not None:
+            request_span.set_attribute("http.status_code", response.status_code)
+            response.headers["X-Trace-Id"] = request_span.trace_id
+        return response
+
+    @app.teardown_request
+    def end_request_span(error):
+        request_span = g.pop("request_span", None)
+        if request_span is not None:
+            tracing.end_span(request_span, error)
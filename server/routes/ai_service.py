@@ -1,14 +1,12 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from google import genai    
-import os
 from dotenv import load_dotenv
+from rag_utils.models import get_gemini_client
 
 load_dotenv()
 ai_service = Blueprint("ai_service", __name__)
 
-# Initialize Gemini client directly
-client = genai.Client(api_key=os.getenv('GOOGLE_API_KEY'))
 def upload_to_gemini(file):
     try:
         import tempfile
@@ -80,7 +78,7 @@ def upload_to_gemini_from_bytes(file_content, file_name, mime_type):
         
         try:
             # Upload file to Gemini Files API using the file path
-            response = client.files.upload(
+            response = get_gemini_client().files.upload(
                 file=temp_file_path
             )
             
@@ -119,7 +117,7 @@ def summarize_file_from_gemini(file_uri, user_id):
         """
         file_part = genai.types.Part(file_data=genai.types.FileData(file_uri=file_uri))
         # Generate content using the uploaded file with proper format
-        response = client.models.generate_content(
+        response = get_gemini_client().models.generate_content(
             model="gemini-2.5-flash",
             contents=[
                 prompt,
@@ -148,7 +146,7 @@ def summarize_file_from_gemini(file_uri, user_id):
 def delete_file_from_gemini(file_uri):
     """Delete a file from Gemini Files API"""
     try:
-        client.files.delete(file_uri)
+        get_gemini_client().files.delete(file_uri)
         return {"success": True, "message": "File deleted successfully"}
     except Exception as e:
         return {"success": False, "error": f"Failed to delete file: {str(e)}"}
\ No newline at end of file
@@ -1,9 +1,71 @@
 """
 Authentication decorators for Flask routes
 """
+import os
+import time
+import threading
 from functools import wraps
 from flask import request, jsonify
 from db_utils.db_helper import get_user
+from rag_utils import metrics
+
+# Seconds a user lookup is reused before hitting the database again
+USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", 60))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", 10000))
+
+# user_id -> (expires_at, user row or None)
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def get_cached_user(user_id):
+    """get_user with a short-TTL in-process cache; unknown ids are cached too"""
+    key = str(user_id)
+    now = time.monotonic()
+    entry = _user_cache.get(key)
+    if entry and entry[0] > now:
+        metrics.CACHE_LOOKUPS.inc(cache="user", result="hit")
+        return entry[1]
+    metrics.CACHE_LOOKUPS.inc(cache="user", result="miss")
+    user = get_user(user_id)
+    with _user_cache_lock:
+        if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+            for stale_key in [k for k, (expires_at, _) in _user_cache.items() if expires_at <= now]:
+                del _user_cache[stale_key]
+            if len(_user_cache) >= USER_CACHE_MAX_ENTRIES:
+                _user_cache.clear()
+        _user_cache[key] = (now + USER_CACHE_TTL, user)
+    return user
+
+
+def invalidate_user(user_id=None):
+    """Drop one cached user (or all of them), e.g. after registration"""
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(str(user_id), None)
+
+
+def _find_user_id(kwargs):
+    """user_id from the JSON body, form data, query string or URL path, in that order.
+
+    Raises ValueError if the request is sent as JSON but its body does not parse.
+    """
+    user_id = None
+    if request.is_json:
+        # Flask caches the parsed body, so the handler's own get_json() does not parse it again
+        data = request.get_json(silent=True)
+        if data is None and request.get_data():
+            raise ValueError("Request body is not valid JSON")
+        user_id = data.get('user_id') if isinstance(data, dict) else None
+    else:
+        user_id = request.form.get('user_id')
+    if not user_id:
+        user_id = request.args.get('user_id')
+    if not user_id and 'user_id' in kwargs:
+        user_id = kwargs.get('user_id')
+    return user_id
 
 
 def auth_required(f):
@@ -18,31 +80,20 @@ def auth_required(f):
     - URL path parameters (if function has user_id parameter)
     
     If user_id is not found or user doesn't exist, returns 401 Unauthorized.
+    A JSON body that does not parse returns 400 Bad Request.
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_id = None
-        
-        # Try to get user_id from various sources
-        if request.is_json:
-            data = request.get_json() or {}
-            user_id = data.get('user_id')
-        
-        if not user_id:
-            user_id = request.form.get('user_id')
-        
-        if not user_id:
-            user_id = request.args.get('user_id')
-        
-        # Check if user_id is in kwargs (from URL path)
-        if not user_id and 'user_id' in kwargs:
-            user_id = kwargs.get('user_id')
+        try:
+            user_id = _find_user_id(kwargs)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         if not user_id:
             return jsonify({"error": "Authentication required. user_id is missing."}), 401
         
         # Validate user exists
-        user = get_user(user_id)
+        user = get_cached_user(user_id)
         if not user:
             return jsonify({"error": "Invalid user_id. User not found."}), 401
         
@@ -62,25 +113,14 @@ def optional_auth(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        user_id = None
-        
-        # Try to get user_id from various sources
-        if request.is_json:
-            data = request.get_json() or {}
-            user_id = data.get('user_id')
-        
-        if not user_id:
-            user_id = request.form.get('user_id')
-        
-        if not user_id:
-            user_id = request.args.get('user_id')
-        
-        if not user_id and 'user_id' in kwargs:
-            user_id = kwargs.get('user_id')
+        try:
+            user_id = _find_user_id(kwargs)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         # If user_id is provided, validate it
         if user_id:
-            user = get_user(user_id)
+            user = get_cached_user(user_id)
             if not user:
                 return jsonify({"error": "Invalid user_id. User not found."}), 401
             kwargs['authenticated_user_id'] = user_id
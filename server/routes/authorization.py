@@ -5,6 +5,7 @@ import os
 import json
 from dotenv import load_dotenv
 from db_utils.db_helper import create_user, get_user_id, user_exists, save_tokens, get_user
+from routes.auth_decorators import invalidate_user
 
 load_dotenv()
 from routes.email_service import get_email_service
@@ -157,6 +158,8 @@ def register():
         # Generate user ID
         create_user(email, password, role)
         user_id = get_user_id(email)
+        # The new id may have been cached as unknown
+        invalidate_user(user_id)
         return jsonify({
             "message": "Registration successful",
             "user_id": user_id,
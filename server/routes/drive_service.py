@@ -1,15 +1,18 @@
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
-import requests
-from googleapiclient.http import MediaIoBaseDownload,MediaFileUpload
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+from googleapiclient.http import MediaIoBaseDownload,MediaFileUpload,MediaIoBaseUpload
 import io
 import os
 from db_utils.db_helper import get_tokens, save_tokens
 
-def get_drive_service(user_id):
-    """user_id can be fetched using get_user_id(user_id) function
-    """
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # resumable upload chunk size (multiple of 256 KB)
+BATCH_REQUEST_LIMIT = 100  # Drive API maximum calls per batch request
+
+def get_drive_credentials(user_id):
+    """Load (and refresh if needed) the user's Drive credentials"""
     tokens = get_tokens(user_id)
     if not tokens:
         return {"error": "No tokens found for user"}
@@ -24,7 +27,7 @@ def get_drive_service(user_id):
     )
     if creds.expired and creds.refresh_token:
         print("Credentials expired, refreshing...")
-        creds.refresh(requests.Request())
+        creds.refresh(Request())
         print("Credentials refreshed successfully")
         
         # Save the refreshed tokens back to the database
@@ -35,8 +38,55 @@ def get_drive_service(user_id):
             print(f"Warning: Could not save refreshed tokens: {e}")
     
     print(f"Credentials created, scopes: {creds.scopes}")
+    return creds
+
+def get_drive_service(user_id):
+    """user_id can be fetched using get_user_id(user_id) function
+    """
+    creds = get_drive_credentials(user_id)
+    if isinstance(creds, dict) and "error" in creds:
+        return creds
     return build('drive', 'v3', credentials=creds)
 
+def new_authorized_http(creds):
+    """A private HTTP connection for one thread; httplib2 connections are not thread-safe"""
+    return AuthorizedHttp(creds, http=httplib2.Http())
+
+def upload_media_with_service(service, media, file_name, http=None):
+    """Create a Drive file from a resumable media upload, sending it chunk by chunk.
+
+    Pass http (see new_authorized_http) when uploading from several threads
+    with the same service object.
+    """
+    request = service.files().create(body={"name": file_name}, media_body=media, fields="id, webViewLink, webContentLink")
+    response = None
+    while response is None:
+        status, response = request.next_chunk(http=http)
+        if status:
+            print(f"Upload {int(status.progress() * 100)}% of {file_name}")
+    return response
+
+def upload_bytes_with_service(service, data, file_name, mime_type, http=None):
+    """Upload an in-memory document without writing it to disk"""
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+    return upload_media_with_service(service, media, file_name, http=http)
+
+def share_files_publicly(service, file_ids):
+    """Give "anyone" reader access to many files using batched permission requests.
+
+    Returns {file_id: error message} for the files that could not be shared.
+    """
+    errors = {}
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = str(exception)
+    for i in range(0, len(file_ids), BATCH_REQUEST_LIMIT):
+        batch = service.new_batch_http_request(callback=callback)
+        for file_id in file_ids[i:i + BATCH_REQUEST_LIMIT]:
+            batch.add(service.permissions().create(fileId=file_id, body={"role": "reader", "type": "anyone"}), request_id=file_id)
+        batch.execute()
+    return errors
+
 
 def download_file_from_drive_and_upload_to_gemini(file_id, user_id):
     """user_id can be fetched using get_user_id(user_id) function
@@ -89,9 +139,9 @@ def upload_local_file_to_drive(file_path, user_id,mime_type):
         service = get_drive_service(user_id)
         if isinstance(service, dict) and "error" in service:
             return service
-        mediafile=MediaFileUpload(file_path, mimetype=mime_type)
         # Upload to regular Drive folder instead of appDataFolder
-        file=service.files().create(body={"name": os.path.basename(file_path)},media_body=mediafile,fields="id, webViewLink, webContentLink").execute()
+        mediafile=MediaFileUpload(file_path, mimetype=mime_type, chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+        file=upload_media_with_service(service, mediafile, os.path.basename(file_path))
         file_id=file.get("id")
         webViewLink=file.get("webViewLink")
         service.permissions().create(fileId=file_id,body={"role": "reader", "type": "anyone"}).execute()
@@ -99,3 +149,17 @@ def upload_local_file_to_drive(file_path, user_id,mime_type):
     except Exception as e:
         return {"error": f"Failed to upload file to drive: {str(e)}"}
 
+def upload_bytes_to_drive(data, file_name, user_id, mime_type):
+    """user_id can be fetched using get_user_id(user_id) function
+    """
+    try:
+        service = get_drive_service(user_id)
+        if isinstance(service, dict) and "error" in service:
+            return service
+        file=upload_bytes_with_service(service, data, file_name, mime_type)
+        file_id=file.get("id")
+        webViewLink=file.get("webViewLink")
+        service.permissions().create(fileId=file_id,body={"role": "reader", "type": "anyone"}).execute()
+        return {"success": True, "message": "File uploaded to drive successfully", "file_id": file_id, "webViewLink": webViewLink}
+    except Exception as e:
+        return {"error": f"Failed to upload file to drive: {str(e)}"}
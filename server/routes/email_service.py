@@ -1,20 +1,37 @@
 from flask import Blueprint, request, jsonify
 from db_utils.db_helper import get_tokens, save_tokens
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google.oauth2.credentials import Credentials
+from google.auth.transport.requests import Request
 import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from flask import session
-import requests
 import markdown
+import threading
+import time
 import re
+import os
 from .classroom_service import list_courses, list_course_students, list_student_submissions, get_coursework, get_student, get_coursework_materials, list_courseworks
 from .drive_service import download_file_from_drive_and_upload_to_gemini
 from .ai_service import summarize_file_from_gemini
 from .forms_service import create_quiz, list_forms, get_form, list_form_responses, get_form_response
 from .classroom_service import create_announcement, create_coursework
-from .pdf_service import question_bank_generator, answer_key_generator
+from .text_utils import preprocess_latex, is_markdown_content, strip_markdown
+from .pdf_service import question_bank_generator, answer_key_generator, assessment_pack_generator
+
+# Gmail allows 250 quota units per user per second and messages.send costs 100
+GMAIL_SENDS_PER_SECOND = float(os.getenv("GMAIL_SENDS_PER_SECOND", "2"))
+GMAIL_SEND_BURST = int(os.getenv("GMAIL_SEND_BURST", "10"))
+# Gmail recommends at most 50. A batch is charged to the token bucket as a whole, so it cannot exceed the burst
+GMAIL_BATCH_SIZE = max(1, min(int(os.getenv("GMAIL_BATCH_SIZE", "10")), GMAIL_SEND_BURST))
+GMAIL_SEND_RETRIES = 3
+
+_TEMPLATE_FIELD_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+_send_buckets = {}
+_send_buckets_lock = threading.Lock()
+
 def get_email_service(user_id):
     print(f"Getting email service for user_id: {user_id}")
     token_data = get_tokens(user_id)
@@ -36,7 +53,7 @@ def get_email_service(user_id):
     # Refresh the credentials if needed
     if creds.expired and creds.refresh_token:
         print("Credentials expired, refreshing...")
-        creds.refresh(requests.Request())
+        creds.refresh(Request())
         print("Credentials refreshed successfully")
         
         # Save the refreshed tokens back to the database
@@ -53,244 +70,160 @@ def get_email_service(user_id):
     
     return service
 
-def preprocess_latex(text):
-    """Pre-process LaTeX syntax to make it email-friendly"""
-    import re
-    
-    # Handle LaTeX matrices - convert to HTML tables
-    matrix_pattern = r'\\begin\{pmatrix\}(.*?)\\end\{pmatrix\}'
-    
-    def replace_matrix(match):
-        matrix_content = match.group(1)
-        # Split by \\ to get rows
-        rows = [row.strip() for row in matrix_content.split('\\\\') if row.strip()]
-        
-        # Convert each row to HTML table row
-        html_rows = []
-        for row in rows:
-            # Split by & to get cells
-            cells = [cell.strip() for cell in row.split('&')]
-            html_cells = ''.join([f'<td>{cell}</td>' for cell in cells])
-            html_rows.append(f'<tr>{html_cells}</tr>')
-        
-        # Create HTML table
-        table_html = f'<table class="matrix-table"><tbody>{"".join(html_rows)}</tbody></table>'
-        return table_html
-    
-    # Replace matrices
-    text = re.sub(matrix_pattern, replace_matrix, text, flags=re.DOTALL)
-    
-    # Handle other LaTeX math expressions - convert to plain text
-    # Remove $$ delimiters
-    text = re.sub(r'\$\$(.*?)\$\$', r'\1', text, flags=re.DOTALL)
-    
-    # Remove single $ delimiters
-    text = re.sub(r'\$(.*?)\$', r'\1', text, flags=re.DOTALL)
-    
-    # Handle LaTeX commands - convert common ones to readable text
-    latex_commands = {
-        r'\\begin\{.*?\}': '',
-        r'\\end\{.*?\}': '',
-        r'\\\\': '<br>',
-        r'\\&': '&',
-        r'\\%': '%',
-        r'\\#': '#',
-        r'\\_': '_',
-        r'\\{': '{',
-        r'\\}': '}',
-    }
-    
-    for pattern, replacement in latex_commands.items():
-        text = re.sub(pattern, replacement, text)
-    
-    return text
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.extra',
+    'markdown.extensions.codehilite',
+    'markdown.extensions.tables',
+    'markdown.extensions.toc'
+]
 
-def convert_markdown_to_html(markdown_text):
-    """Convert markdown text to HTML for email display"""
-    try:
-        # Pre-process LaTeX syntax to make it email-friendly
-        processed_text = preprocess_latex(markdown_text)
-        
-        # Configure markdown with extensions for better email formatting
-        md = markdown.Markdown(extensions=[
-            'markdown.extensions.extra',
-            'markdown.extensions.codehilite',
-            'markdown.extensions.tables',
-            'markdown.extensions.toc'
-        ])
-        
-        # Convert markdown to HTML
-        html_content = md.convert(processed_text)
-        
-        # Add basic CSS styling for better email appearance
-        styled_html = f"""
+# Basic CSS styling for better email appearance; the body is inserted between the two halves
+EMAIL_HTML_HEAD = """
         <!DOCTYPE html>
         <html>
         <head>
             <meta charset="utf-8">
             <style>
-                body {{
+                body {
                     font-family: Arial, sans-serif;
                     line-height: 1.6;
                     color: #333;
                     max-width: 600px;
                     margin: 0 auto;
                     padding: 20px;
-                }}
-                h1, h2, h3, h4, h5, h6 {{
+                }
+                h1, h2, h3, h4, h5, h6 {
                     color: #2c3e50;
                     margin-top: 20px;
                     margin-bottom: 10px;
-                }}
-                code {{
+                }
+                code {
                     background-color: #f4f4f4;
                     padding: 2px 4px;
                     border-radius: 3px;
                     font-family: 'Courier New', monospace;
-                }}
-                pre {{
+                }
+                pre {
                     background-color: #f4f4f4;
                     padding: 10px;
                     border-radius: 5px;
                     overflow-x: auto;
-                }}
-                blockquote {{
+                }
+                blockquote {
                     border-left: 4px solid #ddd;
                     margin: 0;
                     padding-left: 20px;
                     color: #666;
-                }}
-                table {{
+                }
+                table {
                     border-collapse: collapse;
                     width: 100%;
                     margin: 10px 0;
-                }}
-                th, td {{
+                }
+                th, td {
                     border: 1px solid #ddd;
                     padding: 8px;
                     text-align: left;
-                }}
-                th {{
+                }
+                th {
                     background-color: #f2f2f2;
-                }}
-                .matrix-table {{
+                }
+                .matrix-table {
                     border: 2px solid #333;
                     margin: 15px auto;
                     text-align: center;
-                }}
-                .matrix-table td {{
+                }
+                .matrix-table td {
                     border: 1px solid #333;
                     padding: 10px;
                     font-family: 'Courier New', monospace;
                     font-weight: bold;
-                }}
-                ul, ol {{
+                }
+                ul, ol {
                     padding-left: 20px;
-                }}
-                a {{
+                }
+                a {
                     color: #3498db;
                     text-decoration: none;
-                }}
-                a:hover {{
+                }
+                a:hover {
                     text-decoration: underline;
-                }}
+                }
             </style>
         </head>
         <body>
-            {html_content}
+            """
+EMAIL_HTML_TAIL = """
         </body>
         </html>
         """
+
+# Building a Markdown instance loads every extension, so each thread keeps one and resets it between uses
+_markdown_local = threading.local()
+
+def get_markdown_renderer():
+    """Return this thread's Markdown renderer, reset and ready for a new document"""
+    md = getattr(_markdown_local, "renderer", None)
+    if md is None:
+        md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+        _markdown_local.renderer = md
+    return md.reset()
+
+def convert_markdown_to_html(markdown_text):
+    """Convert markdown text to HTML for email display"""
+    try:
+        # Pre-process LaTeX syntax to make it email-friendly
+        processed_text = preprocess_latex(markdown_text)
+        
+        # Convert markdown to HTML
+        html_content = get_markdown_renderer().convert(processed_text)
         
-        return styled_html
+        return EMAIL_HTML_HEAD + html_content + EMAIL_HTML_TAIL
     except Exception as e:
         print(f"Error converting markdown to HTML: {e}")
         # Fallback to plain text if conversion fails
         return f"<html><body><pre>{markdown_text}</pre></body></html>"
 
-def is_markdown_content(text):
-    """Check if the text contains markdown formatting or LaTeX syntax"""
-    markdown_patterns = [
-        r'^#{1,6}\s+',  # Headers
-        r'\*\*.*?\*\*',  # Bold
-        r'\*.*?\*',      # Italic
-        r'`.*?`',        # Inline code
-        r'```.*?```',    # Code blocks
-        r'^\s*[-*+]\s+', # Lists
-        r'^\s*\d+\.\s+', # Numbered lists
-        r'^\s*>\s+',     # Blockquotes
-        r'\[.*?\]\(.*?\)', # Links
-        r'^\|.*\|$',     # Tables
-        # LaTeX patterns
-        r'\$\$.*?\$\$',  # LaTeX display math
-        r'\$.*?\$',      # LaTeX inline math
-        r'\\begin\{.*?\}', # LaTeX environments
-        r'\\end\{.*?\}',   # LaTeX environments
-        r'\\[a-zA-Z]+\{.*?\}', # LaTeX commands
-    ]
+def build_raw_email(to, subject, message):
+    """Build the base64url-encoded MIME message Gmail expects, with markdown support"""
+    # Check if the message contains markdown formatting
+    if is_markdown_content(message):
+        # Create multipart email with both HTML and plain text
+        email_message = MIMEMultipart('alternative')
+        
+        # Create plain text version (strip markdown formatting)
+        plain_text = strip_markdown(message)
+        
+        # Create HTML version
+        html_content = convert_markdown_to_html(message)
+        
+        # Attach both versions
+        part1 = MIMEText(plain_text, 'plain', 'utf-8')
+        part2 = MIMEText(html_content, 'html', 'utf-8')
+        
+        email_message.attach(part1)
+        email_message.attach(part2)
+    else:
+        # Create simple text email
+        email_message = MIMEText(message, 'plain', 'utf-8')
+    
+    # Set email headers
+    email_message['To'] = to
+    email_message['Subject'] = subject
+    email_message['From'] = ''
     
-    for pattern in markdown_patterns:
-        if re.search(pattern, text, re.MULTILINE | re.DOTALL):
-            return True
-    return False
+    # Encode the email
+    return base64.urlsafe_b64encode(email_message.as_bytes()).decode()
 
 def send_email(to, subject, message, user_id=None):
     """Send an email to the user with markdown support"""
     try:
         print(f"send_email called with user_id: me")
         service = get_email_service(user_id)
-        
-        # Check if service.users() exists
-        users_resource = service.users()
-        print(f"Users resource type: {type(users_resource)}")
-        print(f"Users resource has sendMessage: {hasattr(users_resource, 'sendMessage')}")
-        print(f"Available methods on users_resource: {dir(users_resource)}")
-        
-        # Check if the message contains markdown formatting
-        if is_markdown_content(message):
-            print("Markdown content detected, converting to HTML email")
-            # Create multipart email with both HTML and plain text
-            email_message = MIMEMultipart('alternative')
-            
-            # Create plain text version (strip markdown formatting)
-            plain_text = re.sub(r'#{1,6}\s+', '', message)  # Remove headers
-            plain_text = re.sub(r'\*\*(.*?)\*\*', r'\1', plain_text)  # Remove bold
-            plain_text = re.sub(r'\*(.*?)\*', r'\1', plain_text)  # Remove italic
-            plain_text = re.sub(r'`(.*?)`', r'\1', plain_text)  # Remove inline code
-            plain_text = re.sub(r'```.*?```', '', plain_text, flags=re.DOTALL)  # Remove code blocks
-            plain_text = re.sub(r'^\s*[-*+]\s+', '- ', plain_text, flags=re.MULTILINE)  # Convert lists
-            plain_text = re.sub(r'^\s*\d+\.\s+', '1. ', plain_text, flags=re.MULTILINE)  # Convert numbered lists
-            plain_text = re.sub(r'^\s*>\s+', '', plain_text, flags=re.MULTILINE)  # Remove blockquotes
-            plain_text = re.sub(r'\[(.*?)\]\(.*?\)', r'\1', plain_text)  # Remove link formatting
-            
-            # Create HTML version
-            html_content = convert_markdown_to_html(message)
-            
-            # Attach both versions
-            part1 = MIMEText(plain_text, 'plain', 'utf-8')
-            part2 = MIMEText(html_content, 'html', 'utf-8')
-            
-            email_message.attach(part1)
-            email_message.attach(part2)
-        else:
-            print("Plain text content, creating simple text email")
-            # Create simple text email
-            email_message = MIMEText(message, 'plain', 'utf-8')
-        
-        # Set email headers
-        email_message['To'] = to
-        email_message['Subject'] = subject
-        email_message['From'] = ''
-        
-        # Encode the email
-        raw = base64.urlsafe_b64encode(email_message.as_bytes()).decode()
+        raw = build_raw_email(to, subject, message)
         
         print("Attempting to send email...")
-        # Try the correct method name - it should be 'messages' not 'sendMessage'
-        messages_resource = users_resource.messages()
-        print(f"Messages resource type: {type(messages_resource)}")
-        print(f"Messages resource has send: {hasattr(messages_resource, 'send')}")
-        result = messages_resource.send(userId="me", body={"raw": raw}).execute()
+        result = service.users().messages().send(userId="me", body={"raw": raw}).execute()
         print(f"Email sent successfully: {result}")
         return {'message': 'Email sent successfully'}
     except Exception as e:
@@ -298,11 +231,130 @@ def send_email(to, subject, message, user_id=None):
         print(f"Error type: {type(e)}")
         return {'error': str(e)}
 
+class TokenBucket:
+    """Token bucket limiting how fast one user's messages are handed to Gmail"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available, then take them"""
+        if tokens > self.capacity:
+            raise ValueError(f"Cannot take {tokens} tokens from a bucket of capacity {self.capacity}")
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+def get_send_bucket(user_id):
+    with _send_buckets_lock:
+        bucket = _send_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(GMAIL_SENDS_PER_SECOND, GMAIL_SEND_BURST)
+            _send_buckets[user_id] = bucket
+        return bucket
+
+def render_email_template(template, variables):
+    """Fill {{name}} placeholders; unknown placeholders are left as they are"""
+    return _TEMPLATE_FIELD_RE.sub(lambda m: str(variables.get(m.group(1), m.group(0))), template)
+
+def _is_rate_limit_error(exception):
+    if not isinstance(exception, HttpError):
+        return False
+    return exception.resp.status == 429 or (exception.resp.status == 403 and b"rateLimitExceeded" in (exception.content or b""))
+
+def send_bulk_email(recipients, subject, message, user_id=None):
+    """Send a personalised email to many recipients using Gmail batch requests.
+    
+    recipients is a list of email addresses or of dicts with an "email" key
+    plus any template variables. subject and message may use {{variable}}
+    placeholders, e.g. {{name}}; {{email}} is always available.
+    
+    Returns a summary with one result per recipient.
+    """
+    try:
+        if not recipients:
+            return {"error": "No recipients provided"}
+        service = get_email_service(user_id)
+        bucket = get_send_bucket(user_id)
+        
+        results = []
+        pending = []
+        for recipient in recipients:
+            variables = dict(recipient) if isinstance(recipient, dict) else {"email": recipient}
+            to = variables.get("email")
+            if not to:
+                results.append({"to": None, "status": "failed", "error": "Recipient has no email address"})
+                continue
+            result = {"to": to, "status": "pending"}
+            results.append(result)
+            try:
+                raw = build_raw_email(to, render_email_template(subject, variables), render_email_template(message, variables))
+                pending.append((result, raw))
+            except Exception as e:
+                result.update(status="failed", error=f"Could not build message: {str(e)}")
+        
+        attempt = 0
+        while pending:
+            retry = []
+            for i in range(0, len(pending), GMAIL_BATCH_SIZE):
+                batch_items = pending[i:i + GMAIL_BATCH_SIZE]
+                def callback(request_id, response, exception, batch_items=batch_items):
+                    result, raw = batch_items[int(request_id)]
+                    if exception is None:
+                        result.update(status="sent", message_id=response.get("id"))
+                    elif _is_rate_limit_error(exception) and attempt < GMAIL_SEND_RETRIES:
+                        retry.append((result, raw))
+                    else:
+                        result.update(status="failed", error=str(exception))
+                batch = service.new_batch_http_request(callback=callback)
+                for request_id, (result, raw) in enumerate(batch_items):
+                    batch.add(service.users().messages().send(userId="me", body={"raw": raw}), request_id=str(request_id))
+                bucket.acquire(len(batch_items))
+                try:
+                    batch.execute()
+                except Exception as e:
+                    # Earlier batches went out, so report them rather than fail the whole call.
+                    # The batch may have been partly delivered; it is not retried to avoid duplicates.
+                    print(f"Error executing Gmail batch: {e}")
+                    retrying = {id(result) for result, _ in retry}
+                    for result, raw in batch_items:
+                        if result["status"] == "pending" and id(result) not in retrying:
+                            result.update(status="failed", error=f"Batch request failed: {str(e)}")
+            if retry:
+                attempt += 1
+                print(f"Gmail rate limit hit, retrying {len(retry)} messages (attempt {attempt})")
+                time.sleep(2 ** attempt)
+            pending = retry
+        
+        sent = sum(1 for result in results if result["status"] == "sent")
+        return {
+            "success": sent > 0,
+            "message": f"Sent {sent} of {len(results)} emails",
+            "sent": sent,
+            "failed": len(results) - sent,
+            "results": results
+        }
+    except Exception as e:
+        print(f"Error in send_bulk_email: {e}")
+        return {"error": str(e)}
+
 def handle_part(part, user_id=None):
     if not part or not part.function_call:
         return
     available_functions={
         "send_email": send_email,
+        "send_bulk_email": send_bulk_email,
         "list_courses": list_courses,
         "list_course_students": list_course_students,
         "list_student_submissions": list_student_submissions,
@@ -320,7 +372,8 @@ def handle_part(part, user_id=None):
         "get_form_response": get_form_response,
         "question_bank_generator": question_bank_generator,
         "create_coursework": create_coursework,
-        "answer_key_generator": answer_key_generator
+        "answer_key_generator": answer_key_generator,
+        "assessment_pack_generator": assessment_pack_generator
     }
     if part.function_call.name in available_functions:
         response=available_functions[part.function_call.name](**part.function_call.args, user_id=user_id)
@@ -1,36 +1,54 @@
 from flask import Blueprint, request, jsonify
 import os
+import shutil
 import uuid
-import json
+import threading
 from datetime import datetime
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import PyPDF2
 import docx
-import sqlite3
 from PIL import Image
 import pytesseract
+from rag_utils import lexical_index
+from rag_utils import vector_store
+from rag_utils import file_lock
+from rag_utils import metrics
+from db_utils import metadata_db
+from rag_utils.models import get_embedder
 
 file_service = Blueprint("file_service", __name__)
 
-# Initialize the sentence transformer model
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
 # Set default DATA_DIR if not provided
 DATA_DIR = os.getenv("DATA_DIR", ".")
 FILE_UPLOAD_FOLDER = os.path.join(DATA_DIR, "uploads")
 USER_DIR = os.path.join(DATA_DIR, "users")
 VECTOR_DB_DIR = os.path.join(DATA_DIR, "vector_dbs")
-FOLDER_DB_PATH = os.path.join(DATA_DIR, "folders.db")
+
+# Callbacks run after a general upload is deleted, e.g. to drop its chunks from a vector index
+_file_delete_listeners = []
+
+# Folder indexes always use this model; their stores are 384-dimensional
+FOLDER_EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Characters per folder chunk; chunks do not overlap
+FOLDER_CHUNK_SIZE = int(os.getenv("FOLDER_CHUNK_SIZE", 1000))
+
+# Compact a folder's vector store once this share of its rows belong to deleted files
+FOLDER_COMPACTION_RATIO = float(os.getenv("FOLDER_COMPACTION_RATIO", 0.25))
+
+_compacting_folders = set()
+_compacting_lock = threading.Lock()
+metrics.FOLDER_COMPACTIONS_PENDING.set_function(lambda: len(_compacting_folders))
 
 # Create directories if they don't exist
 os.makedirs(FILE_UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(USER_DIR, exist_ok=True)
 os.makedirs(VECTOR_DB_DIR, exist_ok=True)
 
-def get_metadata_path(user_id):
-    return os.path.join(USER_DIR, user_id, "metadata.jsonl")
+def on_file_deleted(listener):
+    """Register listener(user_id, file_id) to be called after a general upload is deleted"""
+    _file_delete_listeners.append(listener)
+    return listener
 
 def get_folder_metadata_path(user_id, folder_id):
     """Get metadata path for files in a specific folder"""
@@ -39,9 +57,33 @@ def get_folder_metadata_path(user_id, folder_id):
     return os.path.join(folder_metadata_dir, "metadata.jsonl")
 
 def get_folder_vector_db_path(user_id, folder_id):
-    """Get the path for a folder's vector database"""
+    """Get the path for a folder's legacy FAISS .bin index"""
     return os.path.join(VECTOR_DB_DIR, f"{user_id}_{folder_id}.bin")
 
+def get_folder_vector_store_prefix(user_id, folder_id):
+    """Get the path prefix for a folder's memory-mapped vector store"""
+    return os.path.join(VECTOR_DB_DIR, f"{user_id}_{folder_id}")
+
+def get_folder_lexical_index_path(user_id, folder_id):
+    """Get the path for a folder's BM25 lexical index"""
+    return os.path.join(VECTOR_DB_DIR, f"{user_id}_{folder_id}.lex.jsonl")
+
+def get_folder_lock(user_id, folder_id):
+    """Lock for writes to a folder's store, chunk spans and lexical index.
+    
+    It is the store's own writer lock and holds across worker processes, so a
+    compaction never renumbers rows under a concurrent upload or delete.
+    """
+    return file_lock.get_lock(get_folder_vector_store_prefix(user_id, folder_id) + ".lock")
+
+def open_folder_store(user_id, folder_id):
+    """Open a folder's vector store, migrating its legacy FAISS index if needed"""
+    return vector_store.ensure_store(
+        get_folder_vector_store_prefix(user_id, folder_id),
+        get_folder_vector_db_path(user_id, folder_id),
+        get_folder_metadata_path(user_id, folder_id)
+    )
+
 def extract_text_from_file(file_path, file_type):
     """Extract text content from various file types"""
     try:
@@ -89,84 +131,104 @@ def extract_text_from_file(file_path, file_type):
         print(f"Error extracting text from {file_path}: {str(e)}")
         return ""
 
-def add_to_vector_db(user_id, folder_id, file_id, text_content):
-    """Add text content to the folder's vector database"""
+def add_to_vector_db(user_id, folder_id, file_id, text_content, chunk_size=FOLDER_CHUNK_SIZE, file_record=None):
+    """Add text content to the folder's vector database.
+    
+    Returns (start_pos, chunk_count): where the file's chunks start in the store and how many were added.
+    With file_record, the file row and its chunk span are saved under the same folder lock as the
+    append, so a compaction cannot renumber the rows before the span is recorded.
+    """
     try:
         print(f"DEBUG: add_to_vector_db called with text length: {len(text_content)}")
-        vector_db_path = get_folder_vector_db_path(user_id, folder_id)
-        metadata_path = get_folder_metadata_path(user_id, folder_id)
-        
-        # Load existing index or create new one
-        if os.path.exists(vector_db_path):
-            index = faiss.read_index(vector_db_path)
-        else:
-            dimension = 384  # all-MiniLM-L6-v2 output size
-            index = faiss.IndexFlatL2(dimension)
         
-        # Split text into chunks (you can adjust chunk size)
-        chunk_size = 1000
+        # Split text into chunks
         chunks = [text_content[i:i+chunk_size] for i in range(0, len(text_content), chunk_size)]
         print(f"DEBUG: Created {len(chunks)} chunks from text")
         
         # Generate embeddings for each chunk
-        embeddings = model.encode(chunks)
+        embeddings = get_embedder(FOLDER_EMBED_MODEL_NAME).encode(chunks)
         print(f"DEBUG: Generated embeddings shape: {embeddings.shape}")
         
-        # Add embeddings to the index
-        index.add(embeddings.astype('float32'))
-        
-        # Save the updated index
-        faiss.write_index(index, vector_db_path)
-        
-        # Save chunk metadata to the metadata file
-        print(f"DEBUG: Saving {len(chunks)} chunk metadata entries")
-        for i, chunk_text in enumerate(chunks):
-            chunk_metadata = {
-                "file_id": file_id,
-                "chunk_index": i,
-                "chunk_text": chunk_text,
-                "user_id": user_id,
-                "folder_id": folder_id,
-                "created_at": datetime.now().isoformat()
-            }
+        with get_folder_lock(user_id, folder_id):
+            # Append embeddings and chunk texts to the folder's store
+            start_pos = open_folder_store(user_id, folder_id).append(embeddings, chunks, file_id)
+            
+            # Index the same chunks lexically, keyed by their position in the vector store
+            lexical_index.append_chunks(get_folder_lexical_index_path(user_id, folder_id), start_pos, chunks)
             
-            # Append chunk metadata to the metadata file
-            with open(metadata_path, "a") as f:
-                f.write(json.dumps(chunk_metadata) + "\n")
+            if file_record is not None:
+                file_record["chunk_count"] = len(chunks)
+                metadata_db.add_file(file_record, start_pos)
         
-        print(f"DEBUG: Successfully saved chunk metadata to {metadata_path}")
+        print(f"DEBUG: Stored {len(chunks)} chunks at positions {start_pos}-{start_pos + len(chunks) - 1}")
         
-        return len(chunks)
+        return start_pos, len(chunks)
         
     except Exception as e:
         print(f"Error adding to vector database: {str(e)}")
-        return 0
+        return None, 0
 
-def update_folder_file_count(user_id, folder_id,file_count):
-    """Update the file count for a folder"""
-    try:
-        conn = sqlite3.connect(FOLDER_DB_PATH)
-        cursor = conn.cursor()
-        
-        # Count files in the folder
-            
-        # Update the file count in the database
-        cursor.execute('''
-            SELECT file_count FROM folders 
-            WHERE folder_id = ? AND user_id = ?
-        ''', (folder_id, user_id))
-        file_count = cursor.fetchone()[0] + file_count  
-        cursor.execute('''
-            UPDATE folders 
-            SET file_count = ? 
-            WHERE folder_id = ? AND user_id = ?
-        ''', (file_count, folder_id, user_id))
-        
-        conn.commit()
-        conn.close()
-        
-    except Exception as e:
-        print(f"Error updating folder file count: {str(e)}")
+def remove_from_vector_db(user_id, folder_id, file_id):
+    """Remove one file's chunks from the folder's vector database; returns how many were removed.
+    
+    The file's rows are looked up by its chunk spans and tombstoned, so the cost
+    depends on the file's chunk count rather than the folder size.
+    """
+    with get_folder_lock(user_id, folder_id):
+        store = open_folder_store(user_id, folder_id)
+        spans = metadata_db.get_chunk_spans(folder_id, file_id)
+        if not spans:
+            # Files indexed before chunk spans were recorded
+            spans = [span for span in store.file_spans() if span[0] == file_id]
+        positions = [pos for _, start_pos, count in spans for pos in range(start_pos, start_pos + count)]
+        store.delete_rows(positions)
+        needs_compaction = store.deleted_count > FOLDER_COMPACTION_RATIO * store.ntotal
+    
+    print(f"DEBUG: Removed {len(positions)} chunks of file {file_id} from folder {folder_id}")
+    if needs_compaction:
+        schedule_folder_compaction(user_id, folder_id)
+    return len(positions)
+
+def compact_folder_index(user_id, folder_id):
+    """Drop deleted rows from a folder's store, then renumber its chunk spans and lexical index"""
+    with get_folder_lock(user_id, folder_id):
+        store = open_folder_store(user_id, folder_id)
+        if store.compact():
+            metadata_db.replace_chunk_spans(folder_id, store.file_spans())
+            lexical_index.rebuild_index(get_folder_lexical_index_path(user_id, folder_id), store.chunk_texts())
+
+def schedule_folder_compaction(user_id, folder_id):
+    """Compact a folder's index in a background thread, at most one run per folder at a time"""
+    with _compacting_lock:
+        if (user_id, folder_id) in _compacting_folders:
+            return
+        _compacting_folders.add((user_id, folder_id))
+    
+    def run():
+        try:
+            compact_folder_index(user_id, folder_id)
+        except Exception as e:
+            print(f"Error compacting folder {folder_id}: {str(e)}")
+        finally:
+            with _compacting_lock:
+                _compacting_folders.discard((user_id, folder_id))
+    
+    threading.Thread(target=run, daemon=True).start()
+
+def delete_folder_file(user_id, file_record):
+    """Remove a folder file's chunks, metadata row and uploaded copy"""
+    folder_id = file_record["folder_id"]
+    remove_from_vector_db(user_id, folder_id, file_record["file_id"])
+    metadata_db.delete_file(user_id, file_record["file_id"])
+    file_path = os.path.join(FILE_UPLOAD_FOLDER, user_id, "folders", folder_id, file_record["file_name"])
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+def delete_folder_files(user_id, folder_id):
+    """Remove the uploads and legacy metadata directories of a deleted folder"""
+    for folder_dir in (os.path.join(FILE_UPLOAD_FOLDER, user_id, "folders", folder_id),
+                       os.path.join(USER_DIR, user_id, "folders", folder_id)):
+        shutil.rmtree(folder_dir, ignore_errors=True)
 
 @file_service.route("/upload/<user_id>", methods=["POST"])
 def upload_file(user_id):
@@ -176,7 +238,11 @@ def upload_file(user_id):
         
         if folder_id:
             # Folder-based upload
-            return upload_to_folder(user_id, folder_id)
+            metrics.INGESTIONS_IN_PROGRESS.inc()
+            try:
+                return upload_to_folder(user_id, folder_id)
+            finally:
+                metrics.INGESTIONS_IN_PROGRESS.dec()
         else:
             # Regular upload (existing functionality)
             return upload_to_general(user_id)
@@ -188,20 +254,10 @@ def upload_to_folder(user_id, folder_id):
     """Upload files to a specific folder"""
     try:
         # Verify folder exists and belongs to user
-        conn = sqlite3.connect(FOLDER_DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT folder_name FROM folders 
-            WHERE folder_id = ? AND user_id = ?
-        ''', (folder_id, user_id))
-        
-        folder_info = cursor.fetchone()
+        folder_info = metadata_db.get_folder(user_id, folder_id)
         if not folder_info:
-            conn.close()
             return jsonify({"error": "Folder not found"}), 404
         
-        conn.close()
-        
         # Create folder directory structure
         folder_dir = os.path.join(FILE_UPLOAD_FOLDER, user_id, "folders", folder_id)
         os.makedirs(folder_dir, exist_ok=True) 
@@ -210,11 +266,18 @@ def upload_to_folder(user_id, folder_id):
 
         file_keys = [key for key in request.files.keys() if key.startswith('file_')]
         
+        # With replace_existing, an upload supersedes files of the same name in the folder
+        replace_existing = request.form.get('replace_existing', '').lower() in ('1', 'true', 'yes')
+        existing_files = {}
+        if replace_existing:
+            for file_record in metadata_db.list_files(user_id, folder_id):
+                existing_files.setdefault(file_record["original_name"], []).append(file_record)
+        
         for file_key in file_keys:
             file = request.files[file_key]
             if file.filename == '':
                 continue
-                
+            
             file_id = str(uuid.uuid4())
             file_name = file_id + "_" + file.filename
             CREATED_AT = datetime.now().isoformat()
@@ -229,15 +292,6 @@ def upload_to_folder(user_id, folder_id):
             print(f"DEBUG: Extracted text length: {len(text_content)} for file {file.filename}")
             print(f"DEBUG: First 200 chars: {text_content[:200]}")
             
-            # Add to vector database
-            chunk_count = 0
-            if text_content.strip():
-                chunk_count = add_to_vector_db(user_id, folder_id, file_id, text_content)
-                print(f"DEBUG: Created {chunk_count} chunks for file {file.filename}")
-            else:
-                print(f"DEBUG: No text content extracted from {file.filename}")
-            
-            # Save metadata
             metadata = {
                 "file_id": file_id, 
                 "file_name": file_name, 
@@ -246,24 +300,36 @@ def upload_to_folder(user_id, folder_id):
                 "folder_id": folder_id,
                 "created_at": CREATED_AT,
                 "file_size": os.path.getsize(file_path),
-                "chunk_count": chunk_count
+                "chunk_count": 0
             }
             
-            # Save to folder-specific metadata
-            folder_metadata_path = get_folder_metadata_path(user_id, folder_id)
-            with open(folder_metadata_path, "a") as f:
-                f.write(json.dumps(metadata) + "\n")
+            # Add to vector database; the file record, chunk span and folder counters
+            # are saved together with the append
+            start_pos = None
+            if text_content.strip():
+                start_pos, chunk_count = add_to_vector_db(user_id, folder_id, file_id, text_content, file_record=metadata)
+                print(f"DEBUG: Created {chunk_count} chunks for file {file.filename}")
+            else:
+                print(f"DEBUG: No text content extracted from {file.filename}")
             
+            if start_pos is None:
+                # Nothing was indexed, so there is no chunk span to record
+                metadata["chunk_count"] = 0
+                metadata_db.add_file(metadata)
+            
+            # The old version is only removed once the new one is indexed
+            replaced_files = existing_files.pop(file.filename, [])
+            for file_record in replaced_files:
+                delete_folder_file(user_id, file_record)
+            if replaced_files:
+                metadata["replaced_file_ids"] = [file_record["file_id"] for file_record in replaced_files]
             uploaded_files.append(metadata)
         
-        # Update folder file count
-            update_folder_file_count(user_id, folder_id,len(uploaded_files))
-        
         return jsonify({
             "message": f"Successfully uploaded {len(uploaded_files)} files to folder",
             "files": uploaded_files,
             "folder_id": folder_id,
-            "folder_name": folder_info[0]
+            "folder_name": folder_info["folder_name"]
         })
         
     except Exception as e:
@@ -305,8 +371,7 @@ def upload_to_general(user_id):
                 "file_size": os.path.getsize(os.path.join(user_dir, file_name))
             }
             
-            with open(get_metadata_path(user_id), "a") as f:
-                f.write(json.dumps(metadata) + "\n")
+            metadata_db.add_file(metadata)
             
             uploaded_files.append(metadata)
         
@@ -322,20 +387,14 @@ def upload_to_general(user_id):
 def get_files(user_id):
     try:
         files = []
-        metadata_path = get_metadata_path(user_id)
-        
-        if os.path.exists(metadata_path):
-            with open(metadata_path, "r") as f:
-                for line in f:
-                    if line.strip():  # Skip empty lines
-                        metadata = json.loads(line)
-                        files.append({
-                            "file_id": metadata["file_id"], 
-                            "file_name": metadata["file_name"],
-                            "original_name": metadata.get("original_name", metadata["file_name"]),
-                            "created_at": metadata["created_at"],
-                            "file_size": metadata.get("file_size", 0)
-                        })
+        for metadata in metadata_db.list_files(user_id):
+            files.append({
+                "file_id": metadata["file_id"], 
+                "file_name": metadata["file_name"],
+                "original_name": metadata["original_name"],
+                "created_at": metadata["created_at"],
+                "file_size": metadata["file_size"]
+            })
         
         return jsonify({"files": files, "user_id": user_id})
         
@@ -345,39 +404,40 @@ def get_files(user_id):
 @file_service.route("/delete_file/<user_id>/<file_id>", methods=["DELETE"])
 def delete_file(user_id, file_id):
     try:
-        metadata_path = get_metadata_path(user_id)
-        file_name = None
+        metadata = metadata_db.get_file(user_id, file_id)
+        if not metadata:
+            return jsonify({"error": "File not found"}), 404
         
-        if not os.path.exists(metadata_path):
-            return jsonify({"error": "No files found for user"}), 404
+        if metadata["folder_id"]:
+            delete_folder_file(user_id, metadata)
+            return jsonify({
+                "message": "File deleted successfully",
+                "user_id": user_id,
+                "folder_id": metadata["folder_id"],
+                "file_name": metadata["file_name"]
+            })
         
-        # Read and filter metadata
-        with open(metadata_path, "r") as f:
-            lines = f.readlines()
+        # Indexed delete of the metadata row; no other records are read or rewritten
+        metadata_db.delete_file(user_id, file_id)
+        file_name = metadata["file_name"]
         
-        with open(metadata_path, "w") as f:
-            for line in lines:
-                if line.strip():  # Skip empty lines
-                    metadata = json.loads(line)
-                    if metadata["file_id"] != file_id:
-                        f.write(line)
-                    else:
-                        file_name = metadata["file_name"]
+        # Delete the actual file
+        file_path = os.path.join(FILE_UPLOAD_FOLDER, user_id, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
         
-        if file_name:
-            # Delete the actual file
-            file_path = os.path.join(FILE_UPLOAD_FOLDER, user_id, file_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            
-            return jsonify({
-                "message": "File deleted successfully", 
-                "user_id": user_id, 
-                "file_name": file_name
-            })
-        else:
-            return jsonify({"error": "File not found"}), 404
+        # Remove derived chunks from any vector index the file was ingested into
+        for listener in _file_delete_listeners:
+            try:
+                listener(user_id, file_id)
+            except Exception as e:
+                print(f"Error removing chunks of deleted file {file_id}: {str(e)}")
+        
+        return jsonify({
+            "message": "File deleted successfully", 
+            "user_id": user_id, 
+            "file_name": file_name
+        })
             
     except Exception as e:
         return jsonify({"error": f"Failed to delete file: {str(e)}"}), 500
-
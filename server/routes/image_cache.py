@@ -0,0 +1,168 @@
+"""
+On-disk cache for images embedded in generated assessment PDFs.
+
+Images are stored once per content hash (the SHA-256 of the normalized
+JPEG), so the same diagram reached through different URLs is kept only
+once. A small SQLite index maps URLs to content hashes, remembers URLs
+that recently failed (negative cache) and tracks last use for
+size-bounded LRU eviction.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+
+DATA_DIR = os.getenv("DATA_DIR", ".")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(DATA_DIR, "image_cache"))
+IMAGE_CACHE_DB_PATH = os.path.join(IMAGE_CACHE_DIR, "index.db")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+NEGATIVE_CACHE_TTL = int(os.getenv("IMAGE_CACHE_NEGATIVE_TTL", "3600"))  # seconds
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect():
+    global _initialized
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+                conn = sqlite3.connect(IMAGE_CACHE_DB_PATH, timeout=10)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS urls (
+                        url TEXT PRIMARY KEY,
+                        content_hash TEXT,
+                        error TEXT,
+                        fetched_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS blobs (
+                        content_hash TEXT PRIMARY KEY,
+                        size INTEGER NOT NULL,
+                        width INTEGER NOT NULL,
+                        height INTEGER NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_urls_hash ON urls(content_hash)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_last_used ON blobs(last_used)")
+                conn.commit()
+                conn.close()
+                _initialized = True
+    return sqlite3.connect(IMAGE_CACHE_DB_PATH, timeout=10)
+
+
+def _blob_path(content_hash):
+    return os.path.join(IMAGE_CACHE_DIR, content_hash[:2], content_hash + ".jpg")
+
+
+def get_cached_image(url):
+    """Look up url in the cache.
+
+    Returns {"data", "width", "height"} on a hit, {"error": message} for a
+    URL that failed within NEGATIVE_CACHE_TTL, or None on a miss.
+    """
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("""
+                SELECT u.content_hash, u.error, u.fetched_at, b.width, b.height
+                FROM urls u LEFT JOIN blobs b ON b.content_hash = u.content_hash
+                WHERE u.url = ?
+            """, (url,)).fetchone()
+            if row is None:
+                return None
+            content_hash, error, fetched_at, width, height = row
+            if error is not None:
+                if time.time() - fetched_at < NEGATIVE_CACHE_TTL:
+                    return {"error": error}
+                return None
+            if width is None:
+                return None  # blob was evicted
+            try:
+                with open(_blob_path(content_hash), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE blobs SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+            conn.commit()
+            return {"data": data, "width": width, "height": height}
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Image cache lookup failed for {url}: {e}")
+        return None
+
+
+def cache_image(url, image):
+    """Store a normalized image ({"data", "width", "height"}) for url"""
+    content_hash = hashlib.sha256(image["data"]).hexdigest()
+    path = _blob_path(content_hash)
+    try:
+        conn = _connect()
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(image["data"])
+                os.replace(temp_path, path)
+            now = time.time()
+            conn.execute("""
+                INSERT OR REPLACE INTO blobs (content_hash, size, width, height, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            """, (content_hash, len(image["data"]), image["width"], image["height"], now))
+            conn.execute("""
+                INSERT OR REPLACE INTO urls (url, content_hash, error, fetched_at)
+                VALUES (?, ?, NULL, ?)
+            """, (url, content_hash, now))
+            conn.commit()
+            _evict(conn)
+        finally:
+            conn.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"Image cache store failed for {url}: {e}")
+
+
+def cache_failure(url, error):
+    """Remember that url could not be used so it is not retried for NEGATIVE_CACHE_TTL"""
+    try:
+        conn = _connect()
+        try:
+            conn.execute("""
+                INSERT OR REPLACE INTO urls (url, content_hash, error, fetched_at)
+                VALUES (?, NULL, ?, ?)
+            """, (url, error, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Image cache store failed for {url}: {e}")
+
+
+def _evict(conn):
+    """Remove least recently used blobs until the cache fits IMAGE_CACHE_MAX_BYTES"""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+    if total <= IMAGE_CACHE_MAX_BYTES:
+        return
+    evicted = []
+    for content_hash, size in conn.execute("SELECT content_hash, size FROM blobs ORDER BY last_used"):
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            break
+        evicted.append(content_hash)
+        total -= size
+    for content_hash in evicted:
+        conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+        conn.execute("DELETE FROM urls WHERE content_hash = ?", (content_hash,))
+        try:
+            os.remove(_blob_path(content_hash))
+        except FileNotFoundError:
+            pass
+    conn.commit()
+    print(f"Evicted {len(evicted)} images from the image cache")
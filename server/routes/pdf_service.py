@@ -1,35 +1,262 @@
 import os
 import requests
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from fpdf import FPDF
-from routes.drive_service import get_drive_service,upload_local_file_to_drive
+from PIL import Image
+from routes.drive_service import get_drive_service,upload_bytes_to_drive,get_drive_credentials,new_authorized_http,upload_bytes_with_service,share_files_publicly
+from googleapiclient.discovery import build
+from routes import image_cache
+from rag_utils import metrics
+from routes.text_utils import clean_text_for_pdf
+import threading
 import uuid
-import re
 
-def clean_text_for_pdf(text):
-    """Clean text to remove or replace Unicode characters that cause encoding issues"""
-    if not text:
-        return ""
-    
-    # Replace common Unicode characters with ASCII equivalents
-    replacements = {
-        '\u2013': '-',  # en-dash
-        '\u2014': '--', # em-dash
-        '\u2018': "'",  # left single quotation mark
-        '\u2019': "'",  # right single quotation mark
-        '\u201c': '"',  # left double quotation mark
-        '\u201d': '"',  # right double quotation mark
-        '\u2026': '...', # horizontal ellipsis
-        '\u00a0': ' ',  # non-breaking space
-    }
-    
-    for unicode_char, ascii_char in replacements.items():
-        text = text.replace(unicode_char, ascii_char)
+# Image prefetching for question banks / answer keys
+IMAGE_FETCH_WORKERS = int(os.getenv("PDF_IMAGE_FETCH_WORKERS", "8"))
+IMAGE_FETCH_TIMEOUT = 10  # seconds per request
+IMAGE_FETCH_DEADLINE = float(os.getenv("PDF_IMAGE_FETCH_DEADLINE", "20"))  # seconds for all images
+MAX_IMAGE_BYTES = int(os.getenv("PDF_MAX_IMAGE_BYTES", str(5 * 1024 * 1024)))
+# Images are drawn at 150x100 mm; anything above PDF_IMAGE_DPI at that size is wasted
+PDF_IMAGE_WIDTH_MM, PDF_IMAGE_HEIGHT_MM = 150, 100
+PDF_IMAGE_DPI = int(os.getenv("PDF_IMAGE_DPI", "150"))
+PDF_IMAGE_MAX_PX = (round(PDF_IMAGE_WIDTH_MM / 25.4 * PDF_IMAGE_DPI), round(PDF_IMAGE_HEIGHT_MM / 25.4 * PDF_IMAGE_DPI))
+FAKE_IMAGE_DOMAINS = ['example.com', 'example.org', 'placeholder.com', 'via.placeholder.com', 'dummyimage.com']
+
+# Batch generation of whole course packs
+BATCH_GENERATION_WORKERS = int(os.getenv("PDF_BATCH_WORKERS", "4"))
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Shared requests session with a connection pool sized for image prefetching"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=IMAGE_FETCH_WORKERS, pool_maxsize=IMAGE_FETCH_WORKERS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({
+                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                })
+                _http_session = session
+    return _http_session
+
+def image_url_problem(image_url):
+    """Return a note to print instead of the image, or None if the URL can be fetched"""
+    if any(domain in image_url.lower() for domain in FAKE_IMAGE_DOMAINS):
+        return "[Note: Image reference appears to be a placeholder URL and was skipped]"
+    if not image_url.startswith(('http://', 'https://')):
+        return f"[Invalid image URL: {image_url}]"
+    return None
+
+def download_image(image_url):
+    """Download an image, refusing anything larger than MAX_IMAGE_BYTES"""
+    with get_http_session().get(image_url, timeout=IMAGE_FETCH_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        if int(response.headers.get('content-length') or 0) > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+        data = bytearray()
+        for chunk in response.iter_content(64 * 1024):
+            data += chunk
+            if len(data) > MAX_IMAGE_BYTES:
+                raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return bytes(data)
+
+def convert_image_for_pdf(data):
+    """Re-encode any PIL-readable image as an RGB JPEG that FPDF can embed directly,
+    downscaled to the resolution it is printed at"""
+    with Image.open(BytesIO(data)) as image:
+        image.draft("RGB", PDF_IMAGE_MAX_PX)  # cheap JPEG downscale while decoding
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail(PDF_IMAGE_MAX_PX, Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format="JPEG", quality=90)
+        return {"data": output.getvalue(), "width": image.width, "height": image.height}
+
+def is_permanent_download_failure(exception):
+    """True for a 4xx answer (other than timeouts and rate limits), which retrying will not fix;
+    timeouts, connection errors and 5xx responses are worth trying again"""
+    response = getattr(exception, "response", None)
+    if not isinstance(exception, requests.exceptions.HTTPError) or response is None:
+        return False
+    return 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+
+def fetch_image_for_pdf(image_url):
+    """Download and normalize one image, recording the outcome in the image cache.
+
+    Only permanent failures (4xx responses, oversized or undecodable images)
+    are cached, so a transient network error does not hide an image.
+    """
+    try:
+        image = convert_image_for_pdf(download_image(image_url))
+    except requests.exceptions.RequestException as e:
+        if is_permanent_download_failure(e):
+            image_cache.cache_failure(image_url, f"[Image download failed: {str(e)}]")
+        raise
+    except Exception as e:
+        image_cache.cache_failure(image_url, f"[Image processing failed: {str(e)}]")
+        raise
+    image_cache.cache_image(image_url, image)
+    return image
+
+def prefetch_images(image_urls, deadline=IMAGE_FETCH_DEADLINE):
+    """Download and convert all images concurrently.
+
+    Returns {url: {"data", "width", "height"}} or {url: {"error": message}}.
+    Cached images and recently failed URLs are answered from the image cache.
+    Images that are not ready when the overall deadline expires are reported
+    as failed instead of delaying the whole document; their downloads keep
+    running in the background and fill the cache for the next run.
+    """
+    results = {}
+    unique_urls = []
+    for url in dict.fromkeys(image_urls):
+        cached = image_cache.get_cached_image(url)
+        metrics.CACHE_LOOKUPS.inc(cache="image", result="miss" if cached is None else "hit")
+        if cached is not None:
+            results[url] = cached
+        else:
+            unique_urls.append(url)
+    if not unique_urls:
+        return results
+    executor = ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_WORKERS, len(unique_urls)))
+    futures = {executor.submit(fetch_image_for_pdf, url): url for url in unique_urls}
+    done, not_done = wait(futures, timeout=deadline)
+    for future in done:
+        url = futures[future]
+        try:
+            results[url] = future.result()
+        except requests.exceptions.RequestException as e:
+            results[url] = {"error": f"[Image download failed: {str(e)}]"}
+        except Exception as e:
+            results[url] = {"error": f"[Image processing failed: {str(e)}]"}
+    for future in not_done:
+        future.cancel()
+        results[futures[future]] = {"error": f"[Image download failed: not received within {deadline}s]"}
+    executor.shutdown(wait=False)
+    print(f"Prefetched {len(unique_urls) - len(not_done)}/{len(unique_urls)} images ({len(results) - len(unique_urls)} from cache)")
+    return results
+
+class AssessmentPDF(FPDF):
+    """FPDF document that embeds images from memory instead of file paths"""
+
+    def add_memory_image(self, name, image):
+        # Same info dict FPDF builds when it parses a JPEG file; once registered,
+        # pdf.image(name, ...) uses it without touching the filesystem.
+        if name not in self.images:
+            self.images[name] = {
+                'w': image["width"], 'h': image["height"], 'cs': 'DeviceRGB', 'bpc': 8,
+                'f': 'DCTDecode', 'data': image["data"], 'i': len(self.images) + 1
+            }
+
+def render_image(pdf, image_url, images):
+    problem = image_url_problem(image_url)
+    if problem:
+        print(f"Skipping image {image_url}: {problem}")
+        pdf.cell(0, 8, clean_text_for_pdf(problem), ln=True)
+        return
+    image = images.get(image_url) or {"error": "[Image download failed: not fetched]"}
+    if "error" in image:
+        pdf.cell(0, 8, clean_text_for_pdf(image["error"]), ln=True)
+        return
+    pdf.add_memory_image(image_url, image)
+    pdf.ln(2)  # Add some space before image
+    pdf.image(image_url, w=150, h=100, type="jpg")  # Better default size
+    pdf.ln(2)  # Add some space after image
+
+def render_question(pdf, i, question):
+    question_text = clean_text_for_pdf(question.get('q', ''))
+    if not question_text.strip():
+        question_text = f"[Question {i} - No content provided]"
+    pdf.multi_cell(0, 8, f"{i}. {question_text}")
+
+def render_answer(pdf, i, answer):
+    question_text = clean_text_for_pdf(answer.get('question', ''))
+    if not question_text.strip():
+        question_text = f"[Question {i} - No content provided]"
+    pdf.multi_cell(0, 8, f"{i}. {question_text}")
+    answer_text = clean_text_for_pdf(answer.get('answer', ''))
+    if not answer_text.strip():
+        answer_text = f"[Answer {i} - No content provided]"
+    pdf.multi_cell(0, 8, f"Answer: {answer_text}")
+
+def render_assessment_pdf(title, sections, items_key, render_item,
+                          course_code=None, course_name=None, module_number=None,
+                          dep=None, include_images=False):
+    """Shared layout for question banks and answer keys.
+
+    items_key is the per-section list ("questions" / "answers") and
+    render_item(pdf, number, item) writes one entry. All image_ref images are
+    prefetched in parallel before layout starts.
+    """
+    images = {}
+    if include_images:
+        image_urls = [item.get("image_ref", "").strip()
+                      for section in sections for item in section.get(items_key, [])
+                      if item.get("image_ref")]
+        images = prefetch_images([url for url in image_urls if not image_url_problem(url)])
+
+    pdf = AssessmentPDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
     
-    # Remove any remaining non-ASCII characters that might cause issues
-    text = re.sub(r'[^\x00-\x7F]+', '?', text)
+    # Header
+    pdf.set_font("Arial", "B", 14)
+    if dep:
+        pdf.cell(0, 10, clean_text_for_pdf(f"Department of {dep}"), ln=True, align="C")
+    if course_code and course_name:
+        pdf.cell(0, 10, clean_text_for_pdf(f"{course_code} - {course_name}"), ln=True, align="C")
+    if module_number:
+        pdf.cell(0, 10, clean_text_for_pdf(f"Module {module_number} {title}"), ln=True, align="C")
+    pdf.ln(10)
     
-    return text
+    # Loop through sections
+    for section in sections:
+        part_label = section.get("part_label", "")
+        marks = section.get("marks", 0)
+        
+        # Section Header
+        pdf.set_font("Arial", "B", 12)
+        pdf.cell(0, 10, clean_text_for_pdf(f"Part - {part_label} ({marks} marks)"), ln=True)
+        pdf.set_font("Arial", "", 11)
+        
+        for i, item in enumerate(section.get(items_key, []), 1):
+            render_item(pdf, i, item)
+            # Include image if required
+            if include_images and item.get("image_ref"):
+                render_image(pdf, item.get("image_ref", "").strip(), images)
+        
+        pdf.ln(5)
+    return pdf
+
+ASSESSMENT_KINDS = {
+    "question_bank": {"title": "Question Bank", "items_key": "questions", "render_item": render_question, "file_suffix": "QuestionBank"},
+    "answer_key": {"title": "Answer Key", "items_key": "answers", "render_item": render_answer, "file_suffix": "AnswerKey"},
+}
+
+def build_assessment_pdf(kind, course_code, course_name, module_number, sections, include_images, dep):
+    """Render a question bank or answer key in memory; returns (pdf_bytes, drive_file_name)"""
+    spec = ASSESSMENT_KINDS[kind]
+    pdf = render_assessment_pdf(spec["title"], sections, spec["items_key"], spec["render_item"],
+                                course_code, course_name, module_number, dep, include_images)
+    # Nothing touches the local filesystem, so names only need to be readable in Drive
+    pdf_filename = f"{spec['file_suffix']}_{uuid.uuid4().hex[:8]}.pdf"
+    if course_code and course_name and module_number:
+        pdf_filename = f"{course_code}_Module{module_number}_{spec['file_suffix']}.pdf"
+    # fpdf 1.7 returns the document as a latin-1 str
+    return pdf.output(dest="S").encode("latin-1"), pdf_filename
+
 def question_bank_generator(course_code: str = None,
     course_name: str = None,
     module_number: int = None,
@@ -89,112 +316,8 @@ def question_bank_generator(course_code: str = None,
         service = get_drive_service(user_id)
         if isinstance(service, dict) and "error" in service:
             return service
-        pdf = FPDF()
-        pdf_filename = str(uuid.uuid4())
-        if course_code and course_name and module_number:
-            pdf_filename = f"{course_code}_Module{module_number}_QuestionBank.pdf"
-        pdf_path = f"/tmp/{pdf_filename}.pdf"
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        
-        # Header
-        pdf.set_font("Arial", "B", 14)
-        if dep:
-            pdf.cell(0, 10, clean_text_for_pdf(f"Department of {dep}"), ln=True, align="C")
-        if course_code and course_name:
-            pdf.cell(0, 10, clean_text_for_pdf(f"{course_code} - {course_name}"), ln=True, align="C")
-        if module_number:
-            pdf.cell(0, 10, clean_text_for_pdf(f"Module {module_number} Question Bank"), ln=True, align="C")
-        pdf.ln(10)
-        
-        # Loop through sections
-        for section in sections:
-            part_label = section.get("part_label", "")
-            marks = section.get("marks", 0)
-            questions = section.get("questions", [])
-            
-            # Section Header
-            pdf.set_font("Arial", "B", 12)
-            pdf.cell(0, 10, clean_text_for_pdf(f"Part - {part_label} ({marks} marks)"), ln=True)
-            pdf.set_font("Arial", "", 11)
-            
-            # Loop through questions
-            for i, question in enumerate(questions, 1):
-                question_text = clean_text_for_pdf(question.get('q', ''))
-                if not question_text.strip():
-                    question_text = f"[Question {i} - No content provided]"
-                pdf.multi_cell(0, 8, f"{i}. {question_text}")
-                
-                # Include image if required
-                if include_images and question.get("image_ref"):
-                    image_url = question.get("image_ref", "").strip()
-                    print(f"Processing image for question {i}: {image_url}")
-                    
-                    # Check for common fake/example URLs
-                    fake_domains = ['example.com', 'example.org', 'placeholder.com', 'via.placeholder.com', 'dummyimage.com']
-                    is_fake_url = any(domain in image_url.lower() for domain in fake_domains)
-                    
-                    if is_fake_url:
-                        print(f"Skipping fake URL: {image_url}")
-                        error_text = clean_text_for_pdf(f"[Note: Image reference appears to be a placeholder URL and was skipped]")
-                        pdf.cell(0, 8, error_text, ln=True)
-                    elif image_url and image_url.startswith(('http://', 'https://')):
-                        try:
-                            # Download image with proper headers
-                            headers = {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                            }
-                            response = requests.get(image_url, headers=headers, timeout=10)
-                            response.raise_for_status()
-                            
-                            # Determine file extension from content type or URL
-                            content_type = response.headers.get('content-type', '').lower()
-                            if 'jpeg' in content_type or 'jpg' in content_type:
-                                ext = '.jpg'
-                            elif 'png' in content_type:
-                                ext = '.png'
-                            elif 'gif' in content_type:
-                                ext = '.gif'
-                            else:
-                                # Try to determine from URL
-                                if image_url.lower().endswith(('.jpg', '.jpeg')):
-                                    ext = '.jpg'
-                                elif image_url.lower().endswith('.png'):
-                                    ext = '.png'
-                                elif image_url.lower().endswith('.gif'):
-                                    ext = '.gif'
-                                else:
-                                    ext = '.jpg'  # Default fallback
-                            
-                            # Save to temporary file
-                            temp_image_path = f"/tmp/temp_image_{i}_{part_label}{ext}"
-                            with open(temp_image_path, "wb") as f:
-                                f.write(response.content)
-                            
-                            # Add image to PDF with better sizing
-                            pdf.ln(2)  # Add some space before image
-                            pdf.image(temp_image_path, w=150, h=100)  # Better default size
-                            pdf.ln(2)  # Add some space after image
-                            
-                            print(f"Successfully added image for question {i}")
-                            
-                            # Clean up temporary file
-                            os.remove(temp_image_path)
-                            
-                        except requests.exceptions.RequestException as e:
-                            error_text = clean_text_for_pdf(f"[Image download failed: {str(e)}]")
-                            pdf.cell(0, 8, error_text, ln=True)
-                        except Exception as e:
-                            error_text = clean_text_for_pdf(f"[Image processing failed: {str(e)}]")
-                            pdf.cell(0, 8, error_text, ln=True)
-                    else:
-                        # Invalid URL format
-                        error_text = clean_text_for_pdf(f"[Invalid image URL: {image_url}]")
-                        pdf.cell(0, 8, error_text, ln=True)
-            
-            pdf.ln(5)
-        pdf.output(pdf_path)
-        upload_result = upload_local_file_to_drive(pdf_path, user_id, "application/pdf")
+        pdf_bytes, pdf_filename = build_assessment_pdf("question_bank", course_code, course_name, module_number, sections, include_images, dep)
+        upload_result = upload_bytes_to_drive(pdf_bytes, pdf_filename, user_id, "application/pdf")
         if isinstance(upload_result, dict) and "error" in upload_result:
             return upload_result
         return {
@@ -270,116 +393,8 @@ def answer_key_generator(course_code: str = None,
         service = get_drive_service(user_id)
         if isinstance(service, dict) and "error" in service:
             return service
-        pdf = FPDF()
-        pdf_filename = str(uuid.uuid4())
-        if course_code and course_name and module_number:
-            pdf_filename = f"{course_code}_Module{module_number}_AnswerKey.pdf"
-        pdf_path = f"/tmp/{pdf_filename}.pdf"
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        
-        # Header
-        pdf.set_font("Arial", "B", 14)
-        if dep:
-            pdf.cell(0, 10, clean_text_for_pdf(f"Department of {dep}"), ln=True, align="C")
-        if course_code and course_name:
-            pdf.cell(0, 10, clean_text_for_pdf(f"{course_code} - {course_name}"), ln=True, align="C")
-        if module_number:
-            pdf.cell(0, 10, clean_text_for_pdf(f"Module {module_number} Answer Key"), ln=True, align="C")
-        pdf.ln(10)
-        
-        # Loop through sections
-        for section in sections:
-            part_label = section.get("part_label", "")
-            marks = section.get("marks", 0)
-            answers = section.get("answers", [])
-            
-            # Section Header
-            pdf.set_font("Arial", "B", 12)
-            pdf.cell(0, 10, clean_text_for_pdf(f"Part - {part_label} ({marks} marks)"), ln=True)
-            pdf.set_font("Arial", "", 11)
-            
-            # Loop through questions
-            for i, answer in enumerate(answers, 1):
-                question_text = clean_text_for_pdf(answer.get('question', ''))
-                if not question_text.strip():
-                    question_text = f"[Question {i} - No content provided]"
-                pdf.multi_cell(0, 8, f"{i}. {question_text}")
-                answer_text = clean_text_for_pdf(answer.get('answer', ''))
-                if not answer_text.strip():
-                    answer_text = f"[Answer {i} - No content provided]"
-                pdf.multi_cell(0, 8, f"Answer: {answer_text}")
-                
-                # Include image if required
-                if include_images and answer.get("image_ref"):
-                    image_url = answer.get("image_ref", "").strip()
-                    print(f"Processing image for question {i}: {image_url}")
-                    
-                    # Check for common fake/example URLs
-                    fake_domains = ['example.com', 'example.org', 'placeholder.com', 'via.placeholder.com', 'dummyimage.com']
-                    is_fake_url = any(domain in image_url.lower() for domain in fake_domains)
-                    
-                    if is_fake_url:
-                        print(f"Skipping fake URL: {image_url}")
-                        error_text = clean_text_for_pdf(f"[Note: Image reference appears to be a placeholder URL and was skipped]")
-                        pdf.cell(0, 8, error_text, ln=True)
-                    elif image_url and image_url.startswith(('http://', 'https://')):
-                        try:
-                            # Download image with proper headers
-                            headers = {
-                                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                            }
-                            response = requests.get(image_url, headers=headers, timeout=10)
-                            response.raise_for_status()
-                            
-                            # Determine file extension from content type or URL
-                            content_type = response.headers.get('content-type', '').lower()
-                            if 'jpeg' in content_type or 'jpg' in content_type:
-                                ext = '.jpg'
-                            elif 'png' in content_type:
-                                ext = '.png'
-                            elif 'gif' in content_type:
-                                ext = '.gif'
-                            else:
-                                # Try to determine from URL
-                                if image_url.lower().endswith(('.jpg', '.jpeg')):
-                                    ext = '.jpg'
-                                elif image_url.lower().endswith('.png'):
-                                    ext = '.png'
-                                elif image_url.lower().endswith('.gif'):
-                                    ext = '.gif'
-                                else:
-                                    ext = '.jpg'  # Default fallback
-                            
-                            # Save to temporary file
-                            temp_image_path = f"/tmp/temp_image_{i}_{part_label}{ext}"
-                            with open(temp_image_path, "wb") as f:
-                                f.write(response.content)
-                            
-                            # Add image to PDF with better sizing
-                            pdf.ln(2)  # Add some space before image
-                            pdf.image(temp_image_path, w=150, h=100)  # Better default size
-                            pdf.ln(2)  # Add some space after image
-                            
-                            print(f"Successfully added image for answer {i}")
-                            
-                            # Clean up temporary file
-                            os.remove(temp_image_path)
-                            
-                        except requests.exceptions.RequestException as e:
-                            error_text = clean_text_for_pdf(f"[Image download failed: {str(e)}]")
-                            pdf.cell(0, 8, error_text, ln=True)
-                        except Exception as e:
-                            error_text = clean_text_for_pdf(f"[Image processing failed: {str(e)}]")
-                            pdf.cell(0, 8, error_text, ln=True)
-                    else:
-                        # Invalid URL format
-                        error_text = clean_text_for_pdf(f"[Invalid image URL: {image_url}]")
-                        pdf.cell(0, 8, error_text, ln=True)
-            
-            pdf.ln(5)
-        pdf.output(pdf_path)
-        upload_result = upload_local_file_to_drive(pdf_path, user_id, "application/pdf")
+        pdf_bytes, pdf_filename = build_assessment_pdf("answer_key", course_code, course_name, module_number, sections, include_images, dep)
+        upload_result = upload_bytes_to_drive(pdf_bytes, pdf_filename, user_id, "application/pdf")
         if isinstance(upload_result, dict) and "error" in upload_result:
             return upload_result
         return {
@@ -390,5 +405,75 @@ def answer_key_generator(course_code: str = None,
         }
     except Exception as e:
         return {"error": f"Failed to generate answer key: {str(e)}"}
+
+def _generate_pack_module(service, creds, course_code, course_name, module, include_images, dep):
+    """Render and upload one module of a course pack; runs in a worker thread"""
+    kind = module.get("kind", "question_bank")
+    result = {"module_number": module.get("module_number"), "kind": kind}
+    try:
+        if kind not in ASSESSMENT_KINDS:
+            return dict(result, error=f"Unknown kind '{kind}', expected one of {list(ASSESSMENT_KINDS)}")
+        if not module.get("sections"):
+            return dict(result, error="No sections provided")
+        pdf_bytes, pdf_filename = build_assessment_pdf(kind, course_code, course_name, module.get("module_number"),
+                                                       module["sections"], include_images, dep)
+        uploaded = upload_bytes_with_service(service, pdf_bytes, pdf_filename, "application/pdf", http=new_authorized_http(creds))
+        return dict(result, file_id=uploaded.get("id"), webViewLink=uploaded.get("webViewLink"))
+    except Exception as e:
+        return dict(result, error=f"Failed to generate module: {str(e)}")
+
+def assessment_pack_generator(course_code: str = None,
+    course_name: str = None,
+    modules: list = None,  # [{"module_number": 1, "kind": "question_bank", "sections": [...]}]
+    include_images: bool = False,
+    dep: str = None,
+    user_id: str = None):
+    """
+    Generate question banks and/or answer keys for many modules at once and upload them to Google Drive.
+    
+    Modules are rendered and uploaded concurrently, sharing one set of Drive
+    credentials; sharing permissions are then set with batched requests.
+    
+    Args:
+        course_code: Course code (e.g., "CS101")
+        course_name: Course name (e.g., "Introduction to Computer Science")
+        modules: List of modules, each with module_number, kind ("question_bank" or
+            "answer_key") and sections in the format of the matching single generator
+        include_images: Whether to include images in the PDFs
+        dep: Department name
+        user_id: User ID for authentication
     
-    
\ No newline at end of file
+    Returns:
+        dict: A dictionary containing:
+            - "success": bool
+            - "message": str
+            - "files": list of {"module_number", "kind", "file_id", "webViewLink"} or {"module_number", "kind", "error"}
+    """
+    try:
+        if not modules:
+            return {"error": "No modules provided"}
+        creds = get_drive_credentials(user_id)
+        if isinstance(creds, dict) and "error" in creds:
+            return creds
+        service = build('drive', 'v3', credentials=creds)
+        
+        with ThreadPoolExecutor(max_workers=min(BATCH_GENERATION_WORKERS, len(modules))) as executor:
+            results = list(executor.map(
+                lambda module: _generate_pack_module(service, creds, course_code, course_name, module, include_images, dep),
+                modules))
+        
+        uploaded_ids = [result["file_id"] for result in results if result.get("file_id")]
+        if uploaded_ids:
+            share_errors = share_files_publicly(service, uploaded_ids)
+            for result in results:
+                if result.get("file_id") in share_errors:
+                    result["warning"] = f"Uploaded but could not be shared: {share_errors[result['file_id']]}"
+        
+        failed = sum(1 for result in results if "error" in result)
+        return {
+            "success": failed < len(results),
+            "message": f"Generated {len(results) - failed} of {len(results)} documents",
+            "files": results
+        }
+    except Exception as e:
+        return {"error": f"Failed to generate assessment pack: {str(e)}"}
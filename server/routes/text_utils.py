@@ -0,0 +1,132 @@
+"""
+Text sanitizing and markdown/LaTeX detection shared by pdf_service and email_service.
+
+All patterns are compiled once at import time. The PDF sanitizer returns
+ASCII strings untouched and otherwise scans each string once, only doing
+per-character work on runs of non-ASCII characters.
+"""
+import re
+
+# Unicode punctuation FPDF's latin-1 core fonts cannot draw, mapped to ASCII
+_PDF_REPLACEMENTS = {
+    '\u2013': '-',  # en-dash
+    '\u2014': '--', # em-dash
+    '\u2018': "'",  # left single quotation mark
+    '\u2019': "'",  # right single quotation mark
+    '\u201c': '"',  # left double quotation mark
+    '\u201d': '"',  # right double quotation mark
+    '\u2026': '...', # horizontal ellipsis
+    '\u00a0': ' ',  # non-breaking space
+}
+_NON_ASCII_RE = re.compile(r'[^\x00-\x7F]+')
+
+_MATRIX_RE = re.compile(r'\\begin\{pmatrix\}(.*?)\\end\{pmatrix\}', re.DOTALL)
+_DISPLAY_MATH_RE = re.compile(r'\$\$(.*?)\$\$', re.DOTALL)
+_INLINE_MATH_RE = re.compile(r'\$(.*?)\$', re.DOTALL)
+# Applied in order, like the replacements they were written as
+_LATEX_COMMAND_RULES = [(re.compile(pattern), replacement) for pattern, replacement in [
+    (r'\\begin\{.*?\}', ''),
+    (r'\\end\{.*?\}', ''),
+    (r'\\\\', '<br>'),
+    (r'\\&', '&'),
+    (r'\\%', '%'),
+    (r'\\#', '#'),
+    (r'\\_', '_'),
+    (r'\\{', '{'),
+    (r'\\}', '}'),
+]]
+
+_MARKDOWN_PATTERNS = [re.compile(pattern, re.MULTILINE | re.DOTALL) for pattern in [
+    r'^#{1,6}\s+',  # Headers
+    r'\*\*.*?\*\*',  # Bold
+    r'\*.*?\*',      # Italic
+    r'`.*?`',        # Inline code
+    r'```.*?```',    # Code blocks
+    r'^\s*[-*+]\s+', # Lists
+    r'^\s*\d+\.\s+', # Numbered lists
+    r'^\s*>\s+',     # Blockquotes
+    r'\[.*?\]\(.*?\)', # Links
+    r'^\|.*\|$',     # Tables
+    # LaTeX patterns
+    r'\$\$.*?\$\$',  # LaTeX display math
+    r'\$.*?\$',      # LaTeX inline math
+    r'\\begin\{.*?\}', # LaTeX environments
+    r'\\end\{.*?\}',   # LaTeX environments
+    r'\\[a-zA-Z]+\{.*?\}', # LaTeX commands
+]]
+
+# Applied in order; later patterns see the output of earlier ones
+_PLAIN_TEXT_RULES = [
+    (re.compile(r'#{1,6}\s+'), ''),  # Remove headers
+    (re.compile(r'\*\*(.*?)\*\*'), r'\1'),  # Remove bold
+    (re.compile(r'\*(.*?)\*'), r'\1'),  # Remove italic
+    (re.compile(r'`(.*?)`'), r'\1'),  # Remove inline code
+    (re.compile(r'```.*?```', re.DOTALL), ''),  # Remove code blocks
+    (re.compile(r'^\s*[-*+]\s+', re.MULTILINE), '- '),  # Convert lists
+    (re.compile(r'^\s*\d+\.\s+', re.MULTILINE), '1. '),  # Convert numbered lists
+    (re.compile(r'^\s*>\s+', re.MULTILINE), ''),  # Remove blockquotes
+    (re.compile(r'\[(.*?)\]\(.*?\)'), r'\1'),  # Remove link formatting
+]
+
+
+def clean_text_for_pdf(text):
+    """Clean text to remove or replace Unicode characters that cause encoding issues"""
+    if not text:
+        return ""
+    if text.isascii():
+        return text
+    return _NON_ASCII_RE.sub(_replace_non_ascii, text)
+
+
+def _replace_non_ascii(match):
+    # Replace common Unicode characters with ASCII equivalents and collapse
+    # every other run of non-ASCII characters into a single '?'
+    run = match.group(0)
+    if len(run) == 1:
+        return _PDF_REPLACEMENTS.get(run, '?')
+    parts = []
+    in_unknown = False
+    for char in run:
+        replacement = _PDF_REPLACEMENTS.get(char)
+        if replacement is not None:
+            parts.append(replacement)
+            in_unknown = False
+        elif not in_unknown:
+            parts.append('?')
+            in_unknown = True
+    return ''.join(parts)
+
+
+def _replace_matrix(match):
+    # Split by \\ to get rows, and each row by & to get cells
+    rows = [row.strip() for row in match.group(1).split('\\\\') if row.strip()]
+    html_rows = []
+    for row in rows:
+        html_cells = ''.join(f'<td>{cell.strip()}</td>' for cell in row.split('&'))
+        html_rows.append(f'<tr>{html_cells}</tr>')
+    return f'<table class="matrix-table"><tbody>{"".join(html_rows)}</tbody></table>'
+
+
+def preprocess_latex(text):
+    """Pre-process LaTeX syntax to make it email-friendly"""
+    # Handle LaTeX matrices - convert to HTML tables
+    text = _MATRIX_RE.sub(_replace_matrix, text)
+    # Remove $$ and then single $ delimiters
+    text = _DISPLAY_MATH_RE.sub(r'\1', text)
+    text = _INLINE_MATH_RE.sub(r'\1', text)
+    # Handle LaTeX commands - convert common ones to readable text
+    for pattern, replacement in _LATEX_COMMAND_RULES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def is_markdown_content(text):
+    """Check if the text contains markdown formatting or LaTeX syntax"""
+    return any(pattern.search(text) for pattern in _MARKDOWN_PATTERNS)
+
+
+def strip_markdown(text):
+    """Plain-text version of a markdown message for the text/plain email part"""
+    for pattern, replacement in _PLAIN_TEXT_RULES:
+        text = pattern.sub(replacement, text)
+    return text
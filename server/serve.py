@@ -0,0 +1,144 @@
+"""
+Preforking multi-worker server.
+
+    python serve.py [--workers 4] [--host 127.0.0.1] [--port 5001]
+
+The parent process imports the app, loads the embedding model, the general
+FAISS index and the folder indexes, then forks worker processes that all
+accept connections from one shared listening socket. Model weights and
+index memory loaded before the fork are shared copy-on-write (folder stores
+are memory-mapped, so their pages are shared through the page cache anyway).
+
+Writers stay correct across workers: index updates take a per-index file
+lock (rag_utils.file_lock), and readers re-read an index another worker
+has rewritten. The parent restarts workers that exit unexpectedly.
+"""
+import os
+import gc
+import sys
+import glob
+import time
+import signal
+import argparse
+import tempfile
+from werkzeug.serving import make_server
+
+import app as app_module
+from rag_utils import models
+from rag_utils import vector_store
+from rag_utils import lexical_index
+from routes.file_service import VECTOR_DB_DIR, FOLDER_EMBED_MODEL_NAME
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+PRELOAD_FOLDER_INDEXES = os.getenv("PRELOAD_FOLDER_INDEXES", "true").lower() == "true"
+RESPAWN_DELAY = 1.0
+
+
+def preload():
+    """Load everything workers share before forking"""
+    start = time.perf_counter()
+    doc_search = app_module.doc_search
+    # Weights only: running inference here would start thread pools that do not survive fork.
+    # An ONNX Runtime session starts its thread pool on creation, so each worker loads its own;
+    # the export itself must already exist, so workers never race to create it.
+    if models.EMBED_BACKEND != "onnx":
+        models.get_embedder(doc_search.EMBED_MODEL_NAME)
+    else:
+        from rag_utils import onnx_embedder
+        for model_name in {doc_search.EMBED_MODEL_NAME or models.DEFAULT_EMBED_MODEL, FOLDER_EMBED_MODEL_NAME}:
+            onnx_embedder.require_export(model_name)
+    doc_search.load_index()
+    folders = 0
+    if PRELOAD_FOLDER_INDEXES:
+        for records_path in glob.glob(os.path.join(VECTOR_DB_DIR, "*.rec")):
+            prefix = records_path[:-len(".rec")]
+            vector_store.open_store(prefix).ntotal
+            lexical_index.load_index(prefix + ".lex.jsonl")
+            folders += 1
+    print(f"Preloaded embedder, general index and {folders} folder indexes in {time.perf_counter() - start:.1f}s")
+
+
+def init_worker(workers):
+    """Per-worker setup after fork"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        # Split the cores between workers instead of every worker using all of them
+        torch.set_num_threads(int(os.getenv("EMBED_THREADS", max(1, (os.cpu_count() or 1) // workers))))
+
+
+def spawn_worker(server, workers):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        init_worker(workers)
+        server.serve_forever()
+    finally:
+        os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="worker processes (default: WEB_WORKERS or CPU count)")
+    parser.add_argument("--host", default=os.getenv("FLASK_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("FLASK_PORT", "5001")))
+    args = parser.parse_args()
+
+    secret_key = os.getenv("FLASK_SECRET_KEY")
+    if not secret_key:
+        raise ValueError("FLASK_SECRET_KEY environment variable is required. Set it in your .env file.")
+    app = app_module.app
+    app.secret_key = secret_key
+
+    # Workers publish metric snapshots here so /metrics reports all of them, not just the one scraped
+    if args.workers > 1:
+        os.environ.setdefault("METRICS_DIR", tempfile.mkdtemp(prefix="rag_metrics_"))
+
+    preload()
+    # Bind once in the parent; every worker accepts on the inherited socket
+    server = make_server(args.host, args.port, app, threaded=True)
+    # Preloaded objects never need collecting; freezing them keeps the workers'
+    # garbage collector from writing to (and so copying) their pages
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(args.workers):
+        workers.add(spawn_worker(server, args.workers))
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers (parent pid {os.getpid()})")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if stopping:
+            continue
+        print(f"Worker {pid} exited with status {status}, restarting")
+        time.sleep(RESPAWN_DELAY)
+        if not stopping:
+            workers.add(spawn_worker(server, args.workers))
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()